@@ -0,0 +1,272 @@
+"""Spreading switchers over several local Bluetooth adapters.
+
+One adapter can only hold a handful of links and connects to one device
+at a time, so with many switchers it becomes the bottleneck. A
+MultiAdapterTransport wraps one transport per adapter (BleakTransport with
+adapter="hci1", or fakes in tests) behind the same find_device()/client()
+interface SwitcherSession uses:
+
+- find_device() scans on every adapter at once and, once one of them hears
+  the switcher, briefly waits for the others before picking;
+- a switcher goes to the adapter that heard it with the best recent RSSI
+  among those with a free link slot;
+- each adapter has its own limits: links (max_connections), connects in
+  flight (max_connecting) and scans (max_scans);
+- stats() reports links, scans, connects and failures per adapter.
+
+Adapters are found in /sys/class/bluetooth (BlueZ) or listed in
+config.json as "adapters": ["hci0", "hci1"]. Other platforms only expose
+the default adapter, so ble_transport() then returns a plain BleakTransport.
+"""
+import asyncio
+import logging
+import os
+import re
+import sys
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Links one adapter keeps open at once (cheap USB dongles manage ~5-7)
+DEFAULT_ADAPTER_CONNECTIONS = 5
+# Connects in flight per adapter; BlueZ handles one at a time anyway
+DEFAULT_ADAPTER_CONNECTING = 1
+DEFAULT_ADAPTER_SCANS = 2
+# After the first adapter hears a switcher, how long the others get to report
+RSSI_SETTLE = 0.3
+# RSSI readings older than this do not count when picking an adapter
+RSSI_TTL = 60.0
+NO_RSSI = -127
+
+
+def list_adapters() -> list:
+    """Names of the local adapters ("hci0", ...); empty where they cannot be enumerated."""
+    if not sys.platform.startswith("linux"):
+        return []
+    try:
+        names = os.listdir("/sys/class/bluetooth")
+    except OSError:
+        return []
+    # Entries like "hci0:64" are connections, not adapters
+    return sorted((n for n in names if re.fullmatch(r"hci\d+", n)), key=lambda n: int(n[3:]))
+
+
+class Adapter:
+    def __init__(self, name: str, transport, max_connections: int, max_connecting: int, max_scans: int):
+        self.name = name
+        self.transport = transport
+        self.max_connections = max(1, int(max_connections))
+        self.links = set()
+        self.connecting = asyncio.Semaphore(max(1, int(max_connecting)))
+        self.scanning = asyncio.Semaphore(max(1, int(max_scans)))
+        self.peak_links = 0
+        self.scans = 0
+        self.sightings = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.connect_time = 0.0
+
+    def has_room(self, mac: str) -> bool:
+        return mac in self.links or len(self.links) < self.max_connections
+
+    def stats(self) -> dict:
+        return {
+            "links": len(self.links),
+            "max_connections": self.max_connections,
+            "peak_links": self.peak_links,
+            "devices": sorted(self.links),
+            "scans": self.scans,
+            "sightings": self.sightings,
+            "connects": self.connects,
+            "connect_failures": self.connect_failures,
+            "connect_ms": round(self.connect_time / self.connects * 1000, 1) if self.connects else None,
+        }
+
+
+class _LinkClient:
+    """A client on a given adapter; counts its link and serializes connects per adapter."""
+
+    def __init__(self, adapter: Adapter, mac: str):
+        self._adapter = adapter
+        self._mac = mac
+        self._client = None
+
+    async def connect(self):
+        adapter = self._adapter
+        async with adapter.connecting:
+            started = time.monotonic()
+            try:
+                await self._client.connect()
+            except BaseException:
+                adapter.connect_failures += 1
+                raise
+        adapter.connects += 1
+        adapter.connect_time += time.monotonic() - started
+        adapter.links.add(self._mac)
+        adapter.peak_links = max(adapter.peak_links, len(adapter.links))
+
+    async def disconnect(self):
+        try:
+            await self._client.disconnect()
+        finally:
+            self._release()
+
+    def _release(self):
+        self._adapter.links.discard(self._mac)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class _MultiScanner:
+    def __init__(self, scanners):
+        self.scanners = scanners
+
+    async def start(self):
+        await asyncio.gather(*(s.start() for s in self.scanners))
+
+    async def stop(self):
+        await asyncio.gather(*(s.stop() for s in self.scanners), return_exceptions=True)
+
+
+class MultiAdapterTransport:
+    """Transport over several adapters; transports maps adapter name -> per-adapter transport."""
+
+    def __init__(self, transports: dict, max_connections: int = DEFAULT_ADAPTER_CONNECTIONS,
+                 max_connecting: int = DEFAULT_ADAPTER_CONNECTING, max_scans: int = DEFAULT_ADAPTER_SCANS,
+                 settle: float = RSSI_SETTLE):
+        self.adapters = [Adapter(name, t, max_connections, max_connecting, max_scans)
+                         for name, t in transports.items()]
+        self.settle = settle
+        # mac -> adapter name -> (device as that adapter knows it, rssi, monotonic time)
+        self._seen = {}
+
+    @property
+    def max_connections(self) -> int:
+        return sum(a.max_connections for a in self.adapters)
+
+    def _scanner(self, adapter: Adapter, detection_callback):
+        factory = getattr(adapter.transport, "scanner", None)
+        if factory is not None:
+            return factory(detection_callback)
+        from bleak import BleakScanner
+
+        return BleakScanner(detection_callback=detection_callback, adapter=adapter.name)
+
+    def _record(self, adapter: Adapter, device, rssi):
+        adapter.sightings += 1
+        now = time.monotonic()
+        if len(self._seen) > 256:
+            # Scans also report every other BLE device around; drop the stale ones
+            for mac in [m for m, e in self._seen.items() if all(now - t > RSSI_TTL for _, _, t in e.values())]:
+                del self._seen[mac]
+        self._seen.setdefault(device.address.upper(), {})[adapter.name] = (device, rssi, now)
+
+    def scanner(self, detection_callback=None):
+        """One scanner per adapter, all reporting to detection_callback (for discovery.stream_scan)."""
+        def for_adapter(adapter):
+            def detected(device, adv):
+                self._record(adapter, device, getattr(adv, "rssi", None))
+                if detection_callback is not None:
+                    detection_callback(device, adv)
+            adapter.scans += 1
+            return self._scanner(adapter, detected)
+        return _MultiScanner([for_adapter(a) for a in self.adapters])
+
+    def pick(self, mac: str) -> Adapter:
+        """Adapter for mac: heard it recently, has a free slot, best RSSI, fewest links."""
+        mac = mac.upper()
+        now = time.monotonic()
+        seen = {name: entry for name, entry in self._seen.get(mac, {}).items() if now - entry[2] < RSSI_TTL}
+        candidates = [a for a in self.adapters if a.name in seen] or self.adapters
+
+        def score(a):
+            rssi = seen[a.name][1] if a.name in seen and seen[a.name][1] is not None else NO_RSSI
+            return (a.has_room(mac), rssi, -len(a.links))
+        return max(candidates, key=score)
+
+    async def find_device(self, mac: str, timeout: float):
+        mac = mac.upper()
+        candidates = [a for a in self.adapters if a.has_room(mac)] or self.adapters
+        heard = asyncio.Event()
+        reported = set()
+
+        def detected_by(adapter):
+            def detected(device, adv):
+                if device.address.upper() != mac:
+                    return
+                self._record(adapter, device, getattr(adv, "rssi", None))
+                reported.add(adapter.name)
+                heard.set()
+            return detected
+
+        async def scan(adapter):
+            async with adapter.scanning:
+                adapter.scans += 1
+                scanner = self._scanner(adapter, detected_by(adapter))
+                await scanner.start()
+                try:
+                    await asyncio.wait_for(heard.wait(), timeout)
+                    # Give the other adapters a moment to report their RSSI
+                    deadline = time.monotonic() + self.settle
+                    while len(reported) < len(candidates) and time.monotonic() < deadline:
+                        await asyncio.sleep(0.02)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    await scanner.stop()
+
+        await asyncio.gather(*(scan(a) for a in candidates))
+        if not reported:
+            return None
+        adapter = self.pick(mac)
+        _LOGGER.debug("%s: heard by %s, using %s", mac, sorted(reported), adapter.name)
+        return self._seen[mac][adapter.name][0]
+
+    def client(self, device, disconnected_callback, profile=None):
+        mac = device.address.upper()
+        adapter = self.pick(mac)
+        # Connect through the adapter's own handle for the device (BlueZ keeps
+        # one per adapter); fall back to what we were given
+        entry = self._seen.get(mac, {}).get(adapter.name)
+        if entry is not None:
+            device = entry[0]
+        link = _LinkClient(adapter, mac)
+
+        def on_disconnected(_client):
+            link._release()
+            if disconnected_callback is not None:
+                disconnected_callback(link)
+
+        if profile is not None:
+            link._client = adapter.transport.client(device, on_disconnected, profile)
+        else:
+            link._client = adapter.transport.client(device, on_disconnected)
+        if not adapter.has_room(mac):
+            _LOGGER.warning("%s: every adapter is full, using %s anyway", mac, adapter.name)
+        return link
+
+    def stats(self) -> dict:
+        return {a.name: a.stats() for a in self.adapters}
+
+
+def format_adapters(stats: dict) -> str:
+    lines = [f"{'adapter':<8} {'links':>7} {'peak':>5} {'scans':>6} {'connects':>8} {'fail':>5} {'connect':>9}"]
+    for name, s in stats.items():
+        connect = f"{s['connect_ms']:.0f}ms" if s["connect_ms"] is not None else "-"
+        lines.append(f"{name:<8} {s['links']:>3}/{s['max_connections']:<3} {s['peak_links']:>5} {s['scans']:>6} "
+                     f"{s['connects']:>8} {s['connect_failures']:>5} {connect:>9}")
+    return "\n".join(lines)
+
+
+def ble_transport(config: dict):
+    """BleakTransport, or a MultiAdapterTransport when several adapters are available."""
+    from connection_pool import BleakTransport
+
+    names = config.get("adapters") or list_adapters()
+    if len(names) < 2:
+        return BleakTransport(adapter=names[0] if config.get("adapters") else None)
+    _LOGGER.info("Using Bluetooth adapters %s", ", ".join(names))
+    return MultiAdapterTransport(
+        {name: BleakTransport(adapter=name) for name in names},
+        max_connections=int(config.get("adapter_connections", DEFAULT_ADAPTER_CONNECTIONS)))
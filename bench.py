@@ -0,0 +1,195 @@
+"""Headless latency benchmark on the simulated switcher transport.
+
+    python -m bench                         # REALISTIC link profile at 1/10 speed
+    python -m bench --presses 200 --burst 20 --json
+
+Compares three ways of driving one switcher:
+
+    per-press  a fresh scan + connect + disconnect for every press (what
+               pyswitcherio.IOSwitcher does), presses serialized like the
+               old GUI that disabled its buttons
+    pooled     one warm SwitcherSession, presses serialized on its lock
+    queued     ConnectionPool.send, i.e. the per-device queue with coalescing
+
+For each mode it reports press-to-ack latency percentiles for presses sent
+one after another, and throughput/latency when presses arrive in bursts.
+It also reports scan time-to-first-result for the streaming scanner. All
+times are in model seconds (wall time divided by --time-scale).
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+
+from connection_pool import ConnectionPool, SwitcherSession
+from discovery import DEFAULT_SCAN_TIMEOUT, DeviceCache, stream_scan
+from fake_transport import FakeTransport, LinkProfile, REALISTIC
+from retry_policy import RetryPolicy
+
+BENCH_MAC = "AA:BB:CC:DD:EE:01"
+MODES = ("per-press", "pooled", "queued")
+PROFILES = {"realistic": REALISTIC, "ideal": LinkProfile()}
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies, scale: float) -> dict:
+    model = [v / scale for v in latencies]
+    return {
+        "n": len(model),
+        "p50": percentile(model, 50),
+        "p95": percentile(model, 95),
+        "p99": percentile(model, 99),
+        "mean": sum(model) / len(model) if model else 0.0,
+    }
+
+
+class Driver:
+    """Submits presses in one mode; submit() resolves to a CommandResult."""
+
+    def __init__(self, mode: str, transport: FakeTransport):
+        self.mode = mode
+        self.transport = transport
+        # pyswitcherio's fixed 1s pause between attempts, in model time
+        self.retry = RetryPolicy(retries=5, base_delay=1.0 * transport.time_scale, multiplier=1.0, jitter=0.0,
+                                 breaker_threshold=0)
+        if mode == "per-press":
+            self._lock = asyncio.Lock()
+        else:
+            self.pool = ConnectionPool(transport=transport, retry=self.retry)
+            self.session = self.pool.session(BENCH_MAC)
+
+    async def submit(self, channel: int, action: str):
+        if self.mode == "per-press":
+            async with self._lock:
+                session = SwitcherSession(BENCH_MAC, transport=self.transport, retry=self.retry)
+                try:
+                    return await session.send(channel, action)
+                finally:
+                    await session.close()
+        if self.mode == "pooled":
+            return await self.session.send(channel, action)
+        return await self.pool.send(BENCH_MAC, channel, action)
+
+    async def close(self):
+        if self.mode != "per-press":
+            await self.pool.close()
+
+
+async def _timed(driver, channel, action, latencies, failures):
+    start = time.perf_counter()
+    result = await driver.submit(channel, action)
+    latencies.append(time.perf_counter() - start)
+    if not result.ok:
+        failures.append(result)
+
+
+async def bench_mode(mode: str, presses: int, burst: int, profile: LinkProfile,
+                     time_scale: float, seed: int) -> dict:
+    transport = FakeTransport([BENCH_MAC], profile=profile, time_scale=time_scale, seed=seed)
+    driver = Driver(mode, transport)
+    try:
+        # Presses one after another (a person clicking)
+        seq, seq_fail = [], []
+        for i in range(presses):
+            await _timed(driver, 1, "on" if i % 2 == 0 else "off", seq, seq_fail)
+        writes_before = transport.writes
+
+        # Bursts (widgets/hotkeys/scripts firing several presses at once)
+        bur, bur_fail = [], []
+        start = time.perf_counter()
+        for b in range(0, presses, burst):
+            n = min(burst, presses - b)
+            await asyncio.gather(*(_timed(driver, 1 + (i % 2), "on" if i % 3 else "off", bur, bur_fail)
+                                   for i in range(n)))
+        elapsed = (time.perf_counter() - start) / time_scale
+    finally:
+        await driver.close()
+    return {
+        "sequential": {**summarize(seq, time_scale), "failures": len(seq_fail)},
+        "burst": {
+            **summarize(bur, time_scale),
+            "failures": len(bur_fail),
+            "throughput": presses / elapsed if elapsed else 0.0,
+            "writes": transport.writes - writes_before,
+        },
+        "connects": transport.connects,
+        "drops": transport.drops,
+    }
+
+
+async def bench_scan(runs: int, profile: LinkProfile, time_scale: float, seed: int) -> dict:
+    transport = FakeTransport([BENCH_MAC], profile=profile, time_scale=time_scale, seed=seed)
+    firsts = []
+    for _ in range(runs):
+        stop = asyncio.Event()
+        start = time.perf_counter()
+        first = []
+
+        def found(_sighting):
+            first.append(time.perf_counter() - start)
+            stop.set()
+
+        await stream_scan(DeviceCache(), found, timeout=DEFAULT_SCAN_TIMEOUT * time_scale,
+                          stop_event=stop, scanner_factory=transport.scanner)
+        if first:
+            firsts.append(first[0])
+    # A one-shot BleakScanner.discover() always takes its full timeout
+    return {"streaming": summarize(firsts, time_scale), "one_shot": DEFAULT_SCAN_TIMEOUT,
+            "misses": runs - len(firsts)}
+
+
+async def run_all(presses: int = 50, burst: int = 10, profile: LinkProfile = REALISTIC,
+                  time_scale: float = 0.1, seed: int = 0, modes=MODES) -> dict:
+    report = {"presses": presses, "burst": burst, "time_scale": time_scale, "modes": {}}
+    for mode in modes:
+        report["modes"][mode] = await bench_mode(mode, presses, burst, profile, time_scale, seed)
+    report["scan"] = await bench_scan(max(5, presses // 5), profile, time_scale, seed)
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{report['presses']} presses, bursts of {report['burst']}, time scale {report['time_scale']}",
+             "",
+             f"{'mode':<10} {'p50':>8} {'p95':>8} {'p99':>8} {'fail':>5} | "
+             f"{'burst p50':>9} {'p95':>8} {'press/s':>8} {'writes':>6} {'conn':>5}"]
+    for mode, r in report["modes"].items():
+        s, b = r["sequential"], r["burst"]
+        lines.append(
+            f"{mode:<10} {s['p50'] * 1000:>6.0f}ms {s['p95'] * 1000:>6.0f}ms {s['p99'] * 1000:>6.0f}ms "
+            f"{s['failures'] + b['failures']:>5} | {b['p50'] * 1000:>7.0f}ms {b['p95'] * 1000:>6.0f}ms "
+            f"{b['throughput']:>8.1f} {b['writes']:>6} {r['connects']:>5}")
+    scan = report["scan"]
+    lines += ["",
+              f"scan time-to-first-result: p50 {scan['streaming']['p50'] * 1000:.0f}ms, "
+              f"p95 {scan['streaming']['p95'] * 1000:.0f}ms (one-shot discover: {scan['one_shot'] * 1000:.0f}ms)"]
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="bench", description=__doc__.splitlines()[0])
+    parser.add_argument("--presses", type=int, default=50)
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--time-scale", type=float, default=0.1, help="wall seconds per model second")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", action="append", choices=MODES, help="repeatable; default: all")
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    args = parser.parse_args(argv)
+    report = asyncio.run(run_all(args.presses, args.burst, PROFILES[args.profile], args.time_scale,
+                                 args.seed, tuple(args.mode or MODES)))
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,421 @@
+"""Recording real BLE sessions and replaying them offline.
+
+A RecordingTransport wraps the transport in use (BleakTransport,
+MultiAdapterTransport, a fake) and appends everything the command path
+does through it to a JSON-lines file: scans (find_device and scanner
+sightings), connects with the GATT table they found, writes, reads,
+subscriptions, notifications, link drops and local disconnects, each with
+its start time, duration and error. SwitcherCore adds the command events
+(retrying/failed/acknowledged), so retries show up next to the radio
+operations that caused them. Enabled with "record_file" in config.json,
+or --record FILE in switcherctl and switcherd.
+
+    {"t": 0.0, "op": "start", "version": 1, "time": "2026-10-18T21:04:11"}
+    {"t": 0.01, "op": "find", "mac": "AA:..", "ms": 612.4, "found": true, "name": "SWITCHER_M"}
+    {"t": 0.62, "op": "connect", "mac": "AA:..", "ms": 351.0, "services": [...]}
+    {"t": 0.98, "op": "write", "mac": "AA:..", "ms": 41.2, "data": "00"}
+    {"t": 1.01, "op": "notify", "mac": "AA:..", "char": "000015ba-...", "data": "00"}
+    {"t": 1.02, "op": "command", "mac": "AA:..", "kind": "acknowledged", "channel": 1, ...}
+
+A ReplayTransport plays a recording back: each switcher's finds,
+connects, writes, reads and scans are answered in the recorded order with
+the recorded duration (divided by speed; speed 0 means no delays) and the
+recorded error, and notifications and drops follow the operation they
+came after with the same delay. Operations the recording has no more of
+fail (a find does not find anything), and are counted in unmatched, so a
+changed retry policy replays deterministically against the same radio.
+An operation that was cancelled while recording (an attempt timeout)
+hangs until the caller gives up again.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from types import SimpleNamespace
+
+_LOGGER = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+# Operations that are answered from a recording, in order per switcher
+REPLAYED_OPS = ("find", "connect", "write", "read", "subscribe")
+
+
+def _error_fields(e: BaseException) -> dict:
+    if isinstance(e, asyncio.CancelledError):
+        return {"error": "cancelled"}
+    return {"error": str(e) or type(e).__name__, "error_type": type(e).__name__}
+
+
+def _services_json(services) -> list:
+    if services is None:
+        return []
+    return [{"uuid": str(s.uuid).lower(),
+             "chars": [{"uuid": str(c.uuid).lower(), "handle": c.handle, "properties": list(c.properties)}
+                       for c in s.characteristics]}
+            for s in services]
+
+
+class Recorder:
+    """Appends events to a JSON-lines file; t is seconds since the recorder was created."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self.record("start", version=FORMAT_VERSION, time=datetime.now().isoformat(timespec="seconds"))
+
+    def now(self) -> float:
+        return time.monotonic() - self._started
+
+    def record(self, op: str, mac: str = None, t: float = None, **fields):
+        entry = {"t": round(self.now() if t is None else t, 4), "op": op}
+        if mac is not None:
+            entry["mac"] = mac.upper()
+        entry.update(fields)
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+
+    async def timed(self, op: str, mac: str, coro, outcome=None, **fields):
+        """Await coro, recording op with its duration and error; outcome(result) adds fields on success."""
+        started = self.now()
+        try:
+            result = await coro
+        except BaseException as e:
+            self.record(op, mac, t=started, ms=round((self.now() - started) * 1000, 1), **fields, **_error_fields(e))
+            raise
+        if outcome is not None:
+            fields.update(outcome(result))
+        self.record(op, mac, t=started, ms=round((self.now() - started) * 1000, 1), **fields)
+        return result
+
+    def command_event(self, event):
+        """Record a command_events.CommandEvent (attempts and retries)."""
+        self.record("command", event.mac, kind=str(event.kind.value), channel=event.channel,
+                    action=event.action, attempt=event.attempt, detail=event.detail)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RecordingClient:
+    def __init__(self, recorder: Recorder, mac: str, disconnected_callback):
+        self.recorder = recorder
+        self.mac = mac
+        self.disconnected_callback = disconnected_callback
+        self.inner = None
+        self._closing = False
+
+    def _on_disconnected(self, _client):
+        # bleak calls this for our own disconnect() too; only losses are drops
+        if not self._closing:
+            self.recorder.record("drop", self.mac)
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+    @property
+    def is_connected(self) -> bool:
+        return self.inner.is_connected
+
+    @property
+    def services(self):
+        return getattr(self.inner, "services", None)
+
+    async def connect(self):
+        await self.recorder.timed("connect", self.mac, self.inner.connect(),
+                                  lambda _: {"services": _services_json(self.services)})
+
+    async def disconnect(self):
+        self._closing = True
+        self.recorder.record("disconnect", self.mac)
+        await self.inner.disconnect()
+
+    async def write_gatt_char(self, char, data, **kwargs):
+        await self.recorder.timed("write", self.mac, self.inner.write_gatt_char(char, data, **kwargs),
+                                  data=bytes(data).hex())
+
+    async def read_gatt_char(self, char):
+        return await self.recorder.timed("read", self.mac, self.inner.read_gatt_char(char),
+                                         lambda data: {"data": bytes(data).hex()}, char=str(char.uuid).lower())
+
+    async def start_notify(self, char, callback):
+        def notified(c, data):
+            self.recorder.record("notify", self.mac, char=str(c.uuid).lower(), data=bytes(data).hex())
+            callback(c, data)
+
+        await self.recorder.timed("subscribe", self.mac, self.inner.start_notify(char, notified),
+                                  char=str(char.uuid).lower())
+
+
+class RecordingTransport:
+    """Same interface as the wrapped transport; everything else (stats, adapters, ...) is passed through."""
+
+    def __init__(self, inner, recorder: Recorder):
+        self.inner = inner
+        self.recorder = recorder
+        if hasattr(inner, "scanner"):
+            self.scanner = self._scanner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    async def find_device(self, mac: str, timeout: float):
+        return await self.recorder.timed("find", mac, self.inner.find_device(mac, timeout),
+                                         lambda d: {"found": d is not None, "name": getattr(d, "name", None)})
+
+    def client(self, device, disconnected_callback, profile=None):
+        client = RecordingClient(self.recorder, device.address, disconnected_callback)
+        if profile is not None:
+            client.inner = self.inner.client(device, client._on_disconnected, profile)
+        else:
+            client.inner = self.inner.client(device, client._on_disconnected)
+        return client
+
+    def _scanner(self, detection_callback=None):
+        recorder = self.recorder
+
+        def detected(device, adv):
+            recorder.record("adv", device.address, name=getattr(device, "name", None),
+                            rssi=getattr(adv, "rssi", None))
+            if detection_callback is not None:
+                detection_callback(device, adv)
+
+        return _RecordingScanner(recorder, self.inner.scanner(detected))
+
+
+class _RecordingScanner:
+    def __init__(self, recorder: Recorder, inner):
+        self.recorder = recorder
+        self.inner = inner
+
+    async def start(self):
+        self.recorder.record("scan_start")
+        await self.inner.start()
+
+    async def stop(self):
+        await self.inner.stop()
+        self.recorder.record("scan_stop")
+
+
+def load_recording(path: str) -> list:
+    """Events of a recording, in file order."""
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}") from None
+    return events
+
+
+def _make_services(table: list):
+    services = [SimpleNamespace(uuid=s["uuid"], characteristics=[
+        SimpleNamespace(uuid=c["uuid"], handle=c["handle"], service_uuid=s["uuid"], properties=c["properties"])
+        for c in s["chars"]]) for s in table]
+    return _ReplayServices(services)
+
+
+class _ReplayServices:
+    def __init__(self, services: list):
+        self._services = services
+
+    def __iter__(self):
+        return iter(self._services)
+
+    def get_characteristic(self, specifier):
+        for service in self._services:
+            for char in service.characteristics:
+                if specifier in (char.uuid, char.handle):
+                    return char
+        return None
+
+
+class ReplayTransport:
+    """Answers find_device()/client()/scanner() from a recording."""
+
+    def __init__(self, events: list, speed: float = 1.0):
+        self.speed = speed
+        # mac -> op -> deque of recorded operations; each has "followers":
+        # the notifications/drops that came after it, with their delay
+        self._ops = defaultdict(lambda: defaultdict(deque))
+        self._scans = deque()
+        self.macs = []
+        self.replayed = 0
+        self.unmatched = 0
+        # Writes whose payload differs from the recording (answered anyway)
+        self.mismatches = 0
+        last_op = {}
+        scan = None
+        for event in sorted(events, key=lambda e: e.get("t", 0.0)):
+            op, mac = event.get("op"), event.get("mac")
+            if op in REPLAYED_OPS:
+                event = dict(event, followers=[])
+                self._ops[mac][op].append(event)
+                last_op[mac] = event
+                if mac not in self.macs:
+                    self.macs.append(mac)
+            elif op in ("notify", "drop") and mac in last_op:
+                last_op[mac]["followers"].append((event["t"] - last_op[mac]["t"], event))
+            elif op == "scan_start":
+                scan = (event["t"], [])
+                self._scans.append(scan)
+            elif op == "adv" and scan is not None:
+                scan[1].append((event["t"] - scan[0], event))
+
+    @classmethod
+    def from_file(cls, path: str, speed: float = 1.0) -> "ReplayTransport":
+        return cls(load_recording(path), speed)
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds / self.speed if self.speed > 0 else 0)
+
+    def next_op(self, mac: str, op: str):
+        queue = self._ops[mac.upper()][op]
+        if not queue:
+            self.unmatched += 1
+            _LOGGER.debug("%s: no recorded %s left", mac, op)
+            return None
+        self.replayed += 1
+        return queue.popleft()
+
+    async def play(self, event: dict):
+        """Wait as long as the recorded operation took; raise its error if it had one."""
+        if event.get("error") == "cancelled":
+            # Never finished while recording: wait until the caller gives up
+            await asyncio.get_running_loop().create_future()
+        await self.sleep(event.get("ms", 0.0) / 1000)
+        if "error" in event:
+            raise _replay_error(event)
+
+    async def find_device(self, mac: str, timeout: float):
+        event = self.next_op(mac, "find")
+        if event is None:
+            return None
+        await self.play(event)
+        return SimpleNamespace(name=event.get("name"), address=mac.upper()) if event.get("found") else None
+
+    def client(self, device, disconnected_callback, profile=None):
+        return ReplayClient(self, device.address.upper(), disconnected_callback)
+
+    def scanner(self, detection_callback=None):
+        return ReplayScanner(self, detection_callback)
+
+
+def _replay_error(event: dict) -> Exception:
+    error, kind = event["error"], event.get("error_type")
+    if kind == "BleakCharacteristicNotFoundError":
+        from bleak.exc import BleakCharacteristicNotFoundError
+        return BleakCharacteristicNotFoundError(error)
+    if kind in ("TimeoutError", "asyncio.TimeoutError"):
+        return asyncio.TimeoutError(error)
+    return OSError(error)
+
+
+class ReplayClient:
+    def __init__(self, transport: ReplayTransport, mac: str, disconnected_callback):
+        self.transport = transport
+        self.mac = mac
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self.services = None
+        self._notify = {}
+        self._followers = []
+
+    async def _replay(self, op: str):
+        event = self.transport.next_op(self.mac, op)
+        if event is None:
+            raise OSError(f"{self.mac}: no recorded {op} left")
+        loop = asyncio.get_running_loop()
+        for delay, follower in event["followers"]:
+            self._followers.append(loop.create_task(self._follow(delay, follower)))
+        await self.transport.play(event)
+        return event
+
+    async def _follow(self, delay: float, event: dict):
+        await self.transport.sleep(delay)
+        if not self.is_connected:
+            return
+        if event["op"] == "drop":
+            self._drop()
+            return
+        entry = self._notify.get(event.get("char"))
+        if entry is not None:
+            entry[1](entry[0], bytearray.fromhex(event["data"]))
+
+    def _drop(self):
+        self.is_connected = False
+        self._notify.clear()
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+    async def connect(self):
+        event = await self._replay("connect")
+        self.services = _make_services(event.get("services", []))
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+        self._notify.clear()
+        followers, self._followers = self._followers, []
+        for task in followers:
+            task.cancel()
+
+    async def write_gatt_char(self, char, data, response=None):
+        if not self.is_connected:
+            raise OSError("Not connected")
+        queue = self.transport._ops[self.mac]["write"]
+        if queue and queue[0].get("data") != bytes(data).hex():
+            self.transport.mismatches += 1
+        await self._replay("write")
+
+    async def read_gatt_char(self, char):
+        if not self.is_connected:
+            raise OSError("Not connected")
+        event = await self._replay("read")
+        return bytearray.fromhex(event.get("data", ""))
+
+    async def start_notify(self, char, callback):
+        if not self.is_connected:
+            raise OSError("Not connected")
+        self._notify[str(char.uuid).lower()] = (char, callback)
+        await self._replay("subscribe")
+
+
+class ReplayScanner:
+    """Plays the next recorded scanner session's sightings at their recorded offsets."""
+
+    def __init__(self, transport: ReplayTransport, detection_callback=None):
+        self.transport = transport
+        self.detection_callback = detection_callback
+        self._task = None
+
+    async def start(self):
+        if self.transport._scans:
+            _, sightings = self.transport._scans.popleft()
+            self._task = asyncio.get_running_loop().create_task(self._advertise(sightings))
+
+    async def _advertise(self, sightings):
+        elapsed = 0.0
+        for offset, event in sightings:
+            await self.transport.sleep(offset - elapsed)
+            elapsed = offset
+            if self.detection_callback is not None:
+                self.detection_callback(SimpleNamespace(name=event.get("name"), address=event["mac"]),
+                                        SimpleNamespace(local_name=event.get("name"), rssi=event.get("rssi")))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,47 @@
+"""Typed events and results reported by the switch command path.
+
+These replace inferring success/failure from pyswitcherio's log strings:
+SwitcherSession.send() reports each step through an on_event callback and
+returns a CommandResult as soon as the write is acknowledged (or given up).
+"""
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Optional
+
+
+class EventKind(str, Enum):
+    CONNECTED = "connected"
+    # The write call returned (not emitted for a write that raised)
+    WRITTEN = "written"
+    ACKNOWLEDGED = "acknowledged"
+    RETRYING = "retrying"
+    FAILED = "failed"
+
+
+@dataclass(frozen=True)
+class CommandEvent:
+    kind: EventKind
+    mac: str
+    channel: int
+    action: str
+    attempt: int = 0
+    detail: str = ""
+    time: float = field(default_factory=time.monotonic)
+
+
+@dataclass(frozen=True)
+class CommandResult:
+    ok: bool
+    mac: str
+    channel: int
+    action: str
+    attempts: int = 1
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    # Monotonic time the result was produced, for measuring UI latency
+    finished: float = field(default_factory=time.monotonic)
+    # Nothing was written: the channel was already confirmed in that state
+    skipped: bool = False
+    # Nothing was tried: the switcher's circuit breaker is open (see retry_policy)
+    fast_failed: bool = False
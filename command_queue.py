@@ -0,0 +1,94 @@
+"""Per-device command queue with coalescing of superseded presses.
+
+All writes to one switcher go through a single DeviceCommandQueue, so they
+are serialized over the one warm connection. While a write is in flight,
+newer commands for the same channel replace older pending ones: pressing
+switch1 ON, OFF, ON quickly sends at most the first ON and the final ON.
+"""
+import asyncio
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _Pending:
+    __slots__ = ("action", "waiters", "listeners")
+
+    def __init__(self, action):
+        self.action = action
+        self.waiters = []
+        self.listeners = []
+
+
+class DeviceCommandQueue:
+    def __init__(self, session, limiter=None):
+        self.session = session
+        # Optional shared semaphore bounding concurrent commands across devices
+        self.limiter = limiter
+        # channel -> _Pending, in the order channels were first queued
+        self._pending = {}
+        self._worker = None
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, channel: int, action: str, on_event=None) -> asyncio.Future:
+        """Queue a command; the returned future resolves to its CommandResult.
+
+        A command replaced by a newer one for the same channel resolves with
+        the result of the command that was actually sent.
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        pending = self._pending.get(channel)
+        if pending is None:
+            pending = self._pending[channel] = _Pending(action)
+        else:
+            _LOGGER.debug("%s: ch%d %s superseded by %s", self.session.mac, channel,
+                          pending.action, action)
+            pending.action = action
+            self.coalesced += 1
+        pending.waiters.append(fut)
+        if on_event is not None:
+            pending.listeners.append(on_event)
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+        return fut
+
+    async def _run(self):
+        while self._pending:
+            channel = next(iter(self._pending))
+            pending = self._pending.pop(channel)
+
+            def on_event(event, listeners=pending.listeners):
+                for listener in listeners:
+                    listener(event)
+
+            try:
+                if self.limiter is not None:
+                    async with self.limiter:
+                        result = await self.session.send(channel, pending.action, on_event)
+                else:
+                    result = await self.session.send(channel, pending.action, on_event)
+            except asyncio.CancelledError:
+                for fut in pending.waiters:
+                    fut.cancel()
+                raise
+            except Exception as e:
+                for fut in pending.waiters:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for fut in pending.waiters:
+                if not fut.done():
+                    fut.set_result(result)
+
+    async def close(self):
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        for pending in self._pending.values():
+            for fut in pending.waiters:
+                fut.cancel()
+        self._pending.clear()
@@ -0,0 +1,314 @@
+"""Versioned config.json: migrations, atomic writes, debounced saves, file watching.
+
+Version history:
+
+    1    no "version" key: {"mac", "type", "invert"} for a single switcher,
+         later also "devices", "selected", "idle_timeout", ...
+    2    "version": 2; switchers only in "devices", legacy mac/type/invert
+         folded into it and removed
+
+Files are always replaced atomically (write to a temp file in the same
+directory, fsync, rename), so a crash mid-save leaves the previous config.
+An unreadable file raises ConfigError instead of quietly acting as empty.
+
+ConfigStore is for long-running front ends (GUI, daemon). update() records
+which keys changed and a background thread writes them after a short
+debounce. Before writing, the file is re-read if someone else (the CLI,
+another instance) changed it, and only our changed keys are applied on
+top. A watcher thread notices external edits and hands the new config to
+a callback. DeferredWriter is the same debounced background write for the
+smaller state files (state.json, profiles.json, health.json).
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+CONFIG_VERSION = 2
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_WATCH_INTERVAL = 1.0
+LEGACY_KEYS = ("mac", "type", "invert")
+# Name given to the switcher found in a version 1 config (devices.DEFAULT_DEVICE_NAME)
+LEGACY_DEVICE_NAME = "스위처 1"
+
+
+class ConfigError(Exception):
+    """config.json exists but cannot be used (bad JSON, not an object, newer version)."""
+
+
+def _migrate_to_2(config: dict) -> dict:
+    devices = config.get("devices")
+    if not isinstance(devices, list):
+        devices = []
+        if config.get("mac"):
+            devices.append({"name": LEGACY_DEVICE_NAME, "mac": str(config["mac"]).strip(),
+                            "type": 2 if config.get("type", 2) == 2 else 1,
+                            "invert": bool(config.get("invert", False))})
+        config["devices"] = devices
+    if not config.get("selected") and devices:
+        # The legacy editor showed the switcher whose MAC was in "mac"
+        legacy = str(config.get("mac", "")).strip().upper()
+        match = [d for d in devices if str(d.get("mac", "")).upper() == legacy]
+        config["selected"] = (match or devices)[0].get("name")
+    for key in LEGACY_KEYS:
+        config.pop(key, None)
+    return config
+
+
+# MIGRATIONS[n] upgrades a version-n config to n + 1
+MIGRATIONS = {1: _migrate_to_2}
+
+
+def migrate(config: dict) -> dict:
+    version = config.get("version", 1)
+    if not isinstance(version, int) or version < 1:
+        raise ConfigError(f"bad config version {version!r}")
+    if version > CONFIG_VERSION:
+        raise ConfigError(f"config version {version} is newer than this app ({CONFIG_VERSION})")
+    config = dict(config)
+    while version < CONFIG_VERSION:
+        config = MIGRATIONS[version](config)
+        version += 1
+        config["version"] = version
+    return config
+
+
+def default_config() -> dict:
+    return {"version": CONFIG_VERSION, "devices": []}
+
+
+def read_config(path: str) -> dict:
+    """Read and migrate; a missing file gives the defaults, a broken one raises ConfigError."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return default_config()
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"{path}: {e}") from e
+    if not isinstance(data, dict):
+        raise ConfigError(f"{path}: expected a JSON object")
+    return migrate(data)
+
+
+def atomic_write_json(path: str, data, **dump_kwargs):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class DeferredWriter:
+    """Calls write() on a background thread, at most once per delay seconds.
+
+    schedule() never blocks on file I/O, so it is safe on the BLE loop;
+    requests made while one is pending ride along with it. flush() writes
+    now if anything is pending (and waits for a write in progress).
+    """
+
+    def __init__(self, write, delay: float = DEFAULT_DEBOUNCE, name: str = "writer"):
+        self.write = write
+        self.delay = delay
+        self.name = name
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._due = None
+        self._closed = False
+        self._thread = None
+
+    def schedule(self):
+        with self._cond:
+            if not self._closed:
+                if self._due is None:
+                    self._due = time.monotonic() + self.delay
+                if self._thread is None:
+                    # Started on first use, so read-only users never get a thread
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+                return
+        # After close(): nothing will write later, so write now
+        self._write_now()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and (self._due is None or self._due > time.monotonic()):
+                    self._cond.wait(None if self._due is None else self._due - time.monotonic())
+                if self._due is None:
+                    return
+                self._due = None
+            self._write_now()
+
+    def _write_now(self):
+        with self._write_lock:
+            self._write_locked()
+
+    def _write_locked(self):
+        try:
+            self.write()
+        except Exception:
+            _LOGGER.exception("%s: write failed", self.name)
+
+    def flush(self):
+        with self._cond:
+            pending, self._due = self._due is not None, None
+        with self._write_lock:
+            if pending:
+                self._write_locked()
+
+    def close(self, timeout: float = 5.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+
+def write_config(config: dict, path: str):
+    atomic_write_json(path, {**config, "version": CONFIG_VERSION}, ensure_ascii=False, indent=2)
+
+
+def set_aside(path: str) -> str:
+    """Move an unreadable config out of the way (kept for the user) and return its new name."""
+    backup = f"{path}.broken-{time.strftime('%Y%m%d-%H%M%S')}"
+    os.replace(path, backup)
+    return backup
+
+
+def _signature(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ConfigStore:
+    def __init__(self, path: str, debounce: float = DEFAULT_DEBOUNCE):
+        self.path = path
+        self.debounce = debounce
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self.data = read_config(path)
+        self._signature = _signature(path)
+        self._dirty = set()
+        self._due = None
+        self._closed = False
+        self._on_change = None
+        self._writer = threading.Thread(target=self._write_loop, name="config-writer", daemon=True)
+        self._writer.start()
+        self._watcher = None
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self.data.get(key, default)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self.data))
+
+    def update(self, changes: dict):
+        """Merge changes and schedule a save; keys whose value did not change are not written."""
+        with self._lock:
+            changed = {k for k, v in changes.items() if self.data.get(k) != v}
+            if not changed:
+                return
+            for key in changed:
+                self.data[key] = changes[key]
+            self._dirty |= changed
+            self._due = time.monotonic() + self.debounce
+            self._cond.notify()
+
+    def flush(self):
+        """Write pending changes now (e.g. on exit)."""
+        with self._lock:
+            self._save_locked()
+
+    def close(self):
+        with self._lock:
+            self._save_locked()
+            self._closed = True
+            self._cond.notify()
+
+    def _write_loop(self):
+        with self._lock:
+            while not self._closed:
+                if self._due is None:
+                    self._cond.wait()
+                    continue
+                delay = self._due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                self._save_locked()
+
+    def _save_locked(self):
+        self._due = None
+        if not self._dirty:
+            return
+        if _signature(self.path) != self._signature:
+            # Someone else wrote the file since we last read it: keep their
+            # keys and apply only ours on top
+            try:
+                disk = read_config(self.path)
+            except ConfigError as e:
+                _LOGGER.warning("Overwriting unreadable config: %s", e)
+            else:
+                for key in self._dirty:
+                    disk[key] = self.data[key]
+                self.data = disk
+        try:
+            write_config(self.data, self.path)
+        except OSError as e:
+            _LOGGER.error("Could not save %s: %s", self.path, e)
+            self._due = time.monotonic() + max(self.debounce, 1.0)
+            return
+        self._dirty.clear()
+        self._signature = _signature(self.path)
+
+    def watch(self, on_change, interval: float = DEFAULT_WATCH_INTERVAL):
+        """Call on_change(config) from a background thread when another process edits the file."""
+        self._on_change = on_change
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_loop, args=(interval,),
+                                             name="config-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch_loop(self, interval: float):
+        while not self._closed:
+            time.sleep(interval)
+            with self._lock:
+                sig = _signature(self.path)
+                if sig is None or sig == self._signature:
+                    continue
+                try:
+                    disk = read_config(self.path)
+                except ConfigError as e:
+                    # Probably caught mid-edit by hand; try again next tick
+                    _LOGGER.warning("%s", e)
+                    continue
+                # Unsaved local changes win over the external edit
+                for key in self._dirty:
+                    disk[key] = self.data[key]
+                self.data = disk
+                self._signature = sig
+                snapshot = self.snapshot()
+            _LOGGER.info("Config changed on disk, reloading")
+            try:
+                self._on_change(snapshot)
+            except Exception:
+                _LOGGER.exception("Config change handler failed")
@@ -0,0 +1,562 @@
+"""Persistent BLE sessions for I/O switchers.
+
+pyswitcherio.IOSwitcher scans, connects, writes and disconnects on every
+command. SwitcherSession keeps one connection per MAC open instead (shared by
+both channels of a 2-gang switcher) and ConnectionPool owns those sessions.
+"""
+import asyncio
+import logging
+import sys
+import time
+
+from bleak import BleakClient, BleakScanner
+from bleak.exc import BleakCharacteristicNotFoundError, BleakDeviceNotFoundError
+import pyswitcherio
+
+from command_events import CommandEvent, CommandResult, EventKind
+from command_queue import DeviceCommandQueue
+from device_profiles import DeviceProfile, ProfileStore
+from device_reports import BATTERY_LEVEL_UUID, BATTERY_SERVICE_UUID, parse_report
+from discovery import DeviceCache
+from retry_policy import CircuitBreaker, RetryPolicy
+from telemetry import DISABLED
+
+_LOGGER = logging.getLogger(__name__)
+
+# Same characteristic pyswitcherio.IOSwitcher writes to by default
+CHAR_UUID = "000015ba-0000-1000-8000-00805f9b34fb"
+
+DEFAULT_IDLE_TIMEOUT = 60.0
+# Most adapters handle 5-7 simultaneous links; stay under that by default
+DEFAULT_MAX_CONNECTIONS = 4
+SCAN_TIMEOUT = 10.0
+# Delays between background reconnect attempts after an unexpected drop
+RECONNECT_DELAYS = (1.0, 2.0, 5.0, 10.0)
+
+
+def normalize_mac(mac: str) -> str:
+    return mac.strip().upper()
+
+
+def command_key(channel: int, action: str) -> bytes:
+    """Return the payload pyswitcherio would write for this channel/action."""
+    if channel == 2:
+        return pyswitcherio.ON_KEY2 if action == "on" else pyswitcherio.OFF_KEY2
+    return pyswitcherio.ON_KEY1 if action == "on" else pyswitcherio.OFF_KEY1
+
+
+def _address_type(device):
+    # BlueZ exposes it in the D-Bus properties; other backends don't report it
+    details = getattr(device, "details", None)
+    if isinstance(details, dict):
+        return details.get("props", {}).get("AddressType")
+    return None
+
+
+class BleakTransport:
+    """Real BLE through bleak. Other transports (see fake_transport) have the same two methods.
+
+    adapter picks a local adapter ("hci1", BlueZ only); None uses the default.
+    """
+
+    def __init__(self, adapter: str = None):
+        self.adapter = adapter
+        self._adapter_kwargs = {"adapter": adapter} if adapter else {}
+
+    async def find_device(self, mac: str, timeout: float):
+        return await BleakScanner.find_device_by_address(mac, timeout=timeout, **self._adapter_kwargs)
+
+    def client(self, device, disconnected_callback, profile: DeviceProfile = None):
+        kwargs = {}
+        if profile is not None:
+            if profile.service_uuid:
+                # Only discover the service holding the switch characteristic
+                # (and the battery service, for device_reports)
+                kwargs["services"] = [profile.service_uuid, BATTERY_SERVICE_UUID]
+            if sys.platform == "win32":
+                winrt = {"use_cached_services": True}
+                if profile.address_type:
+                    winrt["address_type"] = profile.address_type
+                kwargs["winrt"] = winrt
+        return BleakClient(device, disconnected_callback=disconnected_callback, **kwargs, **self._adapter_kwargs)
+
+
+class SwitcherSession:
+    """One warm connection to a switcher. Must be used from a single event loop."""
+
+    def __init__(self, mac: str, idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 retry: RetryPolicy = None, cache: DeviceCache = None,
+                 transport=None, telemetry=None, profiles: ProfileStore = None):
+        self.mac = normalize_mac(mac)
+        self.transport = transport if transport is not None else BleakTransport()
+        # Per-phase timings (scan/connect/write); see telemetry.py
+        self.telemetry = telemetry if telemetry is not None else DISABLED
+        # Remembered GATT layout; narrows service discovery on reconnect
+        self.profiles = profiles
+        # Recently seen devices; a hit skips the scan before connecting
+        self.cache = cache
+        self.idle_timeout = idle_timeout
+        # Fails fast while the switcher is unreachable; probed in the background
+        self.breaker = CircuitBreaker(retry if retry is not None else RetryPolicy())
+        self.last_used = 0.0
+        self._client = None
+        # Characteristic (or UUID) and write type resolved for the current link
+        self._char = CHAR_UUID
+        self._write_response = None
+        self._using_profile = False
+        self._loop = None
+        self._lock = asyncio.Lock()
+        self._idle_handle = None
+        self._reconnect_task = None
+        self._probe_task = None
+        self._subscribe_task = None
+        self._closed = False
+        # Optional coroutine fn(session) awaited before opening a new link
+        self.before_connect = None
+        # Optional fn(DeviceReport), called on the loop for every notification
+        # once subscribed (see device_reports)
+        self.on_report = None
+        # Optional presence.PresenceMonitor; commands fail fast while it says the switcher is away
+        self.presence = None
+
+    @property
+    def retry(self) -> RetryPolicy:
+        return self.breaker.policy
+
+    @retry.setter
+    def retry(self, policy: RetryPolicy):
+        self.breaker.policy = policy
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client is not None and self._client.is_connected
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def _is_wanted(self) -> bool:
+        # A link is worth keeping (or restoring) until it has been idle for idle_timeout
+        return not self._closed and time.monotonic() - self.last_used < self.idle_timeout
+
+    async def connect(self):
+        if self.is_connected:
+            return
+        self._loop = asyncio.get_running_loop()
+        if self.before_connect is not None:
+            await self.before_connect(self)
+        _LOGGER.debug("스위쳐 연결 중")
+        sighting = self.cache.get(self.mac) if self.cache is not None else None
+        if sighting is not None and sighting.device is not None:
+            device = sighting.device
+        else:
+            with self.telemetry.span("scan", self.mac):
+                device = await self.transport.find_device(self.mac, SCAN_TIMEOUT)
+                if device is None:
+                    raise BleakDeviceNotFoundError(self.mac)
+            if self.cache is not None:
+                self.cache.update(device)
+        profile = self.profiles.get(self.mac) if self.profiles is not None else None
+        if profile is not None:
+            client = self.transport.client(device, self._on_disconnected, profile)
+        else:
+            client = self.transport.client(device, self._on_disconnected)
+        started = time.monotonic()
+        try:
+            # bleak resolves GATT services inside connect(), so this span
+            # includes service discovery
+            with self.telemetry.span("connect", self.mac, cached=sighting is not None,
+                                     profile=profile is not None):
+                await client.connect()
+        except Exception:
+            # The cached device may be stale; scan again on the next attempt
+            if self.cache is not None:
+                self.cache.forget(self.mac)
+            raise
+        self._client = client
+        if self.presence is not None:
+            self.presence.seen(self.mac)
+        self._learn_profile(client, device, profile, time.monotonic() - started)
+        if self.on_report is not None:
+            # Off the command path: the first write does not wait for it
+            self._subscribe_task = self._loop.create_task(self._subscribe(client))
+        _LOGGER.debug("스위쳐 연결 완료!")
+
+    def _learn_profile(self, client, device, profile, connect_time: float):
+        self._using_profile = profile is not None
+        char = None
+        services = getattr(client, "services", None)
+        if services is not None:
+            char = services.get_characteristic(CHAR_UUID)
+        if char is None:
+            self._char, self._write_response = CHAR_UUID, None
+            return
+        self._char = char
+        self._write_response = "write" in char.properties
+        if profile is not None and profile.char_handle is not None and profile.char_handle != char.handle:
+            _LOGGER.info("%s: switch characteristic moved from handle %#06x to %#06x",
+                         self.mac, profile.char_handle, char.handle)
+        if self.profiles is not None:
+            self.profiles.put(DeviceProfile(
+                self.mac, service_uuid=str(char.service_uuid), char_handle=char.handle,
+                write_response=self._write_response,
+                address_type=_address_type(device) or (profile.address_type if profile else None),
+                connect_time=round(connect_time, 4)))
+
+    async def _subscribe(self, client):
+        """Listen to the switch service's notifications and the battery level; read the battery once."""
+        services = getattr(client, "services", None)
+        if services is None:
+            return
+        switch_service = str(getattr(self._char, "service_uuid", "")).lower()
+        for service in services:
+            if str(service.uuid).lower() not in (switch_service, BATTERY_SERVICE_UUID):
+                continue
+            for char in service.characteristics:
+                uuid = str(char.uuid).lower()
+                try:
+                    if uuid == BATTERY_LEVEL_UUID and "read" in char.properties:
+                        self._on_notify(char, await client.read_gatt_char(char))
+                    if "notify" in char.properties or "indicate" in char.properties:
+                        await client.start_notify(char, self._on_notify)
+                except Exception as e:
+                    # Optional: commands work without reports
+                    _LOGGER.debug("%s: cannot subscribe to %s: %s", self.mac, uuid, e)
+
+    def _on_notify(self, char, data):
+        if self.on_report is not None:
+            self.on_report(parse_report(self.mac, str(char.uuid), data))
+
+    async def _write(self, key: bytes):
+        if self._write_response is None:
+            await self._client.write_gatt_char(self._char, key)
+        else:
+            await self._client.write_gatt_char(self._char, key, response=self._write_response)
+
+    async def disconnect(self):
+        client, self._client = self._client, None
+        if self._subscribe_task is not None:
+            self._subscribe_task.cancel()
+            self._subscribe_task = None
+        if client is None:
+            return
+        if self.presence is not None and client.is_connected:
+            # It starts advertising again from now on
+            self.presence.seen(self.mac)
+        try:
+            await client.disconnect()
+        except Exception as e:
+            _LOGGER.warning("연결을 끊는중 에러 발생: %s", e)
+        _LOGGER.debug("연결 끊기 완료")
+
+    async def send(self, channel: int, action: str, on_event=None) -> CommandResult:
+        """Write the on/off key for a channel, retrying as the RetryPolicy says.
+
+        on_event, if given, is called on the loop thread with a CommandEvent
+        for every step. The result is returned as soon as the write is
+        acknowledged. While the circuit breaker is open, or the presence
+        monitor has not seen the switcher for a while, the command fails at
+        once (result.fast_failed) without touching the radio.
+        """
+        key = command_key(channel, action)
+        started = time.monotonic()
+
+        def emit(kind, attempt, detail=""):
+            if on_event is not None:
+                on_event(CommandEvent(kind, self.mac, channel, action, attempt, detail))
+
+        def fast_fail(error=None):
+            self.last_used = time.monotonic()
+            error = error or f"스위처 응답 없음 ({self.breaker.retry_in:.0f}초 후 다시 확인)"
+            emit(EventKind.FAILED, 0, error)
+            self.telemetry.count_result(self.mac, False, retries=0)
+            return CommandResult(False, self.mac, channel, action, 0, error,
+                                 time.monotonic() - started, fast_failed=True)
+
+        away = self.presence.is_away(self.mac) if self.presence is not None and not self.is_connected else None
+        if away is not None:
+            return fast_fail(f"스위처가 보이지 않음 ({away:.0f}초 동안 신호 없음)")
+        # Checked before queueing on the lock too, which a probe may be holding
+        if not self.breaker.allow():
+            return fast_fail()
+        async with self._lock:
+            if not self.breaker.allow():
+                return fast_fail()
+            self.last_used = time.monotonic()
+            policy = self.retry
+            # Half-open: this press is the probe, so one attempt only
+            retries = 0 if self.breaker.state == "half_open" else policy.retries
+            error = None
+            for attempt in range(retries + 1):
+                try:
+                    await asyncio.wait_for(self._attempt(key, channel, attempt, emit), policy.attempt_timeout)
+                    emit(EventKind.ACKNOWLEDGED, attempt)
+                    self._arm_idle_timer()
+                    if self.presence is not None:
+                        self.presence.seen(self.mac)
+                    self.breaker.record_success()
+                    self.telemetry.count_result(self.mac, True, retries=attempt)
+                    return CommandResult(True, self.mac, channel, action, attempt + 1,
+                                         elapsed=time.monotonic() - started)
+                except asyncio.TimeoutError:
+                    error = f"시도 시간 초과 ({policy.attempt_timeout:g}초)"
+                    _LOGGER.warning("%s: %s", self.mac, error)
+                    await self.disconnect()
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+                    _LOGGER.warning("%s", error)
+                    if self._using_profile and isinstance(e, (BleakCharacteristicNotFoundError, KeyError)):
+                        # The (OS-cached) characteristic is gone; connect without the profile next
+                        self.profiles.invalidate(self.mac)
+                        self._using_profile = False
+                    await self.disconnect()
+                remaining = retries - attempt
+                if remaining < 1:
+                    break
+                _LOGGER.warning("스위쳐 연결 실패. 다시 시도 남은 횟수 %d", remaining)
+                emit(EventKind.RETRYING, attempt, error)
+                await asyncio.sleep(policy.delay(attempt))
+            _LOGGER.error("스위쳐 통신 실패..")
+            emit(EventKind.FAILED, attempt, error)
+            self.telemetry.count_result(self.mac, False, retries=attempt)
+            if self.breaker.record_failure():
+                _LOGGER.warning("%s: %d failed commands in a row, failing fast and probing in background",
+                                self.mac, self.breaker.failures)
+            if self.breaker.state == "open":
+                self._start_probing()
+            return CommandResult(False, self.mac, channel, action, attempt + 1, error,
+                                 time.monotonic() - started)
+
+    async def _attempt(self, key: bytes, channel: int, attempt: int, emit):
+        was_connected = self.is_connected
+        await self.connect()
+        if not was_connected:
+            emit(EventKind.CONNECTED, attempt)
+        # Returns once the write response arrives (or immediately for
+        # write-without-response characteristics)
+        with self.telemetry.span("write", self.mac, channel=channel, attempt=attempt):
+            await self._write(key)
+        # Only now: a write that raised was never written
+        emit(EventKind.WRITTEN, attempt)
+
+    def _start_probing(self):
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.get_running_loop().create_task(self._probe())
+
+    async def _probe(self):
+        """Reconnect attempts while the breaker is open, backing off after each failure."""
+        while not self._closed and self.breaker.state != "closed":
+            await asyncio.sleep(self.breaker.retry_in)
+            if self.breaker.state == "open":
+                # A press probed (and failed) meanwhile, pushing the next probe out
+                continue
+            if time.monotonic() - self.last_used > self.retry.probe_for:
+                # Nobody is waiting for this switcher; the next press probes instead
+                _LOGGER.info("%s: unused, stopped probing", self.mac)
+                return
+            async with self._lock:
+                if self.breaker.state == "closed":
+                    return
+                try:
+                    await asyncio.wait_for(self.connect(), self.retry.attempt_timeout)
+                except Exception as e:
+                    self.breaker.record_failure()
+                    _LOGGER.debug("%s: probe failed (%s), next in %.0fs", self.mac,
+                                  str(e) or type(e).__name__, self.breaker.retry_in)
+                    continue
+                self.breaker.record_success()
+                self._arm_idle_timer()
+                _LOGGER.info("%s: reachable again", self.mac)
+                return
+
+    async def warm(self):
+        """Open the link ahead of an expected command (e.g. a scheduled one)."""
+        async with self._lock:
+            self.last_used = time.monotonic()
+            await self.connect()
+            self._arm_idle_timer()
+
+    async def close(self):
+        self._closed = True
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        for task in (self._reconnect_task, self._probe_task):
+            if task is not None:
+                task.cancel()
+        self._reconnect_task = self._probe_task = None
+        await self.disconnect()
+
+    def _arm_idle_timer(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._idle_handle = loop.call_later(
+            self.idle_timeout, lambda: loop.create_task(self._idle_check()))
+
+    async def _idle_check(self):
+        self._idle_handle = None
+        if self.busy or self._is_wanted():
+            self._arm_idle_timer()
+            return
+        _LOGGER.debug("%s: idle for %.0fs, disconnecting", self.mac, self.idle_timeout)
+        await self.disconnect()
+
+    def _on_disconnected(self, client):
+        # Some backends call this from their own thread; hop onto our loop
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._handle_disconnect, client)
+
+    def _handle_disconnect(self, client):
+        if client is not self._client:
+            # Expected disconnect (we already dropped our reference)
+            return
+        self._client = None
+        if self.presence is not None:
+            self.presence.seen(self.mac)
+        if not self._is_wanted():
+            return
+        _LOGGER.warning("%s: connection lost, reconnecting in background", self.mac)
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        for delay in RECONNECT_DELAYS:
+            await asyncio.sleep(delay)
+            if not self._is_wanted():
+                return
+            async with self._lock:
+                if self.is_connected:
+                    return
+                try:
+                    await self.connect()
+                    return
+                except Exception as e:
+                    _LOGGER.debug("%s: reconnect failed: %s", self.mac, e)
+        _LOGGER.warning("%s: giving up background reconnect", self.mac)
+
+
+class ConnectionPool:
+    """Keeps one SwitcherSession per MAC.
+
+    Channel 1 and channel 2 of the same switcher share a session, so only
+    the first press after startup (or after idle_timeout) pays for the scan
+    and connect. Commands go through a per-device DeviceCommandQueue, which
+    serializes writes and coalesces superseded presses. Must be used from
+    the shared event loop (see event_loop.LoopThread).
+
+    At most max_connections commands run at once across all devices, and
+    opening a link beyond that many evicts the least recently used idle one.
+    """
+
+    def __init__(self, idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS, cache: DeviceCache = None,
+                 transport=None, telemetry=None, profiles: ProfileStore = None, retry: RetryPolicy = None,
+                 on_report=None):
+        self.idle_timeout = idle_timeout
+        # fn(DeviceReport) for notifications from any switcher, called on the loop
+        self.on_report = on_report
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.transport = transport if transport is not None else BleakTransport()
+        self.telemetry = telemetry if telemetry is not None else DISABLED
+        self.profiles = profiles
+        self.cache = cache if cache is not None else DeviceCache()
+        self.presence = None
+        self.max_connections = max(1, int(max_connections))
+        self._slots = asyncio.Semaphore(self.max_connections)
+        self._sessions = {}
+        self._queues = {}
+
+    def session(self, mac: str) -> SwitcherSession:
+        key = normalize_mac(mac)
+        session = self._sessions.get(key)
+        if session is None:
+            session = SwitcherSession(key, idle_timeout=self.idle_timeout, cache=self.cache,
+                                      transport=self.transport, telemetry=self.telemetry,
+                                      profiles=self.profiles, retry=self.retry)
+            session.before_connect = self._make_room
+            session.on_report = self._report
+            session.presence = self.presence
+            self._sessions[key] = session
+        return session
+
+    def _report(self, report):
+        if self.on_report is not None:
+            try:
+                self.on_report(report)
+            except Exception:
+                _LOGGER.exception("Report handler failed")
+
+    def is_connected(self, mac: str) -> bool:
+        session = self._sessions.get(normalize_mac(mac))
+        return session is not None and session.is_connected
+
+    @property
+    def connected_count(self) -> int:
+        return sum(1 for s in self._sessions.values() if s.is_connected)
+
+    async def _make_room(self, session: SwitcherSession):
+        while True:
+            others = [s for s in self._sessions.values() if s is not session and s.is_connected]
+            if len(others) < self.max_connections:
+                return
+            idle = [s for s in others if not s.busy]
+            if not idle:
+                # Cannot happen while _slots bounds active commands; don't spin
+                return
+            victim = min(idle, key=lambda s: s.last_used)
+            _LOGGER.debug("%s: closing idle link to make room for %s", victim.mac, session.mac)
+            await victim.disconnect()
+
+    def queue(self, mac: str) -> DeviceCommandQueue:
+        key = normalize_mac(mac)
+        q = self._queues.get(key)
+        if q is None:
+            q = self._queues[key] = DeviceCommandQueue(self.session(key), limiter=self._slots)
+        return q
+
+    async def send(self, mac: str, channel: int, action: str, on_event=None) -> CommandResult:
+        # "command" covers press-to-ack, including time spent waiting in the queue
+        with self.telemetry.span("command", normalize_mac(mac), channel=channel) as attrs:
+            result = await self.queue(mac).submit(channel, action, on_event)
+            attrs["ok"] = result.ok
+            return result
+
+    async def warm(self, mac: str):
+        async with self._slots:
+            await self.session(mac).warm()
+
+    def set_idle_timeout(self, seconds: float):
+        self.idle_timeout = seconds
+        for session in self._sessions.values():
+            session.idle_timeout = seconds
+
+    def set_retry_policy(self, policy: RetryPolicy):
+        self.retry = policy
+        for session in self._sessions.values():
+            session.retry = policy
+
+    def set_presence(self, monitor):
+        """Use a presence.PresenceMonitor (or None) to fail fast on switchers that are out of range."""
+        self.presence = monitor
+        for session in self._sessions.values():
+            session.presence = monitor
+
+    def adapter_stats(self) -> dict:
+        """Per-adapter links/scans/connects when spread over several adapters (see adapters.py)."""
+        stats = getattr(self.transport, "stats", None)
+        return stats() if stats is not None else {}
+
+    def health(self) -> dict:
+        """Breaker state per switcher that has been used, keyed by MAC."""
+        return {mac: {"breaker": s.breaker.state, "failures": s.breaker.failures,
+                      "retry_in": round(s.breaker.retry_in, 1), "connected": s.is_connected}
+                for mac, s in self._sessions.items()}
+
+    async def close(self):
+        queues = list(self._queues.values())
+        self._queues.clear()
+        await asyncio.gather(*(q.close() for q in queues), return_exceptions=True)
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
@@ -0,0 +1,128 @@
+"""Per-switcher GATT profile remembered between connections and runs.
+
+After a successful connect SwitcherSession records where the switch
+characteristic lives (service UUID, handle, write type), the device's
+address type and how long the connect took. The next connect passes the
+service UUID to bleak as a services filter, so only the switch and battery
+services are resolved (on WinRT; BlueZ resolves the whole table and bleak
+filters it), and on Windows asks for the OS's cached services and the
+remembered address type. bleak cannot be handed a GATT table, so the
+remembered handle does not skip discovery; it is compared with the fresh
+one to notice a firmware update that moved the characteristic. A write
+that fails because the characteristic is gone (a stale OS cache)
+invalidates the profile, and the next attempt connects without it.
+
+Profiles are stored as JSON next to the user config (profiles.json),
+written on a background thread and only when a profile actually changed.
+"""
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Optional
+
+from config_store import DEFAULT_DEBOUNCE, DeferredWriter, atomic_write_json
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class DeviceProfile:
+    mac: str
+    service_uuid: Optional[str] = None
+    char_handle: Optional[int] = None
+    # True: write-with-response, False: write-without-response
+    write_response: Optional[bool] = None
+    # "public" or "random", when the backend reports it
+    address_type: Optional[str] = None
+    # Seconds the last successful connect took
+    connect_time: Optional[float] = None
+    updated: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DeviceProfile":
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def same_layout(self, other: "DeviceProfile") -> bool:
+        """True if other only differs in the bookkeeping (connect time, update time)."""
+        ignored = ("connect_time", "updated")
+        return all(getattr(self, f.name) == getattr(other, f.name) for f in fields(self) if f.name not in ignored)
+
+
+class ProfileStore:
+    """DeviceProfiles keyed by upper-case MAC, persisted to a JSON file (path=None keeps them in memory)."""
+
+    def __init__(self, path: str = None, debounce: float = DEFAULT_DEBOUNCE):
+        self.path = path
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._writer = DeferredWriter(self._write, debounce, name="profiles-writer") if path else None
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            _LOGGER.warning("Ignoring unreadable %s: %s", self.path, e)
+            return
+        for mac, entry in (data or {}).items():
+            try:
+                self._profiles[mac.upper()] = DeviceProfile.from_dict({**entry, "mac": mac.upper()})
+            except TypeError:
+                continue
+
+    def save(self):
+        """Write the profiles soon, on a background thread."""
+        if self._writer is not None:
+            self._writer.schedule()
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def _write(self):
+        with self._lock:
+            data = {mac: p.to_dict() for mac, p in self._profiles.items()}
+        try:
+            atomic_write_json(self.path, data, indent=1)
+        except OSError as e:
+            _LOGGER.warning("Could not save %s: %s", self.path, e)
+
+    def get(self, mac: str) -> Optional[DeviceProfile]:
+        return self._profiles.get(mac.strip().upper())
+
+    def put(self, profile: DeviceProfile):
+        profile.mac = profile.mac.upper()
+        profile.updated = time.time()
+        with self._lock:
+            old = self._profiles.get(profile.mac)
+            self._profiles[profile.mac] = profile
+        # Every connect puts one; only a changed layout is worth a write
+        if old is None or not old.same_layout(profile):
+            self.save()
+
+    def invalidate(self, mac: str):
+        with self._lock:
+            removed = self._profiles.pop(mac.strip().upper(), None)
+        if removed is not None:
+            _LOGGER.info("%s: cached GATT profile invalidated", mac)
+            self.save()
+
+    def __contains__(self, mac: str):
+        return mac.strip().upper() in self._profiles
+
+    def __len__(self):
+        return len(self._profiles)
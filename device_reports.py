@@ -0,0 +1,149 @@
+"""Reports pushed by switchers over notify/indicate, and the health cache.
+
+While a link is open, SwitcherSession subscribes to every notifying
+characteristic in the switch's own GATT service plus the standard Battery
+Level, and reads the battery level once. Each notification is parsed into
+a DeviceReport:
+
+- "state": the switch reported a channel's on/off. The payload uses the
+  same one-byte keys that are written (pyswitcherio ON_KEY1/OFF_KEY1/
+  ON_KEY2/OFF_KEY2; an observed, undocumented mapping). A state that no
+  command of ours is waiting for means the switch was pressed by hand;
+  SwitcherCore re-sends those as "press";
+- "battery": percentage from the Battery Level characteristic;
+- "raw": anything else, kept (and logged at DEBUG) so unknown firmware
+  reports can be looked at.
+
+HealthCache keeps the last battery level and report time per switcher in
+health.json next to the config, so the GUI, CLI and daemon can show them
+without connecting. It is written on a background thread, at most once
+every HEALTH_SAVE_INTERVAL seconds.
+"""
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from config_store import DeferredWriter, atomic_write_json
+
+_LOGGER = logging.getLogger(__name__)
+
+BATTERY_SERVICE_UUID = "0000180f-0000-1000-8000-00805f9b34fb"
+BATTERY_LEVEL_UUID = "00002a19-0000-1000-8000-00805f9b34fb"
+# Battery and press reports are batched into one health.json write per interval
+HEALTH_SAVE_INTERVAL = 5.0
+
+# payload -> (channel, wire-level action). Not from any vendor documentation: this
+# assumes the switch echoes the same one-byte keys it accepts (pyswitcherio's
+# ON_KEY1/OFF_KEY1/ON_KEY2/OFF_KEY2, i.e. connection_pool.command_key), which is
+# what has been observed. Report-derived state is therefore only displayed and
+# never used to skip a write (see StateStore.report).
+STATE_KEYS = {b"\x00": (1, "on"), b"\x01": (1, "off"), b"\x05": (2, "on"), b"\x03": (2, "off")}
+
+
+@dataclass(frozen=True)
+class DeviceReport:
+    kind: str  # "state", "press", "battery" or "raw"
+    mac: str
+    channel: Optional[int] = None
+    # Wire-level for reports from the session; user-level (invert applied) once SwitcherCore passes them on
+    state: Optional[str] = None
+    battery: Optional[int] = None
+    char: str = ""
+    data: bytes = b""
+    time: float = field(default_factory=time.monotonic)
+
+
+def parse_report(mac: str, char_uuid: str, data: bytes) -> DeviceReport:
+    char_uuid = str(char_uuid).lower()
+    data = bytes(data)
+    if char_uuid == BATTERY_LEVEL_UUID and data:
+        return DeviceReport("battery", mac, battery=min(100, data[0]), char=char_uuid, data=data)
+    entry = STATE_KEYS.get(data)
+    if entry is not None:
+        return DeviceReport("state", mac, channel=entry[0], state=entry[1], char=char_uuid, data=data)
+    _LOGGER.debug("%s: unrecognised report on %s: %s", mac, char_uuid, data.hex())
+    return DeviceReport("raw", mac, char=char_uuid, data=data)
+
+
+class HealthCache:
+    """Last battery level and report times per MAC; thread-safe, persisted to a JSON file (path=None: memory only)."""
+
+    def __init__(self, path: str = None, interval: float = HEALTH_SAVE_INTERVAL):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._writer = DeferredWriter(self._write, interval, name="health-writer") if path else None
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            _LOGGER.warning("Ignoring unreadable %s: %s", self.path, e)
+            return
+        for mac, entry in (data or {}).items():
+            if isinstance(entry, dict):
+                self._entries[mac.upper()] = dict(entry)
+
+    def save(self):
+        """Write soon, on a background thread (throttled)."""
+        if self._writer is not None:
+            self._writer.schedule()
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def _write(self):
+        with self._lock:
+            data = {mac: dict(e) for mac, e in self._entries.items()}
+        try:
+            atomic_write_json(self.path, data, indent=1)
+        except OSError as e:
+            _LOGGER.warning("Could not save %s: %s", self.path, e)
+
+    def update(self, report: DeviceReport):
+        """Record a report; only battery changes and presses are written to disk."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.setdefault(report.mac.upper(), {})
+            entry["last_report"] = now
+            changed = False
+            if report.kind == "battery":
+                changed = entry.get("battery") != report.battery
+                entry["battery"] = report.battery
+                entry["battery_at"] = now
+            elif report.kind == "press":
+                entry["presses"] = entry.get("presses", 0) + 1
+                entry["last_press"] = now
+                changed = True
+        if changed:
+            self.save()
+
+    def get(self, mac: str) -> dict:
+        with self._lock:
+            return dict(self._entries.get(mac.strip().upper(), {}))
+
+    def battery(self, mac: str) -> Optional[int]:
+        return self.get(mac).get("battery")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {mac: dict(e) for mac, e in self._entries.items()}
+
+
+def format_battery(entry: dict) -> str:
+    """Battery as "87%" ("-" when never reported), for status lines."""
+    battery = entry.get("battery")
+    return "-" if battery is None else f"{battery}%"
@@ -0,0 +1,94 @@
+"""Registry of configured switchers.
+
+The config used to hold a single mac/type/invert. It now also holds a
+"devices" list of {name, mac, type, invert}; configs without it are read as
+a one-device registry built from the legacy keys.
+"""
+from dataclasses import dataclass, asdict
+
+DEFAULT_DEVICE_NAME = "스위처 1"
+
+
+@dataclass
+class Device:
+    name: str
+    mac: str
+    type: int = 2  # 1 or 2 gang
+    invert: bool = False
+
+    @property
+    def channels(self):
+        return (1, 2) if self.type == 2 else (1,)
+
+    def wire_action(self, action: str) -> str:
+        """Translate the requested on/off into what must be written (invert setting)."""
+        if self.invert:
+            return "off" if action == "on" else "on"
+        return action
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Device":
+        return cls(
+            name=str(d.get("name") or d.get("mac", "")),
+            mac=str(d.get("mac", "")).strip(),
+            type=2 if d.get("type", 2) == 2 else 1,
+            invert=bool(d.get("invert", False)),
+        )
+
+
+class DeviceRegistry:
+    """Ordered collection of devices, keyed by name."""
+
+    def __init__(self, devices=()):
+        self._devices = {}
+        for d in devices:
+            self.put(d)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "DeviceRegistry":
+        entries = config.get("devices")
+        if isinstance(entries, list):
+            return cls(Device.from_dict(d) for d in entries if isinstance(d, dict) and d.get("mac"))
+        if config.get("mac"):
+            return cls([Device.from_dict({"name": DEFAULT_DEVICE_NAME, **config})])
+        return cls()
+
+    def to_config(self) -> list:
+        return [d.to_dict() for d in self._devices.values()]
+
+    def put(self, device: Device):
+        """Add a device or replace the one with the same name."""
+        self._devices[device.name] = device
+
+    def remove(self, name: str):
+        self._devices.pop(name, None)
+
+    def replace(self, other: "DeviceRegistry"):
+        """Take over other's devices, keeping this object (others hold references to it)."""
+        self._devices = dict(other._devices)
+
+    def get(self, name: str):
+        return self._devices.get(name)
+
+    def by_mac(self, mac: str):
+        mac = mac.strip().upper()
+        for d in self._devices.values():
+            if d.mac.upper() == mac:
+                return d
+        return None
+
+    def names(self):
+        return list(self._devices)
+
+    def __iter__(self):
+        return iter(list(self._devices.values()))
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __contains__(self, name):
+        return name in self._devices
+
@@ -0,0 +1,124 @@
+"""Streaming discovery of SWITCHER_M devices and a last-seen cache.
+
+stream_scan() reports each switcher the moment its first advertisement
+arrives instead of returning after a fixed discover() timeout. Every
+sighting lands in a DeviceCache, which SwitcherSession consults so that a
+MAC seen within the TTL is connected to directly, without another scan.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from bleak import BleakScanner
+
+_LOGGER = logging.getLogger(__name__)
+
+SWITCHER_NAME = "SWITCHER_M"
+DEFAULT_SCAN_TIMEOUT = 5.0
+# BlueZ/WinRT forget unseen devices after a couple of minutes; stay below that
+DEFAULT_CACHE_TTL = 90.0
+
+
+@dataclass
+class Sighting:
+    address: str
+    name: str
+    rssi: Optional[int]
+    last_seen: float
+    device: Any = None  # bleak BLEDevice, usable with BleakClient directly
+
+
+class DeviceCache:
+    """Last-seen/RSSI cache keyed by upper-case address, with TTL eviction."""
+
+    def __init__(self, ttl: float = DEFAULT_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+
+    def update(self, device, rssi=None, name=None) -> Sighting:
+        key = device.address.upper()
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is None:
+            entry = self._entries[key] = Sighting(key, name or device.name or "", rssi, now, device)
+        else:
+            entry.device = device
+            entry.last_seen = now
+            if rssi is not None:
+                entry.rssi = rssi
+            if name or device.name:
+                entry.name = name or device.name
+        return entry
+
+    def get(self, address: str) -> Optional[Sighting]:
+        key = address.strip().upper()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.last_seen > self.ttl:
+            del self._entries[key]
+            return None
+        return entry
+
+    def forget(self, address: str):
+        self._entries.pop(address.strip().upper(), None)
+
+    def evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [k for k, e in self._entries.items() if e.last_seen < cutoff]:
+            del self._entries[key]
+
+    def recent(self):
+        self.evict_expired()
+        return sorted(self._entries.values(), key=lambda e: e.last_seen, reverse=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+async def stream_scan(cache: DeviceCache, on_found=None, timeout: float = DEFAULT_SCAN_TIMEOUT,
+                      stop_event: Optional[asyncio.Event] = None, name_filter: str = SWITCHER_NAME,
+                      scanner_factory=None, telemetry=None):
+    """Scan for up to timeout seconds, calling on_found(sighting) per new match.
+
+    Returns the matching sightings in the order they were first seen. Set
+    stop_event to end the scan early (e.g. once the user picked a device).
+    scanner_factory(detection_callback) replaces BleakScanner, e.g. with
+    FakeTransport.scanner. With telemetry, the time to the first match is
+    recorded as "scan_first" and the whole scan as "scan_stream".
+    """
+    found = {}
+    started = time.monotonic()
+
+    def detected(device, adv):
+        name = device.name or getattr(adv, "local_name", None) or ""
+        if name_filter not in name:
+            return
+        sighting = cache.update(device, getattr(adv, "rssi", None), name)
+        if sighting.address not in found:
+            if not found and telemetry is not None:
+                telemetry.record("scan_first", time.monotonic() - started, sighting.address)
+            found[sighting.address] = sighting
+            if on_found is not None:
+                on_found(sighting)
+
+    if scanner_factory is None:
+        scanner = BleakScanner(detection_callback=detected)
+    else:
+        scanner = scanner_factory(detected)
+    await scanner.start()
+    try:
+        if stop_event is None:
+            await asyncio.sleep(timeout)
+        else:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await scanner.stop()
+        if telemetry is not None:
+            telemetry.record("scan_stream", time.monotonic() - started, found=len(found))
+    return list(found.values())
@@ -0,0 +1,64 @@
+"""A single long-lived asyncio loop running on a background thread.
+
+Every BLE operation (scans, connects, writes) runs on this one loop, so the
+bleak backend (BlueZ D-Bus connection / WinRT) is set up once per process
+instead of once per asyncio.run().
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class LoopThread:
+    def __init__(self, name: str = "ble-loop"):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        # Give cancelled tasks a chance to clean up before closing
+        pending = asyncio.all_tasks(self.loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.close()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop; returns a thread-safe Future.
+
+        The Tk mainloop should not block on the Future; it goes through
+        ui_bridge.OperationBridge instead.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Submit a coroutine and block for its result (workers, CLI and tests only)."""
+        return self.submit(coro).result(timeout)
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self, timeout: float = 5.0):
+        if not self.is_running:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
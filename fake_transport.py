@@ -0,0 +1,275 @@
+"""Simulated BLE switchers, for tests, benchmarks and the daemon's --fake mode.
+
+FakeTransport implements the same find_device()/client() pair as
+connection_pool.BleakTransport, plus scanner() for discovery.stream_scan.
+A LinkProfile describes how the simulated radio behaves: how long a scan
+takes to find the device, connect time, GATT discovery time (shorter when
+a remembered DeviceProfile narrows it to a services filter), write
+latency, and how often connects fail, writes fail or the link drops.
+Delays are drawn from a seeded RNG so runs are repeatable, and time_scale
+shrinks every delay uniformly for fast tests.
+
+With cached_services set, clients given a profile get the GATT table
+from an earlier discovery without discovering at all, like WinRT's
+use_cached_services, including its stale handles after a firmware
+update.
+
+Writes are decoded back into (channel, action) and applied to a
+FakeSwitcher, whose state and write log can be inspected. Subscribed
+clients get the new state back as a notification, and
+FakeSwitcher.press() simulates someone using the switch by hand.
+"""
+import asyncio
+import random
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+from bleak.exc import BleakCharacteristicNotFoundError
+
+from connection_pool import CHAR_UUID, command_key, normalize_mac
+from device_reports import BATTERY_LEVEL_UUID, BATTERY_SERVICE_UUID
+
+# payload -> (channel, action), the inverse of connection_pool.command_key
+KEY_ACTIONS = {command_key(ch, action): (ch, action) for ch in (1, 2) for action in ("on", "off")}
+SERVICE_UUID = "000015b0-0000-1000-8000-00805f9b34fb"
+
+
+@dataclass
+class LinkProfile:
+    """Timings are (mean, jitter) in seconds; jitter is uniform +/-."""
+    advertise: tuple = (0.2, 0.15)   # until the first advertisement is heard
+    connect: tuple = (0.05, 0.0)
+    # Full GATT service discovery, and one limited to the profile's services
+    discovery: tuple = (0.0, 0.0)
+    filtered_discovery: tuple = (0.0, 0.0)
+    write: tuple = (0.01, 0.0)
+    connect_failure_rate: float = 0.0
+    write_failure_rate: float = 0.0
+    drop_rate: float = 0.0           # chance the link drops right after a write
+
+
+# Roughly what a Windows/BlueZ laptop adapter sees a few metres from a switcher
+REALISTIC = LinkProfile(advertise=(0.6, 0.4), connect=(0.35, 0.15), discovery=(0.3, 0.1),
+                        filtered_discovery=(0.15, 0.05),
+                        write=(0.04, 0.02),
+                        connect_failure_rate=0.03, write_failure_rate=0.01, drop_rate=0.01)
+
+
+class FakeSwitcher:
+    def __init__(self, mac: str, name: str = "SWITCHER_M", rssi: int = -60):
+        self.mac = normalize_mac(mac)
+        self.name = name
+        self.rssi = rssi
+        self.in_range = True
+        self.state = {1: "off", 2: "off"}
+        self.writes = []
+        self.battery = 100
+        # Change to simulate a firmware update moving the characteristic
+        self.char_handle = 0x0010
+        # Connected clients with notifications on
+        self.subscribers = []
+        # Connected clients; like the real switcher it stops advertising while one is
+        self.links = []
+
+    @property
+    def connected(self) -> bool:
+        return bool(self.links)
+
+    def notify(self, uuid: str, data: bytes):
+        for client in list(self.subscribers):
+            client.notify(uuid, data)
+
+    def press(self, channel: int):
+        """Toggle a channel at the switch itself; subscribers are told."""
+        action = "off" if self.state[channel] == "on" else "on"
+        self.state[channel] = action
+        self.notify(CHAR_UUID, command_key(channel, action))
+
+
+class FakeServices:
+    """GATT table as the client sees it; a cached one may hold an outdated handle."""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.switch = SimpleNamespace(uuid=CHAR_UUID, handle=handle, service_uuid=SERVICE_UUID,
+                                      properties=["read", "write", "notify"])
+        self.battery = SimpleNamespace(uuid=BATTERY_LEVEL_UUID, handle=0x0030,
+                                       service_uuid=BATTERY_SERVICE_UUID, properties=["read", "notify"])
+
+    def __iter__(self):
+        yield SimpleNamespace(uuid=SERVICE_UUID, characteristics=[self.switch])
+        yield SimpleNamespace(uuid=BATTERY_SERVICE_UUID, characteristics=[self.battery])
+
+    def get_characteristic(self, specifier):
+        if specifier in (CHAR_UUID, self.handle):
+            return self.switch
+        return None
+
+
+class FakeClient:
+    def __init__(self, transport, switcher, disconnected_callback=None, profile=None):
+        self.transport = transport
+        self.switcher = switcher
+        self.disconnected_callback = disconnected_callback
+        self.device_profile = profile
+        self.is_connected = False
+        self.services = None
+        # uuid -> (characteristic, callback) for started notifications
+        self._notify = {}
+
+    async def connect(self):
+        t = self.transport
+        await t.sleep(t.profile.connect)
+        if not self.switcher.in_range or t.rng.random() < t.profile.connect_failure_rate:
+            t.connect_failures += 1
+            raise OSError(f"{self.switcher.mac}: simulated connect failure")
+        # Like BleakTransport: only the profile's service UUID is passed on, never its handle
+        filtered = self.device_profile is not None and self.device_profile.service_uuid
+        if filtered and t.cached_services and self.switcher.mac in t.gatt_cache:
+            # use_cached_services: the OS's table from an earlier connect, possibly outdated
+            self.services = FakeServices(t.gatt_cache[self.switcher.mac])
+        else:
+            if filtered:
+                await t.sleep(t.profile.filtered_discovery)
+                t.filtered_discoveries += 1
+            else:
+                await t.sleep(t.profile.discovery)
+                t.discoveries += 1
+            self.services = FakeServices(self.switcher.char_handle)
+            t.gatt_cache[self.switcher.mac] = self.switcher.char_handle
+        self.is_connected = True
+        self.switcher.links.append(self)
+        t.connects += 1
+
+    async def disconnect(self):
+        self.is_connected = False
+        self._unsubscribe()
+
+    def _unsubscribe(self):
+        if self in self.switcher.links:
+            self.switcher.links.remove(self)
+        self._notify.clear()
+        if self in self.switcher.subscribers:
+            self.switcher.subscribers.remove(self)
+
+    async def start_notify(self, char, callback):
+        if not self.is_connected:
+            raise OSError("Not connected")
+        self._notify[char.uuid] = (char, callback)
+        if self not in self.switcher.subscribers:
+            self.switcher.subscribers.append(self)
+
+    def notify(self, uuid: str, data: bytes):
+        entry = self._notify.get(uuid)
+        if entry is not None and self.is_connected:
+            self.transport.notifications += 1
+            entry[1](entry[0], bytearray(data))
+
+    async def read_gatt_char(self, char):
+        if not self.is_connected:
+            raise OSError("Not connected")
+        if getattr(char, "uuid", char) == BATTERY_LEVEL_UUID:
+            return bytearray([self.switcher.battery])
+        raise BleakCharacteristicNotFoundError(char)
+
+    def drop(self):
+        """Lose the link as if the switcher went out of range for a moment."""
+        if not self.is_connected:
+            return
+        self.is_connected = False
+        self._unsubscribe()
+        self.transport.drops += 1
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+    async def write_gatt_char(self, specifier, data, response=None):
+        t = self.transport
+        if not self.is_connected:
+            raise OSError("Not connected")
+        handle = getattr(specifier, "handle", specifier)
+        if handle != CHAR_UUID and handle != self.switcher.char_handle:
+            raise BleakCharacteristicNotFoundError(handle)
+        await t.sleep(t.profile.write)
+        if t.rng.random() < t.profile.write_failure_rate:
+            t.write_failures += 1
+            raise OSError(f"{self.switcher.mac}: simulated write failure")
+        channel, action = KEY_ACTIONS[bytes(data)]
+        self.switcher.state[channel] = action
+        self.switcher.writes.append((channel, action))
+        t.writes += 1
+        self.switcher.notify(CHAR_UUID, bytes(data))
+        if t.rng.random() < t.profile.drop_rate:
+            asyncio.get_running_loop().call_soon(self.drop)
+
+
+class FakeScanner:
+    """Stand-in for BleakScanner(detection_callback=...) driven by the transport's switchers."""
+
+    def __init__(self, transport, detection_callback=None):
+        self.transport = transport
+        self.detection_callback = detection_callback
+        self._tasks = []
+
+    async def start(self):
+        for switcher in self.transport.switchers.values():
+            if switcher.in_range:
+                self._tasks.append(asyncio.get_running_loop().create_task(self._advertise(switcher)))
+
+    async def _advertise(self, switcher):
+        await self.transport.sleep(self.transport.profile.advertise)
+        if switcher.connected:
+            return
+        device = SimpleNamespace(name=switcher.name, address=switcher.mac)
+        adv = SimpleNamespace(local_name=switcher.name, rssi=switcher.rssi)
+        if self.detection_callback is not None:
+            self.detection_callback(device, adv)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+
+
+class FakeTransport:
+    def __init__(self, macs=(), profile: LinkProfile = None, time_scale: float = 1.0, seed: int = 0):
+        self.profile = profile or LinkProfile()
+        self.time_scale = time_scale
+        self.rng = random.Random(seed)
+        self.switchers = {}
+        self.connects = 0
+        self.connect_failures = 0
+        self.discoveries = 0
+        self.filtered_discoveries = 0
+        # Windows-like: clients with a profile reuse gatt_cache (MAC -> handle) instead of discovering
+        self.cached_services = False
+        self.gatt_cache = {}
+        self.writes = 0
+        self.write_failures = 0
+        self.drops = 0
+        self.notifications = 0
+        for mac in macs:
+            self.add(mac)
+
+    def add(self, mac: str, name: str = "SWITCHER_M", rssi: int = -60) -> FakeSwitcher:
+        switcher = FakeSwitcher(mac, name, rssi)
+        self.switchers[switcher.mac] = switcher
+        return switcher
+
+    async def sleep(self, timing):
+        mean, jitter = timing
+        delay = max(0.0, mean + self.rng.uniform(-jitter, jitter)) * self.time_scale
+        await asyncio.sleep(delay)
+
+    async def find_device(self, mac: str, timeout: float):
+        switcher = self.switchers.get(normalize_mac(mac))
+        if switcher is None or not switcher.in_range:
+            await asyncio.sleep(timeout * self.time_scale)
+            return None
+        await self.sleep(self.profile.advertise)
+        return SimpleNamespace(name=switcher.name, address=switcher.mac)
+
+    def client(self, device, disconnected_callback, profile=None):
+        return FakeClient(self, self.switchers[normalize_mac(device.address)], disconnected_callback, profile)
+
+    def scanner(self, detection_callback=None):
+        return FakeScanner(self, detection_callback)
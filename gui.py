@@ -1,111 +1,101 @@
 import asyncio
-import json
 import logging
-import os
-import threading
+import queue
 import time
 import tkinter as tk
+from collections import deque
 from tkinter import messagebox
 
-from bleak import BleakScanner
-import pyswitcherio
-import sys
-import shutil
-
-# Resource helpers to support PyInstaller onefile as well as running from source
-def resource_path(relative_path: str) -> str:
-    """Return absolute path to resource; handles PyInstaller _MEIPASS when bundled."""
-    base = getattr(sys, '_MEIPASS', os.path.abspath(os.path.dirname(__file__)))
-    return os.path.join(base, relative_path)
-
-
-def get_user_config_path() -> str:
-    """Return the path to the writable user config in %APPDATA% (win) or XDG for others."""
-    if sys.platform == 'win32':
-        base = os.environ.get('APPDATA', os.path.expanduser("~"))
-    else:
-        base = os.environ.get('XDG_CONFIG_HOME', os.path.expanduser("~/.config"))
-    appdir = os.path.join(base, "IO-Switcher-Local")
-    os.makedirs(appdir, exist_ok=True)
-    return os.path.join(appdir, "config.json")
-
-
-def ensure_user_config() -> str:
-    """Ensure a writable user config exists. If missing, copy the bundled default config.json into user path."""
-    user_config = get_user_config_path()
-    if not os.path.exists(user_config):
-        bundled = resource_path('config.json')
-        try:
-            shutil.copyfile(bundled, user_config)
-        except Exception as e:
-            # Fall back to creating an empty/default config
-            try:
-                with open(user_config, 'w', encoding='utf-8') as f:
-                    json.dump({"mac": "", "type": 2, "invert": False}, f)
-            except Exception:
-                pass
-    return user_config
-
-# CONFIG_PATH is the writable config location we will read/write at runtime
-CONFIG_PATH = ensure_user_config()
-
-LOG_RETRY_MSG = "스위쳐 연결 실패. 다시 시도 남은 횟수"
-LOG_FAIL_MSG = "스위쳐 통신 실패.."
-
-
-class GuiLogHandler(logging.Handler):
-    def __init__(self, callback):
-        super().__init__()
-        self.callback = callback
-
-    def emit(self, record):
-        try:
-            msg = self.format(record)
-        except Exception:
-            msg = record.getMessage()
-        # Call the GUI callback in a thread-safe way
-        self.callback(msg)
+from devices import DEFAULT_DEVICE_NAME, Device
+from command_events import EventKind
+from config_store import ConfigError, ConfigStore, set_aside
+from device_reports import format_battery
+from log_pipeline import QueueLogHandler
+from scheduler import ScheduleRule
+from telemetry import format_stats
+from tray import HotkeyListener, TrayIcon, load_hotkeys, run_hotkey
+from ui_bridge import OperationBridge, TkWaker
+# Re-exported for existing callers of gui.resource_path & co.
+from switcher_core import (SwitcherCore, ensure_user_config, get_user_config_path,
+                           load_config, resource_path, write_config)
+
+# Status text shown for each step reported by the command path
+EVENT_STATUS = {
+    EventKind.CONNECTED: "스위쳐 연결 완료!",
+    EventKind.WRITTEN: "키 전송 완료",
+    EventKind.ACKNOWLEDGED: "작업 성공",
+    EventKind.RETRYING: "스위쳐 연결 실패. 다시 시도 중... ({attempt})",
+    EventKind.FAILED: "스위쳐 통신 실패..",
+}
+
+
+# Queued log lines and status text are applied to the widgets at this rate
+UI_FRAME_MS = 50
+# Lines kept for the log window
+LOG_VIEW_LINES = 500
+# Shown on the dashboard's per-channel toggle buttons
+STATE_TEXT = {"on": "ON", "off": "OFF", None: "?"}
 
 
 class SwitchApp:
-    def __init__(self, root):
+    def __init__(self, root, transport=None):
+        # Nothing here imports the BLE stack (bleak, pyswitcherio): the window
+        # is shown first and the core loads it in the background
         self.root = root
         self.root.title("I/O 스위처 로컬")
 
-        # load config
-        self.config = self._load_config()
-        self.mac_var = tk.StringVar(value=self.config.get("mac", ""))
-        self.type_var = tk.IntVar(value=self.config.get("type", 2))  # 1 or 2
-        self.invert_var = tk.IntVar(value=1 if self.config.get("invert", False) else 0)
+        # load config; edits are saved in the background and external edits
+        # (CLI, daemon, another window) are picked up while running
+        self.config_path = ensure_user_config()
+        self.config_store = self._load_config()
+        self.config = self.config_store.snapshot()
+        # BLE loop, connection pool and device registry (shared with the CLI)
+        self.core = SwitcherCore(self.config, transport=transport).start()
+        self.loop = self.core.loop
+        # All configured switchers; the editor below shows the selected one
+        self.registry = self.core.registry
+        names = self.registry.names()
+        selected = self.config.get("selected")
+        if selected not in self.registry:
+            selected = names[0] if names else DEFAULT_DEVICE_NAME
+        current = self.registry.get(selected) or Device(name=selected, mac="")
+        self.name_var = tk.StringVar(value=current.name)
+        self.mac_var = tk.StringVar(value=current.mac)
+        self.type_var = tk.IntVar(value=current.type)  # 1 or 2
+        self.invert_var = tk.IntVar(value=1 if current.invert else 0)
 
         # UI
         frame = tk.Frame(root, padx=10, pady=10)
         frame.pack(fill=tk.BOTH, expand=True)
 
-        tk.Label(frame, text="스위처 MAC 주소:").grid(row=0, column=0, sticky="w")
+        tk.Label(frame, text="스위처 이름:").grid(row=0, column=0, sticky="w")
+        self.name_entry = tk.Entry(frame, textvariable=self.name_var, width=30)
+        self.name_entry.grid(row=0, column=1, sticky="w")
+
+        tk.Label(frame, text="스위처 MAC 주소:").grid(row=1, column=0, sticky="w")
         self.mac_entry = tk.Entry(frame, textvariable=self.mac_var, width=30)
-        self.mac_entry.grid(row=0, column=1, sticky="w")
-        tk.Button(frame, text="스위처 저장", command=self.save_mac).grid(row=0, column=2, padx=5)
+        self.mac_entry.grid(row=1, column=1, sticky="w")
+        tk.Button(frame, text="스위처 저장", command=self.save_mac).grid(row=1, column=2, padx=5)
         self.find_devices_btn = tk.Button(frame, text="스위처 찾기", command=self.find_devices)
-        self.find_devices_btn.grid(row=0, column=3, padx=5)
+        self.find_devices_btn.grid(row=1, column=3, padx=5)
 
         self.type_check = tk.Checkbutton(frame, text="2구 스위처 (체크: 2구, 해제: 1구)", variable=self.type_var, onvalue=2, offvalue=1, command=self.on_type_change)
-        self.type_check.grid(row=1, column=0, columnspan=3, sticky="w", pady=(8, 0))
+        self.type_check.grid(row=2, column=0, columnspan=3, sticky="w", pady=(8, 0))
 
         self.invert_check = tk.Checkbutton(frame, text="ON/OFF 반대로 작동", variable=self.invert_var, command=self.on_invert_change)
-        self.invert_check.grid(row=2, column=0, columnspan=3, sticky="w", pady=(4, 10))
+        self.invert_check.grid(row=3, column=0, columnspan=3, sticky="w", pady=(4, 10))
 
         # Switch controls
         # Replace checkboxes with independent ON/OFF buttons (always available to press)
         self.switch1_on_btn = tk.Button(frame, text="스위치1 ON", width=12, command=lambda: self.on_action(1, "on"))
-        self.switch1_on_btn.grid(row=3, column=0, sticky="w")
+        self.switch1_on_btn.grid(row=4, column=0, sticky="w")
         self.switch1_off_btn = tk.Button(frame, text="스위치1 OFF", width=12, command=lambda: self.on_action(1, "off"))
-        self.switch1_off_btn.grid(row=3, column=1, sticky="w")
+        self.switch1_off_btn.grid(row=4, column=1, sticky="w")
 
         self.switch2_on_btn = tk.Button(frame, text="스위치2 ON", width=12, command=lambda: self.on_action(2, "on"))
-        self.switch2_on_btn.grid(row=3, column=2, sticky="w")
+        self.switch2_on_btn.grid(row=4, column=2, sticky="w")
         self.switch2_off_btn = tk.Button(frame, text="스위치2 OFF", width=12, command=lambda: self.on_action(2, "off"))
-        self.switch2_off_btn.grid(row=3, column=3, sticky="w")
+        self.switch2_off_btn.grid(row=4, column=3, sticky="w")
 
         # Initially hide switch2 buttons if type is 1
         if self.type_var.get() == 1:
@@ -113,48 +103,128 @@ class SwitchApp:
             self.switch2_off_btn.grid_remove()
 
         self.status_label = tk.Label(frame, text="", fg="blue")
-        self.status_label.grid(row=4, column=0, columnspan=4, sticky="w", pady=(10, 0))
-
-        # Logging setup
-        self.log_handler = GuiLogHandler(self.on_log_message)
-        self.log_handler.setLevel(logging.DEBUG)
-        formatter = logging.Formatter("%(message)s")
-        self.log_handler.setFormatter(formatter)
+        self.status_label.grid(row=5, column=0, columnspan=4, sticky="w", pady=(10, 0))
+
+        # Dashboard: every registered switcher, plus group actions
+        self.dashboard = tk.LabelFrame(frame, text="전체 스위처", padx=6, pady=6)
+        self.dashboard.grid(row=6, column=0, columnspan=4, sticky="we", pady=(10, 0))
+        self._dashboard_rows = tk.Frame(self.dashboard)
+        # (MAC, channel) -> toggle button showing that channel's state
+        self._state_buttons = {}
+        self._battery_labels = {}
+        self._dashboard_rows.pack(fill=tk.X)
+        group_frame = tk.Frame(self.dashboard)
+        group_frame.pack(fill=tk.X, pady=(6, 0))
+        tk.Button(group_frame, text="전체 OFF", width=10, command=lambda: self.on_group_action("off")).pack(side=tk.RIGHT)
+        tk.Button(group_frame, text="전체 ON", width=10, command=lambda: self.on_group_action("on")).pack(side=tk.RIGHT, padx=4)
+        tk.Button(group_frame, text="통계", width=6, command=self.show_stats).pack(side=tk.LEFT)
+        tk.Button(group_frame, text="로그", width=6, command=self.show_log).pack(side=tk.LEFT, padx=4)
+        tk.Button(group_frame, text="예약", width=6, command=self.show_schedules).pack(side=tk.LEFT)
+        # One button per scene from config["scenes"] (see scenes.py)
+        self._scene_frame = tk.Frame(self.dashboard)
+        self._scene_frame.pack(fill=tk.X, pady=(6, 0))
+        self._refresh_dashboard()
+
+        # Logging: worker threads enqueue, the Tk thread drains once per frame.
+        # "log_levels" in config.json (e.g. {"bleak": "DEBUG"}) lets more through.
+        self.log_handler = QueueLogHandler(self.config.get("log_levels"))
+        self.log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s", "%H:%M:%S"))
         logging.getLogger().addHandler(self.log_handler)
-        logging.getLogger().setLevel(logging.DEBUG)
-
-        # For monitoring log-based success/failure criteria
-        self.monitor_lock = threading.Lock()
-        self.current_monitor = None  # dict or None
-
-        # Keep a reference to ioswitcher object per current operation
-        self._operation_thread = None
-
-        # Save config on close
-        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
-
-    def _load_config(self):
+        logging.getLogger().setLevel(self.log_handler.min_level)
+        self._log_lines = deque(maxlen=LOG_VIEW_LINES)
+        self._log_window = None
+        # Latest status text, applied on the next frame (intermediate ones are skipped)
+        self._status_text = None
+        self._status_error = False
+        # Channel state changes (reported on the BLE loop) shown on the next frame
+        self._state_changes = queue.SimpleQueue()
+        self.core.state.add_listener(lambda *change: self._state_changes.put(change))
+        # Presses at the switch and battery reports, shown on the next frame
+        self._reports = queue.SimpleQueue()
+        self.core.add_report_listener(self._reports.put)
+        # Configs reloaded after an external edit, applied on the next frame
+        self._config_changes = queue.SimpleQueue()
+        # Callables handed over from other threads (call_soon), run on the next frame
+        self._requests = queue.SimpleQueue()
+        self.config_store.watch(self._config_changes.put)
+        self.root.after(UI_FRAME_MS, self._pump_ui)
+
+        # BLE operations in flight; each finishes with one wakeup of the Tk loop
+        self._waker = TkWaker(self.root, self._dispatch_ops)
+        self.ops = OperationBridge(self.loop, self._waker)
+        # Timed actions from config["schedules"] run on the BLE loop
+        self.core.start_scheduler()
+        # Idle callbacks run after the pending redraws, i.e. once the window has painted
+        self.root.after_idle(self.core.preload)
+        # Optional background presence scan (config "presence"), also once painted
+        self.root.after_idle(self.core.start_presence)
+
+        # Optional tray icon (config "tray") and global hotkeys (config "hotkeys");
+        # the tray menu runs on its own thread and hands its requests to call_soon()
+        self.tray = TrayIcon("I/O 스위처 로컬", resource_path("icon.ico"),
+                             on_show=lambda: self.call_soon(self.show_window),
+                             on_quit=lambda: self.call_soon(self.on_close),
+                             items=self._tray_items)
+        self.hotkeys = HotkeyListener(self._on_hotkey)
+        self.root.after_idle(self._configure_background)
+
+        # Closing hides to the tray when it is on, otherwise saves config and quits
+        self.root.protocol("WM_DELETE_WINDOW", self.on_window_close)
+
+    def _load_config(self) -> ConfigStore:
         try:
-            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {}
-
-    def save_config(self):
-        try:
-            with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-                json.dump({
-                    "mac": self.mac_var.get(),
-                    "type": self.type_var.get(),
-                    "invert": bool(self.invert_var.get()),
-                }, f)
-        except Exception as e:
-            print("Failed to save config:", e)
+            return ConfigStore(self.config_path)
+        except ConfigError as e:
+            # Keep the broken file for the user and start from defaults
+            try:
+                backup = set_aside(self.config_path)
+            except OSError:
+                backup = None
+            messagebox.showwarning(
+                "설정 오류",
+                f"설정 파일을 읽을 수 없어 기본값으로 시작합니다.\n{e}"
+                + (f"\n\n기존 파일: {backup}" if backup else ""))
+            return ConfigStore(self.config_path)
+
+    def save_config(self, schedules: list = None):
+        # Only changed keys are written, off the Tk thread and after a short debounce.
+        # Schedules stay as the store has them (maybe edited by switcherctl) unless
+        # given: the live scheduler may not have picked up an external edit yet.
+        changes = {"selected": self.name_var.get().strip(), "devices": self.registry.to_config()}
+        if schedules is not None:
+            changes["schedules"] = schedules
+        self.config_store.update(changes)
+        self.config = self.config_store.snapshot()
+
+    def _apply_external_config(self, config: dict):
+        self.config = config
+        self.core.apply_config(config)
+        name = self.name_var.get().strip()
+        if name in self.registry:
+            # Just show it: saving here would write back what we were handed
+            self._select_device(name, save=False)
+        self._refresh_dashboard()
+        self._configure_background()
+
+    def _current_device(self) -> Device:
+        return Device(
+            name=self.name_var.get().strip() or self.mac_var.get().strip(),
+            mac=self.mac_var.get().strip(),
+            type=self.type_var.get(),
+            invert=bool(self.invert_var.get()),
+        )
+
+    def _store_current_device(self):
+        # Add or update the edited switcher in the registry (only once it has a MAC)
+        device = self._current_device()
+        if device.mac:
+            self.registry.put(device)
+            self._refresh_dashboard()
 
     def save_mac(self):
-        # Just save current config to disk
+        self._store_current_device()
         self.save_config()
-        self.status_label.config(text="MAC saved.")
+        self._set_status("MAC saved.")
 
     def on_type_change(self):
         if self.type_var.get() == 1:
@@ -163,23 +233,105 @@ class SwitchApp:
         else:
             self.switch2_on_btn.grid()
             self.switch2_off_btn.grid()
+        if self.name_var.get().strip() in self.registry:
+            self._store_current_device()
         self.save_config()
 
     def on_invert_change(self):
+        if self.name_var.get().strip() in self.registry:
+            self._store_current_device()
+        self.save_config()
+
+    def _refresh_dashboard(self):
+        self._refresh_scenes()
+        for c in self._dashboard_rows.winfo_children():
+            c.destroy()
+        self._state_buttons = {}
+        self._battery_labels = {}
+        if not len(self.registry):
+            tk.Label(self._dashboard_rows, text="저장된 스위처가 없습니다.").pack(anchor="w")
+            return
+        for device in self.registry:
+            row = tk.Frame(self._dashboard_rows)
+            row.pack(fill=tk.X, pady=1)
+            tk.Label(row, text=device.name, width=14, anchor="w").pack(side=tk.LEFT)
+            tk.Label(row, text=device.mac, width=18, anchor="w").pack(side=tk.LEFT)
+            # Last reported battery level; updated when the switch reports it
+            battery = tk.Label(row, text=format_battery(self.core.health.get(device.mac)), width=5, anchor="e")
+            battery.pack(side=tk.LEFT)
+            self._battery_labels[device.mac.upper()] = battery
+            for ch in device.channels:
+                toggle = tk.Button(row, width=6, command=lambda n=device.name, c=ch: self.on_device_action(n, c, "toggle"))
+                toggle.pack(side=tk.LEFT, padx=(6, 0))
+                self._state_buttons[(device.mac.upper(), ch)] = toggle
+                self._show_channel_state(device.mac, ch)
+                tk.Button(row, text=f"{ch} ON", width=5,
+                          command=lambda n=device.name, c=ch: self.on_device_action(n, c, "on")).pack(side=tk.LEFT)
+                tk.Button(row, text=f"{ch} OFF", width=5,
+                          command=lambda n=device.name, c=ch: self.on_device_action(n, c, "off")).pack(side=tk.LEFT)
+            tk.Button(row, text="삭제", command=lambda n=device.name: self._remove_device(n)).pack(side=tk.RIGHT)
+            tk.Button(row, text="선택", command=lambda n=device.name: self._select_device(n)).pack(side=tk.RIGHT, padx=4)
+
+    def _refresh_scenes(self):
+        for c in self._scene_frame.winfo_children():
+            c.destroy()
+        if not self.core.scenes:
+            return
+        tk.Label(self._scene_frame, text="장면").pack(side=tk.LEFT)
+        for name in self.core.scenes:
+            tk.Button(self._scene_frame, text=name, command=lambda n=name: self.on_scene(n)).pack(side=tk.LEFT, padx=(4, 0))
+
+    def on_scene(self, name: str):
+        self._set_status(f"장면 {name} 실행 중...")
+        self.ops.run(lambda post: self.core.run_scene(name, on_event=post), self._on_scene_done,
+                     on_event=self._handle_command_event, kind="scene")
+
+    def _on_scene_done(self, fut):
+        try:
+            result = fut.result()
+        except Exception as e:
+            self._on_operation_failed(f"Exception: {e}")
+            return
+        self._set_status(result.summary(), error=not result.ok)
+
+    def _select_device(self, name: str, save: bool = True):
+        device = self.registry.get(name)
+        if device is None:
+            return
+        self.name_var.set(device.name)
+        self.mac_var.set(device.mac)
+        self.type_var.set(device.type)
+        self.invert_var.set(1 if device.invert else 0)
+        if device.type == 1:
+            self.switch2_on_btn.grid_remove()
+            self.switch2_off_btn.grid_remove()
+        else:
+            self.switch2_on_btn.grid()
+            self.switch2_off_btn.grid()
+        if save:
+            self.save_config()
+
+    def _remove_device(self, name: str):
+        self.registry.remove(name)
+        self._refresh_dashboard()
         self.save_config()
 
     def find_devices(self):
         # Open a small scanning window and start scanning in background
         if getattr(self, '_scan_window', None):
             return
+        # Normally already loaded by core.preload()
+        from discovery import SWITCHER_NAME
+
         self._scan_window = tk.Toplevel(self.root)
         self._scan_window.title('Find SWITCHER_M devices')
         self._scan_window.geometry('420x300')
         self._scan_window.transient(self.root)
         self._scan_window.grab_set()
 
-        lbl = tk.Label(self._scan_window, text='Scanning for devices named "SWITCHER_M"...')
+        lbl = tk.Label(self._scan_window, text=f'Scanning for devices named "{SWITCHER_NAME}"...')
         lbl.pack(anchor='w', padx=8, pady=(8, 0))
+        self._scan_label = lbl
         self._scan_results_frame = tk.Frame(self._scan_window)
         self._scan_results_frame.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
 
@@ -192,12 +344,17 @@ class SwitchApp:
             self.find_devices_btn.config(state=tk.DISABLED)
         except Exception:
             pass
-        # start background scan
-        t = threading.Thread(target=self._do_scan, args=(lbl,))
-        t.daemon = True
-        t.start()
+        # start background scan on the shared loop; hits stream in as they are seen
+        stop = self._scan_stop = asyncio.Event()
+        self.ops.run(lambda post: self._do_scan(post, stop), self._on_scan_done,
+                     on_event=self._add_scan_result, kind="scan")
 
     def _close_scan_window(self):
+        # End a running scan early; no need to wait out the timeout
+        stop = getattr(self, '_scan_stop', None)
+        if stop is not None:
+            self.loop.call_soon(stop.set)
+            self._scan_stop = None
         if getattr(self, '_scan_window', None):
             try:
                 self._scan_window.grab_release()
@@ -210,24 +367,42 @@ class SwitchApp:
         except Exception:
             pass
 
-    def _do_scan(self, status_label):
+    async def _do_scan(self, on_found, stop_event):
+        from discovery import stream_scan
+
+        # With several adapters, all of them scan (and learn each switcher's RSSI)
+        scanner_factory = getattr(self.core.pool.transport, "scanner", None)
+        sightings = await stream_scan(self.core.pool.cache, on_found, timeout=5.0, stop_event=stop_event,
+                                      scanner_factory=scanner_factory,
+                                      telemetry=self.core.telemetry)
+        return [(s.name, s.address) for s in sightings]
+
+    def _on_scan_done(self, fut):
+        self._scan_stop = None
         try:
-            maybe = BleakScanner.discover(timeout=5.0)
-            if asyncio.iscoroutine(maybe):
-                devices = asyncio.run(maybe)
-            else:
-                devices = maybe
+            results = fut.result()
         except Exception as e:
-            err = f"Scan error: {e}"
-            self.root.after(1, lambda: self._show_scan_error(err))
+            self._show_scan_error(f"Scan error: {e}")
+            return
+        if not results:
+            self._show_scan_results(results)
             return
-        # filter devices whose name matches SWITCHER_M
-        results = []
-        for d in devices:
-            name = d.name or ''
-            if 'SWITCHER_M' in name:
-                results.append((name, d.address))
-        self.root.after(1, lambda: self._show_scan_results(results))
+        # Rows were already added while scanning
+        if getattr(self, '_scan_window', None):
+            self._scan_label.config(text=f'Scan complete: {len(results)} device(s) found.')
+        try:
+            self.find_devices_btn.config(state=tk.NORMAL)
+        except Exception:
+            pass
+
+    def _add_scan_result(self, sighting):
+        if not getattr(self, '_scan_window', None):
+            return
+        self._scan_row(self._scan_results_frame, sighting.name, sighting.address, sighting.rssi)
+
+    def _dispatch_ops(self):
+        # Tk thread, on the waker's event: run completion/progress callbacks
+        self.ops.dispatch()
 
     def _show_scan_error(self, msg: str):
         if getattr(self, '_scan_window', None):
@@ -255,17 +430,22 @@ class SwitchApp:
                 pass
             return
         for name, addr in results:
-            row = tk.Frame(frame)
-            row.pack(fill=tk.X, pady=2)
-            tk.Label(row, text=f"{name}", width=22, anchor='w').pack(side=tk.LEFT)
-            tk.Label(row, text=addr, width=20, anchor='w').pack(side=tk.LEFT, padx=(4,8))
-            tk.Button(row, text='Copy', command=lambda a=addr: self._copy_to_clipboard(a)).pack(side=tk.RIGHT, padx=4)
-            tk.Button(row, text='Use', command=lambda a=addr: self._use_mac(a)).pack(side=tk.RIGHT)
+            self._scan_row(frame, name, addr)
         try:
             self.find_devices_btn.config(state=tk.NORMAL)
         except Exception:
             pass
 
+    def _scan_row(self, frame, name: str, addr: str, rssi=None):
+        row = tk.Frame(frame)
+        row.pack(fill=tk.X, pady=2)
+        tk.Label(row, text=f"{name}", width=22, anchor='w').pack(side=tk.LEFT)
+        tk.Label(row, text=addr, width=20, anchor='w').pack(side=tk.LEFT, padx=(4,8))
+        if rssi is not None:
+            tk.Label(row, text=f"{rssi} dBm", anchor='w').pack(side=tk.LEFT)
+        tk.Button(row, text='Copy', command=lambda a=addr: self._copy_to_clipboard(a)).pack(side=tk.RIGHT, padx=4)
+        tk.Button(row, text='Use', command=lambda a=addr: self._use_mac(a)).pack(side=tk.RIGHT)
+
     def _copy_to_clipboard(self, addr: str):
         try:
             self.root.clipboard_clear()
@@ -275,157 +455,381 @@ class SwitchApp:
 
     def _use_mac(self, addr: str):
         self.mac_var.set(addr)
+        self._store_current_device()
         self.save_config()
-        self.status_label.config(text=f"MAC set to {addr}")
+        self._set_status(f"MAC set to {addr}")
         self._close_scan_window()
 
-    def on_log_message(self, message: str):
-        # This may be called from non-main threads; schedule into mainloop
-        self.root.after(1, lambda: self._handle_log_message(message))
-
-    def _handle_log_message(self, message: str):
-        # Update status label with latest library log
-        self.status_label.config(text=message)
+    def _set_status(self, text: str, error: bool = False):
+        self._status_text = text
+        self._status_error = error
 
-        with self.monitor_lock:
-            if self.current_monitor is None:
-                return
-            m = self.current_monitor
-            m["last_log_time"] = time.time()
-            # check for messages
-            if LOG_FAIL_MSG in message:
-                m["seen_fail"] = True
-            if LOG_RETRY_MSG in message:
-                m["seen_retry"] = True
-
-    def start_monitor(self, operation_desc: str):
-        with self.monitor_lock:
-            monitor_id = time.time()
-            self.current_monitor = {
-                "id": monitor_id,
-                "start": time.time(),
-                "last_log_time": None,
-                "seen_retry": False,
-                "seen_fail": False,
-                "operation": operation_desc,
-            }
-        # start checker loop
-        self._monitor_check()
-
-    def _monitor_check(self):
-        with self.monitor_lock:
-            m = self.current_monitor
-        if m is None:
+    def _show_channel_state(self, mac: str, channel: int):
+        button = self._state_buttons.get((mac.upper(), channel))
+        if button is None:
             return
-        now = time.time()
-        # If we've seen a failure message, report failure
-        if m["seen_fail"]:
-            self._on_operation_failed("스위쳐 통신 실패.. 메시지 감지")
-            with self.monitor_lock:
-                self.current_monitor = None
+        state = self.core.state.get(mac, channel)
+        pending = self.core.state.is_pending(mac, channel)
+        # Pending (optimistic) states are grey until the switch confirms them
+        button.config(text=f"{channel}: {STATE_TEXT[state]}",
+                      fg="gray" if pending else ("green" if state == "on" else "black"))
+
+    def _show_report(self, report):
+        device = self.registry.by_mac(report.mac)
+        name = device.name if device is not None else report.mac
+        if report.kind == "battery":
+            label = self._battery_labels.get(report.mac.upper())
+            if label is not None:
+                label.config(text=format_battery({"battery": report.battery}))
+        elif report.kind == "press":
+            self._set_status(f"[{name}] 스위치에서 직접 {report.channel}번 {STATE_TEXT[report.state]}")
+
+    def _pump_ui(self):
+        # One batch of log lines and at most one status update per frame
+        lines = self.log_handler.drain()
+        if lines:
+            self._log_lines.extend(lines)
+            if self._log_window is not None:
+                self._append_log_view(lines)
+            errors = [line for line in lines if line.level >= logging.ERROR]
+            if errors and self._status_text is None:
+                self._set_status(errors[-1].text, error=True)
+        changed = set()
+        while True:
+            try:
+                mac, channel, _state, _pending = self._state_changes.get_nowait()
+            except queue.Empty:
+                break
+            changed.add((mac, channel))
+        for mac, channel in changed:
+            self._show_channel_state(mac, channel)
+        while True:
+            try:
+                self._show_report(self._reports.get_nowait())
+            except queue.Empty:
+                break
+        config = None
+        while True:
+            try:
+                config = self._config_changes.get_nowait()
+            except queue.Empty:
+                break
+        if config is not None:
+            self._apply_external_config(config)
+        while True:
+            try:
+                self._requests.get_nowait()()
+            except queue.Empty:
+                break
+        if self._status_text is not None:
+            self.status_label.config(text=self._status_text, fg="red" if self._status_error else "blue")
+            self._status_text = None
+        self._status_error = False
+        # Fallback only: results are delivered by TkWaker's event, which is
+        # missed when event_generate fails (Tcl without threads, or no
+        # mainloop running yet, e.g. tests driving root.update()). Only a
+        # wake that is still outstanding here is dispatched by the frame.
+        if self.ops.wake_outstanding:
+            self.ops.dispatch()
+        self.root.after(UI_FRAME_MS, self._pump_ui)
+
+    def show_log(self):
+        if self._log_window is not None:
+            self._log_window.lift()
             return
-        # If we've seen retry message and we have not received logs for >=0.5s -> success
-        if m["seen_retry"]:
-            last = m["last_log_time"] or m["start"]
-            if now - last >= 0.5:
-                # Consider success, no UI needed as per requirement
-                with self.monitor_lock:
-                    self.current_monitor = None
-                self._on_operation_success()
-                return
-        # Continue checking
-        self.root.after(100, self._monitor_check)
+        self._log_window = tk.Toplevel(self.root)
+        self._log_window.title('로그')
+        scroll = tk.Scrollbar(self._log_window)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self._log_text = tk.Text(self._log_window, width=100, height=25, yscrollcommand=scroll.set)
+        self._log_text.pack(fill=tk.BOTH, expand=True)
+        scroll.config(command=self._log_text.yview)
+        self._log_window.protocol("WM_DELETE_WINDOW", self._close_log)
+        self._append_log_view(self._log_lines)
+
+    def _append_log_view(self, lines):
+        at_end = self._log_text.yview()[1] >= 0.999
+        self._log_text.insert(tk.END, "".join(line.message + "\n" for line in lines))
+        # Keep the widget within the same cap as the ring buffer
+        excess = int(self._log_text.index("end-1c").split(".")[0]) - 1 - LOG_VIEW_LINES
+        if excess > 0:
+            self._log_text.delete("1.0", f"{excess + 1}.0")
+        if at_end:
+            self._log_text.see(tk.END)
+
+    def _close_log(self):
+        self._log_window.destroy()
+        self._log_window = None
+
+    def _handle_command_event(self, event):
+        text = EVENT_STATUS[event.kind].format(attempt=event.attempt + 1)
+        device = self.registry.by_mac(event.mac)
+        if device is not None and len(self.registry) > 1:
+            text = f"[{device.name}] {text}"
+        self._set_status(text)
 
     def _on_operation_success(self):
-        # No explicit notification required. Re-enable controls.
-        self._enable_controls()
-        self.status_label.config(text="작업 성공 (로그 기준)")
+        # No explicit notification required.
+        self._set_status("작업 성공")
 
     def _on_operation_failed(self, reason: str):
-        self._enable_controls()
-        # No checkbox state to revert (buttons are stateless)
-        self.status_label.config(text=f"실패: {reason}")
-        # show simple message dialog
-        messagebox.showerror("Operation Failed", "스위쳐 통신 실패..")
-
-    def _disable_controls(self):
-        self.switch1_on_btn.config(state=tk.DISABLED)
-        self.switch1_off_btn.config(state=tk.DISABLED)
-        self.switch2_on_btn.config(state=tk.DISABLED)
-        self.switch2_off_btn.config(state=tk.DISABLED)
-        self.mac_entry.config(state=tk.DISABLED)
-        self.type_check.config(state=tk.DISABLED)
-        self.invert_check.config(state=tk.DISABLED)
-
-    def _enable_controls(self):
-        self.switch1_on_btn.config(state=tk.NORMAL)
-        self.switch1_off_btn.config(state=tk.NORMAL)
-        if self.type_var.get() == 2:
-            self.switch2_on_btn.config(state=tk.NORMAL)
-            self.switch2_off_btn.config(state=tk.NORMAL)
-        self.mac_entry.config(state=tk.NORMAL)
-        self.type_check.config(state=tk.NORMAL)
-        self.invert_check.config(state=tk.NORMAL)
+        # The channel's state was already rolled back by the state store.
+        # Shown in the status line rather than a modal dialog, so other
+        # switchers stay usable while one is unreachable.
+        self._set_status(f"실패: {reason}", error=True)
 
     def on_action(self, switch_index: int, action: str):
-        mac = self.mac_var.get().strip()
-        if not mac:
+        device = self._current_device()
+        if not device.mac:
             messagebox.showwarning("No MAC", "MAC 주소를 입력하고 저장하세요.")
             return
-        invert = bool(self.invert_var.get())
-        # Apply invert setting: if invert then flip the requested action
-        if invert:
-            action = "off" if action == "on" else "on"
-        # Disable controls during operation
-        self._disable_controls()
-        # Start log monitor for this operation
-        desc = f"switch{switch_index}_{action}"
-        self.start_monitor(desc)
-        # Run operation in background thread
-        t = threading.Thread(target=self._run_switch_command, args=(mac, self.type_var.get(), switch_index, action))
-        t.daemon = True
-        t.start()
-        self._operation_thread = t
-
-    def _run_switch_command(self, mac: str, type_num: int, switch_index: int, action: str):
-        # Ensure switch_index maps to the channel type for IOSwitcher
-        # (IOSwitcher uses the 'type' parameter to select channel/key for 1 or 2)
-        if switch_index == 2 and type_num == 1:
+        # Controls stay enabled: commands are queued per device and
+        # superseded presses on the same channel are coalesced
+        self._run_switch_command(device, switch_index, action)
+
+    def _run_switch_command(self, device: Device, switch_index: int, action: str):
+        if switch_index not in device.channels:
             # shouldn't happen because UI hides switch2 when type==1, but guard anyway
-            msg = "Device configured as 1구인데 Switch 2를 작동하려고 했습니다."
-            self.root.after(1, lambda msg=msg: self._on_operation_failed(msg))
+            self._on_operation_failed("Device configured as 1구인데 Switch 2를 작동하려고 했습니다.")
+            return
+        # User-level on/off/toggle: the core applies invert and tracks the
+        # channel's state. Reuses the warm connection if one is open.
+        # Its own operation, so overlapping presses on other switchers report independently
+        self.ops.run(lambda post: self.core.send(device, switch_index, action, on_event=post),
+                     self._on_command_done, on_event=self._handle_command_event, kind="command")
+
+    def _on_command_done(self, fut):
+        try:
+            result = fut.result()
+        except Exception as e:
+            self._on_operation_failed(f"Exception: {e}")
+            return
+        if result.skipped:
+            self._set_status(f"이미 {STATE_TEXT[self.core.state.get(result.mac, result.channel)]} 상태")
+        elif result.ok:
+            self._on_operation_success()
+        else:
+            self._on_operation_failed(result.error or "스위쳐 통신 실패..")
+        # Ack -> result on screen: how long the hop to the Tk thread takes
+        self.core.telemetry.record("ui_update", time.monotonic() - result.finished, result.mac)
+
+    def on_device_action(self, name: str, switch_index: int, action: str):
+        # Dashboard press: commands to different switchers run concurrently
+        device = self.registry.get(name)
+        if device is None:
+            return
+        self._run_switch_command(device, switch_index, action)
+
+    def on_group_action(self, action: str):
+        devices = list(self.registry)
+        if not devices:
+            messagebox.showwarning("No devices", "저장된 스위처가 없습니다.")
             return
-        channel_type = 1 if switch_index == 1 else 2
+        self._set_status(f"전체 {action.upper()} 전송 중... ({len(devices)}대)")
+        self.ops.run(lambda post: self.core.send_targets([(d, d.channels) for d in devices], action),
+                     lambda f: self._on_group_done(f, action), kind="group")
+
+    def _on_group_done(self, fut, action: str):
         try:
-            io = pyswitcherio.IOSwitcher(mac, None, type=channel_type)
+            outcomes = fut.result()
         except Exception as e:
-            # Could not construct the object (e.g., scan failed). Treat as failure.
-            msg = f"IOSwitcher init error: {e}"
-            self.root.after(1, lambda msg=msg: self._on_operation_failed(msg))
+            self._on_operation_failed(f"Exception: {e}")
+            return
+        failed = [f"{d.name} {ch}" for d, ch, r in outcomes if isinstance(r, Exception) or not r.ok]
+        ok = len(outcomes) - len(failed)
+        text = f"전체 {action.upper()}: {ok}/{len(outcomes)} 성공"
+        if failed:
+            text += f" (실패: {', '.join(failed)})"
+        self._set_status(text)
+
+    def show_schedules(self):
+        if getattr(self, '_sched_window', None):
+            self._sched_window.lift()
+            return
+        win = self._sched_window = tk.Toplevel(self.root)
+        win.title('예약')
+        win.protocol("WM_DELETE_WINDOW", self._close_schedules)
+        self._sched_rows = tk.Frame(win)
+        self._sched_rules = []
+        self._sched_rows.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+
+        form = tk.Frame(win)
+        form.pack(fill=tk.X, padx=8, pady=(0, 8))
+        self._sched_id = tk.StringVar()
+        self._sched_target = tk.StringVar(value=self.name_var.get())
+        self._sched_action = tk.StringVar(value="on")
+        self._sched_kind = tk.StringVar(value="time")
+        self._sched_value = tk.StringVar(value="07:00")
+        tk.Entry(form, textvariable=self._sched_id, width=8).pack(side=tk.LEFT)
+        tk.Entry(form, textvariable=self._sched_target, width=12).pack(side=tk.LEFT, padx=2)
+        tk.OptionMenu(form, self._sched_action, "on", "off").pack(side=tk.LEFT)
+        # time: "07:00" or "07:00 mon,fri", at: "2026-10-19T07:30", cron: "*/15 6-9 * * 1-5"
+        tk.OptionMenu(form, self._sched_kind, "time", "at", "cron").pack(side=tk.LEFT)
+        tk.Entry(form, textvariable=self._sched_value, width=18).pack(side=tk.LEFT, padx=2)
+        tk.Button(form, text="추가", command=self._add_schedule).pack(side=tk.LEFT)
+        self._refresh_schedules()
+
+    def _refresh_schedules(self):
+        if not getattr(self, '_sched_window', None):
+            return
+        # snapshot() updates the scheduler's stats, so it is taken on the BLE loop
+        async def snapshot():
+            return self.core.scheduler.snapshot()
+        self.ops.run(lambda post: snapshot(), self._show_schedules, kind="schedule-snapshot")
+
+    def _show_schedules(self, fut):
+        if not getattr(self, '_sched_window', None):
             return
         try:
-            if action == "on":
-                res = asyncio.run(io.turn_on())
-            else:
-                res = asyncio.run(io.turn_off())
+            rules = fut.result()
         except Exception as e:
-            # Exception during write
-            msg = f"Exception: {e}"
-            self.root.after(1, lambda msg=msg: self._on_operation_failed(msg))
+            logging.getLogger(__name__).warning("Could not read schedules: %s", e)
+            rules = None
+        if rules is not None:
+            self._sched_rules = rules
+            for c in self._sched_rows.winfo_children():
+                c.destroy()
+            if not rules:
+                tk.Label(self._sched_rows, text="예약이 없습니다.").pack(anchor="w")
+            for r in rules:
+                row = tk.Frame(self._sched_rows)
+                row.pack(fill=tk.X, pady=1)
+                late = r["lateness"]
+                text = (f"{r['id']}  {r['target']} {r['action'].upper()}  {r['description']}  "
+                        f"다음: {r['next_fire'] or '-'}  실행 {r['fired']} / 실패 {r['failed']} / 놓침 {r['missed']}")
+                if late["n"]:
+                    text += f"  지연 p95 {late['p95'] * 1000:.0f}ms"
+                tk.Label(row, text=text, anchor="w").pack(side=tk.LEFT)
+                tk.Button(row, text="삭제", command=lambda i=r["id"]: self._remove_schedule(i)).pack(side=tk.RIGHT)
+        self.root.after(1000, self._refresh_schedules)
+
+    def _add_schedule(self):
+        kind, value = self._sched_kind.get(), self._sched_value.get().strip()
+        fields = {kind: value}
+        if kind == "time" and " " in value:
+            t, days = value.split(None, 1)
+            fields = {"time": t, "days": [d.strip() for d in days.split(",")]}
+        try:
+            rule = ScheduleRule(self._sched_id.get().strip() or f"rule{len(self._sched_rules) + 1}",
+                                self._sched_target.get().strip(), self._sched_action.get(), **fields)
+            self.core.resolve(rule.target)
+        except (ValueError, KeyError) as e:
+            messagebox.showwarning("예약", str(e))
             return
-        # If the library returns False explicitly and no failure logs were emitted, treat as failure
-        with self.monitor_lock:
-            m = self.current_monitor
-            seen_fail = m["seen_fail"] if m else False
-            seen_retry = m["seen_retry"] if m else False
-        if not res and seen_fail:
-            self.root.after(1, lambda: self._on_operation_failed("스위쳐 통신 실패.."))
+        self._change_schedules(lambda: self.core.scheduler.add(rule))
+
+    def _remove_schedule(self, rule_id: str):
+        self._change_schedules(lambda: self.core.scheduler.remove(rule_id))
+
+    def _change_schedules(self, change):
+        # The scheduler belongs to the BLE loop; save the rules it has once the change is applied there
+        async def apply():
+            change()
+            return [r.to_dict() for r in self.core.scheduler.rules]
+
+        def saved(fut):
+            try:
+                schedules = fut.result()
+            except Exception as e:
+                self._on_operation_failed(f"Exception: {e}")
+                return
+            self.save_config(schedules)
+        self.ops.run(lambda post: apply(), saved, kind="schedules")
+
+    def _close_schedules(self):
+        self._sched_window.destroy()
+        self._sched_window = None
+
+    def show_stats(self):
+        # Optional panel with rolling per-phase timings; refreshes while open
+        if getattr(self, '_stats_window', None):
+            self._stats_window.lift()
+            return
+        self._stats_window = tk.Toplevel(self.root)
+        self._stats_window.title('통계')
+        self._stats_text = tk.Text(self._stats_window, width=78, height=20, font=("Courier", 9))
+        self._stats_text.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        self._stats_window.protocol("WM_DELETE_WINDOW", self._close_stats)
+        self._refresh_stats()
+
+    def _refresh_stats(self):
+        if not getattr(self, '_stats_window', None):
             return
-        # If result is True but we haven't seen retry message, still enable controls
-        self.root.after(1, lambda: self._enable_controls())
+        names = {d.mac.upper(): d.name for d in self.registry}
+        text = format_stats(self.core.telemetry.snapshot(), names)
+        adapters = self.core.pool.adapter_stats()
+        if adapters:
+            from adapters import format_adapters
+
+            text += "\n\n" + format_adapters(adapters)
+        self._stats_text.delete("1.0", tk.END)
+        self._stats_text.insert(tk.END, text)
+        self.root.after(1000, self._refresh_stats)
+
+    def _close_stats(self):
+        self._stats_window.destroy()
+        self._stats_window = None
+
+    def call_soon(self, fn):
+        """Run fn() on the Tk thread on the next frame; callable from any thread."""
+        self._requests.put(fn)
+
+    def _configure_background(self):
+        # (Re)apply config["tray"] and config["hotkeys"]
+        if self.config.get("tray"):
+            self.tray.start()
+        else:
+            self.tray.stop()
+            if self.root.state() == "withdrawn":
+                self.show_window()
+        self.tray.refresh()
+        self.hotkeys.set_hotkeys(load_hotkeys(self.config))
+
+    def _tray_items(self):
+        # Called on the tray thread; actions are queued for the Tk thread
+        items = [("전체 ON", lambda: self.call_soon(lambda: self.on_group_action("on"))),
+                 ("전체 OFF", lambda: self.call_soon(lambda: self.on_group_action("off")))]
+        for name in list(self.core.scenes):
+            items.append((f"장면: {name}", lambda n=name: self.call_soon(lambda: self.on_scene(n))))
+        return items
+
+    def _on_hotkey(self, hotkey):
+        # On the keyboard hook's thread: straight to the BLE loop, no Tk in between
+        self.ops.run(lambda post: run_hotkey(self.core, hotkey), self._on_hotkey_done, kind="hotkey")
+
+    def _on_hotkey_done(self, fut):
+        try:
+            ok, text = fut.result()
+        except Exception as e:
+            ok, text = False, f"단축키 실패: {e}"
+        self._set_status(text, error=not ok)
+        if not ok and self.root.state() == "withdrawn":
+            self.tray.notify(text)
+
+    def show_window(self):
+        self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
+
+    def on_window_close(self):
+        if self.tray.running:
+            # Keep the loop, warm links, scheduler and hotkeys; only the window goes
+            self.save_config()
+            self.root.withdraw()
+            return
+        self.on_close()
 
     def on_close(self):
+        logging.getLogger().removeHandler(self.log_handler)
+        self.hotkeys.stop()
+        self.tray.stop()
         self.save_config()
+        self.config_store.close()
+        self._waker.close()
+        try:
+            self.core.close(timeout=5.0)
+        except Exception as e:
+            print("Failed to close BLE connections:", e)
         self.root.destroy()
 
 
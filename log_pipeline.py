@@ -0,0 +1,85 @@
+"""Bounded, non-blocking log hand-off from worker threads to a UI thread.
+
+QueueLogHandler formats records on the thread that logged them and drops
+them into a bounded queue without ever blocking; when the queue is full
+the record is counted as dropped instead. The UI thread calls drain() on
+its own schedule (a fixed frame rate) and handles a whole batch at once.
+
+Which records are let through is decided per logger: levels maps logger
+name prefixes to a level, the longest matching prefix wins, and anything
+unmatched uses the "" entry. By default bleak's DEBUG chatter never gets
+as far as the queue.
+"""
+import logging
+import queue
+from dataclasses import dataclass
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_LEVELS = {
+    "": logging.INFO,
+    "bleak": logging.WARNING,
+    "asyncio": logging.WARNING,
+}
+
+
+def parse_levels(levels) -> dict:
+    """Merge a {"logger": "DEBUG"|10, ...} mapping (e.g. from config) over DEFAULT_LEVELS."""
+    merged = dict(DEFAULT_LEVELS)
+    for name, level in (levels or {}).items():
+        if isinstance(level, str):
+            level = logging.getLevelName(level.upper())
+        if isinstance(level, int):
+            merged["" if name == "root" else name] = level
+    return merged
+
+
+@dataclass(frozen=True)
+class LogLine:
+    level: int
+    logger: str
+    message: str  # formatted with the handler's formatter
+    text: str     # just the record's message
+
+
+class QueueLogHandler(logging.Handler):
+    def __init__(self, levels=None, maxsize: int = DEFAULT_QUEUE_SIZE):
+        super().__init__(logging.NOTSET)
+        self.levels = parse_levels(levels)
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+
+    @property
+    def min_level(self) -> int:
+        """Lowest level any logger is let through at; set the root logger to this."""
+        return min(self.levels.values())
+
+    def level_for(self, name: str) -> int:
+        best = ""
+        for prefix in self.levels:
+            if len(prefix) > len(best) and (name == prefix or name.startswith(prefix + ".")):
+                best = prefix
+        return self.levels.get(best, logging.INFO)
+
+    def filter(self, record) -> bool:
+        return record.levelno >= self.level_for(record.name) and super().filter(record)
+
+    def emit(self, record):
+        try:
+            text = record.getMessage()
+            msg = self.format(record)
+        except Exception:
+            text = msg = str(record.msg)
+        try:
+            self.queue.put_nowait(LogLine(record.levelno, record.name, msg, text))
+        except queue.Full:
+            self.dropped += 1
+
+    def drain(self, limit: int = 200) -> list:
+        """Return up to limit queued lines, oldest first (call from the UI thread)."""
+        lines = []
+        while len(lines) < limit:
+            try:
+                lines.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return lines
@@ -0,0 +1,220 @@
+"""Background presence/RSSI tracking of configured switchers from their advertisements.
+
+A PresenceMonitor scans in short windows (window seconds every interval
+seconds, i.e. a low duty cycle; passive where the backend supports it)
+and only looks at the configured MACs. Every sighting refreshes the
+pool's DeviceCache, so the next connect skips its own scan. A switcher
+that comes into range is connected to right away (prewarm), so the next
+press goes out on a warm link. One that has not been seen for away_after
+seconds counts as away: SwitcherSession then fails commands to it at once
+instead of spending the whole scan timeout and retries.
+
+A switcher with an open link stops advertising, so it counts as present
+for as long as the link is up, and links coming up, acknowledging a
+command or going down count as sightings too (seen()). Only a switcher
+coming back after being away (or first heard) is prewarmed, so a link
+that idles out is not reopened by the next advertisement. Nothing counts
+as away until the monitor has been running for away_after seconds.
+
+Enabled with "presence": true in config.json, or with settings:
+{"presence": {"window": 2, "interval": 10, "away_after": 60, "prewarm": true}}.
+"""
+import asyncio
+import logging
+import sys
+import time
+from typing import Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 2.0
+DEFAULT_INTERVAL = 10.0
+DEFAULT_AWAY_AFTER = 60.0
+
+
+def presence_settings(config: dict) -> Optional[dict]:
+    """PresenceMonitor keyword arguments from config["presence"], or None when disabled."""
+    value = config.get("presence")
+    if not value:
+        return None
+    if value is True:
+        return {}
+    if not isinstance(value, dict):
+        raise ValueError(f"presence must be true or an object, not {value!r}")
+    settings = {}
+    for key in ("window", "interval", "away_after"):
+        if key in value:
+            settings[key] = float(value[key])
+            if settings[key] <= 0:
+                raise ValueError(f"presence.{key} must be positive")
+    if "prewarm" in value:
+        settings["prewarm"] = bool(value["prewarm"])
+    return settings
+
+
+class _Presence:
+    __slots__ = ("present", "rssi", "last_seen")
+
+    def __init__(self):
+        self.present = False
+        self.rssi = None
+        self.last_seen = 0.0
+
+
+class PresenceMonitor:
+    """Runs on the pool's event loop; macs() returns the MACs to watch (re-read every window)."""
+
+    def __init__(self, pool, macs, window: float = DEFAULT_WINDOW, interval: float = DEFAULT_INTERVAL,
+                 away_after: float = DEFAULT_AWAY_AFTER, prewarm: bool = True, scanner_factory=None):
+        self.pool = pool
+        self.macs = macs
+        self.window = window
+        self.interval = interval
+        self.away_after = away_after
+        self.prewarm = prewarm
+        # Like stream_scan: e.g. FakeTransport.scanner or MultiAdapterTransport.scanner
+        self.scanner_factory = scanner_factory
+        # Optional fn(mac, present), called on the loop when a switcher appears or goes away
+        self.on_change = None
+        self.scans = 0
+        self.prewarms = 0
+        self._entries = {}
+        self._started_at = None
+        self._task = None
+        self._warming = {}
+
+    def configure(self, window: float = DEFAULT_WINDOW, interval: float = DEFAULT_INTERVAL,
+                  away_after: float = DEFAULT_AWAY_AFTER, prewarm: bool = True):
+        """Change the settings; applies from the next window."""
+        self.window, self.interval, self.away_after, self.prewarm = window, interval, away_after, prewarm
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._started_at = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        tasks = [t for t in [self._task, *self._warming.values()] if t is not None]
+        self._task = None
+        self._warming.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.scan_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _LOGGER.warning("Presence scan failed: %s", e)
+            self._expire()
+            await asyncio.sleep(self.interval)
+
+    def _scanner(self, detection_callback):
+        if self.scanner_factory is not None:
+            return self.scanner_factory(detection_callback)
+        from bleak import BleakScanner
+
+        # WinRT can listen without sending scan requests; BlueZ needs
+        # advertisement filters for that, so it scans actively (but briefly)
+        kwargs = {"scanning_mode": "passive"} if sys.platform == "win32" else {}
+        return BleakScanner(detection_callback=detection_callback, **kwargs)
+
+    async def scan_once(self):
+        """Listen for one window."""
+        wanted = {mac.strip().upper() for mac in self.macs() if mac}
+        if not wanted:
+            return
+
+        def detected(device, adv):
+            mac = device.address.upper()
+            if mac in wanted:
+                self.pool.cache.update(device, getattr(adv, "rssi", None))
+                self._seen(mac, getattr(adv, "rssi", None))
+
+        scanner = self._scanner(detected)
+        await scanner.start()
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            await scanner.stop()
+        self.scans += 1
+
+    def _entry(self, mac: str) -> _Presence:
+        entry = self._entries.get(mac)
+        if entry is None:
+            entry = self._entries[mac] = _Presence()
+        return entry
+
+    def _seen(self, mac: str, rssi=None):
+        entry = self._entry(mac)
+        entry.last_seen = time.monotonic()
+        if rssi is not None:
+            entry.rssi = rssi
+        if entry.present:
+            return
+        entry.present = True
+        _LOGGER.info("%s: in range (RSSI %s)", mac, rssi if rssi is not None else "?")
+        self._changed(mac, True)
+        if self.prewarm and mac not in self._warming and self.running and not self.pool.is_connected(mac):
+            self._warming[mac] = asyncio.get_running_loop().create_task(self._warm(mac))
+
+    async def _warm(self, mac: str):
+        try:
+            await self.pool.warm(mac)
+            self.prewarms += 1
+        except Exception as e:
+            _LOGGER.debug("%s: pre-connect failed: %s", mac, e)
+        finally:
+            self._warming.pop(mac, None)
+
+    def seen(self, mac: str):
+        """A link to mac came up, acknowledged a command or went down: it was in range just now."""
+        entry = self._entry(mac.upper())
+        entry.last_seen = time.monotonic()
+        if not entry.present:
+            entry.present = True
+            self._changed(mac.upper(), True)
+
+    def _expire(self):
+        now = time.monotonic()
+        for mac, entry in self._entries.items():
+            if self.pool.is_connected(mac):
+                # Not advertising because we are connected to it
+                entry.last_seen = now
+                continue
+            if entry.present and now - entry.last_seen > self.away_after:
+                entry.present = False
+                _LOGGER.info("%s: not seen for %.0fs, out of range", mac, now - entry.last_seen)
+                self._changed(mac, False)
+
+    def _changed(self, mac: str, present: bool):
+        if self.on_change is not None:
+            try:
+                self.on_change(mac, present)
+            except Exception:
+                _LOGGER.exception("Presence listener failed")
+
+    def is_away(self, mac: str) -> Optional[float]:
+        """Seconds since mac was last seen if it counts as out of range, else None."""
+        if not self.running or time.monotonic() - self._started_at < self.away_after:
+            return None
+        if self.pool.is_connected(mac):
+            return None
+        entry = self._entries.get(mac.upper())
+        last = entry.last_seen if entry is not None and entry.last_seen else self._started_at
+        age = time.monotonic() - last
+        return age if age > self.away_after else None
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {mac: {"present": e.present, "rssi": e.rssi,
+                      "seen_ago": round(now - e.last_seen, 1) if e.last_seen else None}
+                for mac, e in self._entries.items()}
@@ -0,0 +1,116 @@
+"""Retry timing and per-switcher circuit breaker for the command path.
+
+RetryPolicy decides how often a command is retried and how long to wait
+in between: exponential backoff with jitter, so several switchers that
+failed together do not retry in lockstep, and a timeout per attempt so a
+hung scan or connect cannot eat the whole retry budget.
+
+CircuitBreaker stops a switcher that is out of range (or unplugged) from
+making every press wait out the full retry cycle. After breaker_threshold
+failed commands in a row it opens: commands fail at once and the session
+probes the switcher in the background, further and further apart. A
+successful probe (or any successful command) closes it again. Once the
+next probe is due, a press is allowed through as the probe itself
+("half-open").
+
+Both are configured with the "retry" object in config.json, e.g.
+{"retry": {"retries": 2, "attempt_timeout": 15, "breaker_threshold": 3}}.
+"""
+import random
+import time
+from dataclasses import dataclass, fields
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    # Extra attempts after the first one
+    retries: int = 3
+    # Backoff before retry n is base_delay * multiplier ** n, capped at max_delay
+    base_delay: float = 0.5
+    multiplier: float = 2.0
+    max_delay: float = 5.0
+    # Up to this fraction of each delay is randomly taken off
+    jitter: float = 0.5
+    # Scan + connect + write for one attempt (scans alone may take 10s)
+    attempt_timeout: float = 20.0
+    # Consecutive failed commands that open a switcher's breaker (0 = never)
+    breaker_threshold: int = 3
+    # First background probe after opening; doubles up to breaker_max_reset
+    breaker_reset: float = 10.0
+    breaker_max_reset: float = 120.0
+    # Stop probing a switcher nobody has pressed for this long
+    probe_for: float = 600.0
+
+    def __post_init__(self):
+        if self.retries < 0 or self.base_delay < 0 or self.max_delay < 0:
+            raise ValueError("retries and delays must not be negative")
+        if not 0.0 <= self.jitter <= 1.0:
+            raise ValueError("jitter must be between 0 and 1")
+        if self.attempt_timeout <= 0 or self.breaker_reset <= 0:
+            raise ValueError("attempt_timeout and breaker_reset must be positive")
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RetryPolicy":
+        """Policy from config["retry"]; unknown keys are ignored, bad values raise ValueError."""
+        entry = config.get("retry") or {}
+        if not isinstance(entry, dict):
+            raise ValueError(f"retry must be an object, got {entry!r}")
+        known = {f.name for f in fields(cls)}
+        kwargs = {}
+        for key, value in entry.items():
+            if key in known:
+                kwargs[key] = int(value) if key in ("retries", "breaker_threshold") else float(value)
+        return cls(**kwargs)
+
+    def delay(self, retry: int, rng=random) -> float:
+        """Seconds to wait before retry number retry (0-based)."""
+        full = min(self.max_delay, self.base_delay * self.multiplier ** retry)
+        return full * (1.0 - self.jitter * rng.random())
+
+
+class CircuitBreaker:
+    """Per-switcher breaker state: "closed", "open" or "half_open". Not thread-safe (loop only)."""
+
+    def __init__(self, policy: RetryPolicy, clock=time.monotonic):
+        self.policy = policy
+        self.clock = clock
+        self.failures = 0
+        self.opened = 0
+        self._open_until = None
+        self._reset = policy.breaker_reset
+
+    @property
+    def state(self) -> str:
+        if self._open_until is None:
+            return "closed"
+        return "open" if self.clock() < self._open_until else "half_open"
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds until the next probe is due (0 when closed or half-open)."""
+        if self._open_until is None:
+            return 0.0
+        return max(0.0, self._open_until - self.clock())
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self._open_until = None
+        self._reset = self.policy.breaker_reset
+
+    def record_failure(self) -> bool:
+        """Count a failed command or probe; returns True if this opened the breaker."""
+        self.failures += 1
+        threshold = self.policy.breaker_threshold
+        if self._open_until is not None:
+            # A failed probe: wait longer before the next one
+            self._reset = min(self.policy.breaker_max_reset, self._reset * 2)
+            self._open_until = self.clock() + self._reset
+            return False
+        if threshold and self.failures >= threshold:
+            self.opened += 1
+            self._open_until = self.clock() + self._reset
+            return True
+        return False
@@ -0,0 +1,270 @@
+"""Named scenes: several switch steps (and waits) run as one unit.
+
+Scenes are stored in config.json under "scenes":
+
+    {"name": "취침", "steps": [{"target": "거실:1", "action": "on"},
+                               {"target": "거실:2", "action": "off"},
+                               {"wait": 2},
+                               {"target": "거실:2", "action": "on"}],
+     "timeout": 10, "rollback": false}
+
+Consecutive switch steps form a batch that is sent at once: both channels
+of a switcher are queued on its one warm link back to back (one connect
+for the pair), and different switchers are written in parallel. Waits
+are measured from the start of the scene, not from when the previous
+batch finished, so a slow write does not push the rest of the timeline
+back; every step records how late it started. Links needed by later
+batches are opened while the earlier ones run.
+
+A scene succeeds only if every step does. The first failed batch (or one
+that is not acknowledged within timeout seconds) stops the scene, and the
+steps after it are reported as not run. With "rollback": true the
+channels the scene already changed are put back as they were.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BATCH_TIMEOUT = 30.0
+ACTIONS = ("on", "off", "toggle")
+
+
+@dataclass(frozen=True)
+class SceneStep:
+    target: Optional[str] = None
+    action: Optional[str] = None
+    wait: Optional[float] = None
+
+    def __post_init__(self):
+        if self.wait is not None:
+            if self.target is not None or self.wait < 0:
+                raise ValueError("a wait step takes only a non-negative number of seconds")
+        elif not self.target or self.action not in ACTIONS:
+            raise ValueError(f"step needs a target and one of {', '.join(ACTIONS)}")
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "SceneStep":
+        if "wait" in d:
+            return cls(wait=float(d["wait"]))
+        return cls(target=str(d["target"]), action=str(d["action"]))
+
+    @classmethod
+    def parse(cls, text: str) -> "SceneStep":
+        """Parse the command line form: "거실:1=on" or "wait=2"."""
+        target, sep, value = text.rpartition("=")
+        if not sep:
+            raise ValueError(f"expected TARGET=ACTION or wait=SECONDS: {text!r}")
+        if target == "wait":
+            return cls(wait=float(value))
+        return cls(target=target, action=value)
+
+    def to_dict(self) -> dict:
+        return {"wait": self.wait} if self.wait is not None else {"target": self.target, "action": self.action}
+
+    def __str__(self):
+        return f"wait={self.wait:g}" if self.wait is not None else f"{self.target}={self.action}"
+
+
+@dataclass
+class Scene:
+    name: str
+    steps: list
+    timeout: float = DEFAULT_BATCH_TIMEOUT
+    rollback: bool = False
+
+    def __post_init__(self):
+        if not self.name:
+            raise ValueError("a scene needs a name")
+        if not any(s.wait is None for s in self.steps):
+            raise ValueError(f"{self.name}: no switch steps")
+        if self.timeout <= 0:
+            raise ValueError(f"{self.name}: timeout must be positive")
+
+    def batches(self) -> list:
+        """[(offset seconds from the start, [switch steps])], split at waits."""
+        batches, offset, current = [], 0.0, []
+        for step in self.steps:
+            if step.wait is None:
+                current.append(step)
+                continue
+            if current:
+                batches.append((offset, current))
+                current = []
+            offset += step.wait
+        if current:
+            batches.append((offset, current))
+        return batches
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Scene":
+        return cls(name=str(d["name"]), steps=[SceneStep.from_dict(s) for s in d["steps"]],
+                   timeout=float(d.get("timeout", DEFAULT_BATCH_TIMEOUT)), rollback=bool(d.get("rollback", False)))
+
+    def to_dict(self) -> dict:
+        d = {"name": self.name, "steps": [s.to_dict() for s in self.steps]}
+        if self.timeout != DEFAULT_BATCH_TIMEOUT:
+            d["timeout"] = self.timeout
+        if self.rollback:
+            d["rollback"] = True
+        return d
+
+    @property
+    def description(self) -> str:
+        return ", ".join(str(s) for s in self.steps)
+
+
+def load_scenes(config: dict) -> dict:
+    """Scenes from config["scenes"] by name; invalid entries are logged and skipped."""
+    scenes = {}
+    for entry in config.get("scenes") or ():
+        try:
+            scene = Scene.from_dict(entry)
+        except (KeyError, TypeError, ValueError) as e:
+            _LOGGER.warning("Ignoring scene %r: %s", entry, e)
+            continue
+        scenes[scene.name] = scene
+    return scenes
+
+
+@dataclass
+class StepResult:
+    target: str
+    device: str
+    channel: int
+    action: str
+    ok: bool = False
+    # Not sent: an earlier batch failed (or the target is unknown)
+    ran: bool = True
+    skipped: bool = False
+    error: Optional[str] = None
+    # Seconds after the planned start that the step was actually sent
+    late: float = 0.0
+    elapsed: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {"target": self.target, "device": self.device, "channel": self.channel, "action": self.action,
+                "ok": self.ok, "ran": self.ran, "skipped": self.skipped, "error": self.error,
+                "late_ms": round(self.late * 1000, 1), "elapsed_ms": round(self.elapsed * 1000, 1)}
+
+
+@dataclass
+class SceneResult:
+    name: str
+    steps: list = field(default_factory=list)
+    elapsed: float = 0.0
+    rolled_back: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.steps) and all(s.ok for s in self.steps)
+
+    @property
+    def failed(self) -> list:
+        return [s for s in self.steps if s.ran and not s.ok]
+
+    def to_dict(self) -> dict:
+        return {"scene": self.name, "ok": self.ok, "elapsed_ms": round(self.elapsed * 1000, 1),
+                "rolled_back": self.rolled_back, "steps": [s.to_dict() for s in self.steps]}
+
+    def summary(self) -> str:
+        done = sum(1 for s in self.steps if s.ok)
+        text = f"장면 {self.name}: {done}/{len(self.steps)} 성공 ({self.elapsed:.1f}초)"
+        if self.failed:
+            text += f" (실패: {', '.join(f'{s.device} {s.channel}' for s in self.failed)})"
+        if self.rolled_back:
+            text += ", 되돌림"
+        return text
+
+
+async def run_scene(scene: Scene, core, on_event=None) -> SceneResult:
+    """Run a scene through a SwitcherCore (resolve/send/state/pool)."""
+    started = time.monotonic()
+    result = SceneResult(scene.name)
+    plan = []
+    for offset, steps in scene.batches():
+        jobs = []
+        for step in steps:
+            try:
+                device, channels = core.resolve(step.target)
+            except KeyError as e:
+                jobs.append((None, StepResult(step.target, step.target, 0, step.action, ran=False,
+                                              error=e.args[0])))
+                continue
+            for ch in channels:
+                jobs.append((device, StepResult(step.target, device.name, ch, step.action)))
+        plan.append((offset, jobs))
+        result.steps.extend(r for _, r in jobs)
+    unknown = [r for r in result.steps if r.error]
+    if unknown:
+        # Nothing is sent when part of the scene cannot be
+        for r in result.steps:
+            r.ran = False
+        result.elapsed = time.monotonic() - started
+        return result
+
+    # Open links for later batches while the first one runs
+    later = {d.mac.upper(): d for _, jobs in plan[1:] for d, _ in jobs}
+    first = {d.mac.upper() for d, _ in plan[0][1]} if plan else set()
+    warming = [asyncio.ensure_future(core.pool.warm(mac)) for mac in later if mac not in first]
+    before = {}
+    try:
+        for index, (offset, jobs) in enumerate(plan):
+            delay = started + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            for device, r in jobs:
+                before.setdefault((device.mac.upper(), r.channel), (device, core.state.confirmed(device.mac, r.channel)))
+            if not await _run_batch(core, jobs, started + offset, scene.timeout, on_event):
+                for _, later_jobs in plan[index + 1:]:
+                    for _, r in later_jobs:
+                        r.ran = False
+                break
+    finally:
+        for task in warming:
+            task.cancel()
+        await asyncio.gather(*warming, return_exceptions=True)
+
+    if not result.ok and scene.rollback:
+        result.rolled_back = await _rollback(core, result, before, scene.timeout)
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+async def _run_batch(core, jobs, planned: float, timeout: float, on_event) -> bool:
+    async def one(device, r):
+        sent = time.monotonic()
+        r.late = max(0.0, sent - planned)
+        try:
+            outcome = await core.send(device, r.channel, r.action, on_event)
+        except Exception as e:
+            r.error = str(e) or type(e).__name__
+        else:
+            r.ok, r.skipped, r.error = outcome.ok, outcome.skipped, outcome.error
+        r.elapsed = time.monotonic() - sent
+
+    tasks = [asyncio.ensure_future(one(device, r)) for device, r in jobs]
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for (_, r), task in zip(jobs, tasks):
+        if task in pending:
+            r.ok, r.error = False, f"시간 초과 ({timeout:g}초)"
+    return all(r.ok for _, r in jobs)
+
+
+async def _rollback(core, result: SceneResult, before: dict, timeout: float) -> bool:
+    """Put back every channel the scene changed; True if all of them were restored."""
+    changed = {(r.device, r.channel) for r in result.steps if r.ok and not r.skipped}
+    jobs = []
+    for (mac, ch), (device, previous) in before.items():
+        if (device.name, ch) in changed and previous in ("on", "off"):
+            jobs.append((device, StepResult(f"{device.name}:{ch}", device.name, ch, previous)))
+    if not jobs:
+        return False
+    _LOGGER.info("Scene %s failed, restoring %d channel(s)", result.name, len(jobs))
+    return await _run_batch(core, jobs, time.monotonic(), timeout, None)
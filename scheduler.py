@@ -0,0 +1,367 @@
+"""Timed and recurring switch actions on the shared event loop.
+
+Rules are stored in config.json under "schedules", one of three kinds:
+
+    {"id": "wake", "target": "거실:1", "action": "on", "at": "2026-10-19T07:30"}
+    {"id": "lamp", "target": "거실", "action": "off", "time": "23:00", "days": ["mon", "fri"]}
+    {"id": "pump", "target": "안방", "action": "on", "cron": "*/15 6-9 * * 1-5"}
+
+"at" fires once, "time" every day at a fixed local time (optionally only on
+some weekdays) and "cron" takes the usual five fields (minute hour
+day-of-month month day-of-week, Sunday = 0 or 7).
+
+Every rule's next fire sits in one heap, and a single task sleeps until the
+earliest entry, so there is no thread or timer per rule. A second entry a
+few seconds (prewarm_lead) before each fire opens the BLE link early, so
+the write itself lands on time. A fire that starts more than grace seconds late
+(e.g. the machine was asleep) is recorded as missed and skipped. For the
+others the start lateness and the time until the switch acknowledged are
+kept per rule.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PREWARM_LEAD = 5.0
+DEFAULT_GRACE = 60.0
+# Wake at least this often so wall-clock jumps and suspend are noticed
+MAX_SLEEP = 30.0
+STATS_WINDOW = 100
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def _parse_field(spec: str, lo: int, hi: int) -> frozenset:
+    values = set()
+    for part in spec.split(","):
+        step = 1
+        if "/" in part:
+            part, step_s = part.split("/", 1)
+            step = int(step_s)
+            if step < 1:
+                raise ValueError(f"bad step in {spec!r}")
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = int(part)
+            end = hi if step > 1 else start
+        if start < lo or end > hi or start > end:
+            raise ValueError(f"{spec!r} out of range {lo}-{hi}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSpec:
+    """Five-field cron expression; dom and dow combine with OR when both are restricted."""
+
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes = _parse_field(parts[0], 0, 59)
+        self.hours = _parse_field(parts[1], 0, 23)
+        self.doms = _parse_field(parts[2], 1, 31)
+        self.months = _parse_field(parts[3], 1, 12)
+        # cron counts Sunday as 0 (or 7); datetime.weekday() has Monday = 0
+        self.dows = frozenset((d - 1) % 7 for d in _parse_field(parts[4], 0, 7))
+        self._dom_any = parts[2] == "*"
+        self._dow_any = parts[4] == "*"
+
+    def _day_matches(self, day) -> bool:
+        if day.month not in self.months:
+            return False
+        dom_ok = day.day in self.doms
+        dow_ok = day.weekday() in self.dows
+        if self._dom_any or self._dow_any:
+            return dom_ok and dow_ok
+        return dom_ok or dow_ok
+
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        # Any valid expression matches within a leap cycle
+        for _ in range(366 * 4 + 1):
+            if self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        return None
+
+
+def _parse_time(text: str):
+    parts = [int(p) for p in text.split(":")]
+    if len(parts) == 2:
+        parts.append(0)
+    hour, minute, second = parts
+    if not (0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 60):
+        raise ValueError(f"bad time {text!r}")
+    return hour, minute, second
+
+
+@dataclass
+class ScheduleRule:
+    id: str
+    target: str
+    action: str
+    at: Optional[str] = None
+    time: Optional[str] = None
+    days: Optional[list] = None
+    cron: Optional[str] = None
+    enabled: bool = True
+    _cron: Optional[CronSpec] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.action not in ("on", "off"):
+            raise ValueError(f"{self.id}: action must be on or off")
+        kinds = [k for k in ("at", "time", "cron") if getattr(self, k)]
+        if len(kinds) != 1:
+            raise ValueError(f"{self.id}: exactly one of at/time/cron is required")
+        if self.at:
+            datetime.fromisoformat(self.at)
+        if self.time:
+            _parse_time(self.time)
+            for d in self.days or ():
+                if d not in WEEKDAYS:
+                    raise ValueError(f"{self.id}: unknown day {d!r}")
+        if self.cron:
+            self._cron = CronSpec(self.cron)
+
+    @property
+    def description(self) -> str:
+        if self.at:
+            return f"{self.at} 한 번"
+        if self.time:
+            return f"매일 {self.time}" if not self.days else f"{','.join(self.days)} {self.time}"
+        return f"cron {self.cron}"
+
+    def next_fire(self, after: datetime) -> Optional[datetime]:
+        """First fire time strictly after `after` (naive local time), or None."""
+        if not self.enabled:
+            return None
+        if self.at:
+            when = datetime.fromisoformat(self.at)
+            return when if when > after else None
+        if self.cron:
+            return self._cron.next_after(after)
+        hour, minute, second = _parse_time(self.time)
+        allowed = {WEEKDAYS.index(d) for d in self.days} if self.days else set(range(7))
+        day = after.replace(hour=hour, minute=minute, second=second, microsecond=0)
+        for _ in range(8):
+            if day > after and day.weekday() in allowed:
+                return day
+            day += timedelta(days=1)
+        return None
+
+    def to_dict(self) -> dict:
+        d = {"id": self.id, "target": self.target, "action": self.action}
+        for key in ("at", "time", "days", "cron"):
+            if getattr(self, key):
+                d[key] = getattr(self, key)
+        if not self.enabled:
+            d["enabled"] = False
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "ScheduleRule":
+        return cls(id=str(d["id"]), target=str(d["target"]), action=str(d["action"]),
+                   at=d.get("at"), time=d.get("time"), days=d.get("days"), cron=d.get("cron"),
+                   enabled=bool(d.get("enabled", True)))
+
+
+def load_rules(config: dict) -> list:
+    """Rules from config["schedules"]; invalid entries are logged and skipped."""
+    rules = []
+    for entry in config.get("schedules") or ():
+        try:
+            rules.append(ScheduleRule.from_dict(entry))
+        except (KeyError, TypeError, ValueError) as e:
+            _LOGGER.warning("Ignoring schedule %r: %s", entry, e)
+    return rules
+
+
+def _summary(values) -> dict:
+    ordered = sorted(values)
+    if not ordered:
+        return {"n": 0, "mean": 0.0, "p95": 0.0, "max": 0.0}
+    rank = max(0, math.ceil(0.95 * len(ordered)) - 1)
+    return {"n": len(ordered), "mean": sum(ordered) / len(ordered), "p95": ordered[rank], "max": ordered[-1]}
+
+
+class RuleStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fired = 0
+        self.failed = 0
+        self.missed = 0
+        self.last_fire = None
+        self.next_fire = None
+        # Seconds between the scheduled time and the start / the acknowledged write
+        self.lateness = deque(maxlen=STATS_WINDOW)
+        self.landed = deque(maxlen=STATS_WINDOW)
+
+    def record(self, ok: bool, late: float, landed: float):
+        with self._lock:
+            self.fired += 1
+            if not ok:
+                self.failed += 1
+            self.lateness.append(late)
+            self.landed.append(landed)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"fired": self.fired, "failed": self.failed, "missed": self.missed,
+                    "last_fire": self.last_fire, "next_fire": self.next_fire,
+                    "lateness": _summary(self.lateness), "landed": _summary(self.landed)}
+
+
+class Scheduler:
+    """Runs rules on the current event loop; fire(rule) and prewarm(rule) are coroutines.
+
+    fire returns True when the action was acknowledged. Mutating methods
+    must be called on the loop thread (start() included).
+    """
+
+    def __init__(self, fire, prewarm=None, prewarm_lead: float = DEFAULT_PREWARM_LEAD,
+                 grace: float = DEFAULT_GRACE, clock=time.time):
+        self._fire = fire
+        self._prewarm = prewarm
+        self.prewarm_lead = prewarm_lead
+        self.grace = grace
+        self.clock = clock
+        self._rules = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._wake = None
+        self._task = None
+        self._inflight = set()
+        self.stats = {}
+
+    @property
+    def rules(self) -> list:
+        return list(self._rules.values())
+
+    def set_rules(self, rules):
+        self._rules = {r.id: r for r in rules}
+        self._heap.clear()
+        for rule in self._rules.values():
+            self._push(rule, datetime.fromtimestamp(self.clock()))
+        self._poke()
+
+    def add(self, rule: ScheduleRule):
+        self._rules[rule.id] = rule
+        self._push(rule, datetime.fromtimestamp(self.clock()))
+        self._poke()
+
+    def remove(self, rule_id: str):
+        # Heap entries of removed rules are skipped when they come up
+        self._rules.pop(rule_id, None)
+        self.stats.pop(rule_id, None)
+        self._poke()
+
+    def snapshot(self) -> list:
+        return [{**r.to_dict(), "description": r.description,
+                 **self.stats.setdefault(r.id, RuleStats()).snapshot()} for r in self.rules]
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, *self._inflight) if t is not None and not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def _poke(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def _push(self, rule: ScheduleRule, after: datetime):
+        stats = self.stats.setdefault(rule.id, RuleStats())
+        when = rule.next_fire(after)
+        stats.next_fire = when.isoformat(timespec="seconds") if when else None
+        if when is None:
+            return
+        ts = when.timestamp()
+        heapq.heappush(self._heap, (ts, next(self._seq), "fire", rule))
+        if self._prewarm is not None and ts - self.prewarm_lead > self.clock():
+            heapq.heappush(self._heap, (ts - self.prewarm_lead, next(self._seq), "prewarm", rule))
+
+    async def _sleep(self, timeout):
+        # asyncio.wait rather than wait_for: on 3.11 wait_for can swallow a
+        # cancel that races with the event being set
+        waiter = asyncio.get_running_loop().create_task(self._wake.wait())
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        finally:
+            waiter.cancel()
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            if not self._heap:
+                await self._sleep(None)
+                continue
+            delay = self._heap[0][0] - self.clock()
+            if delay > 0:
+                await self._sleep(min(delay, MAX_SLEEP))
+                continue
+            ts, _, kind, rule = heapq.heappop(self._heap)
+            if self._rules.get(rule.id) is not rule:
+                continue
+            if kind == "prewarm":
+                self._spawn(self._run_prewarm(rule))
+                continue
+            now = self.clock()
+            stats = self.stats.setdefault(rule.id, RuleStats())
+            if now - ts > self.grace:
+                stats.missed += 1
+                _LOGGER.warning("%s: missed fire at %s (%.0fs late)", rule.id,
+                                datetime.fromtimestamp(ts).isoformat(timespec="seconds"), now - ts)
+                # Don't replay a backlog; continue from now
+                self._push(rule, datetime.fromtimestamp(now))
+                continue
+            self._spawn(self._run_fire(rule, ts, now - ts))
+            self._push(rule, datetime.fromtimestamp(ts))
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _run_prewarm(self, rule):
+        try:
+            await self._prewarm(rule)
+        except Exception as e:
+            _LOGGER.debug("%s: prewarm failed: %s", rule.id, e)
+
+    async def _run_fire(self, rule, ts: float, late: float):
+        stats = self.stats.setdefault(rule.id, RuleStats())
+        stats.last_fire = datetime.fromtimestamp(ts).isoformat(timespec="seconds")
+        try:
+            ok = bool(await self._fire(rule))
+        except Exception as e:
+            _LOGGER.warning("%s: scheduled %s failed: %s", rule.id, rule.action, e)
+            ok = False
+        stats.record(ok, late, self.clock() - ts)
+        _LOGGER.info("%s: %s %s %s (%.0f ms late)", rule.id, rule.target, rule.action,
+                     "ok" if ok else "failed", late * 1000)
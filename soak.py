@@ -0,0 +1,349 @@
+"""Soak test: thousands of commands over hours, watching for leaks and drift.
+
+    python -m soak                                # 10 minutes on simulated switchers
+    python -m soak --duration 14400 --rate 2      # 4 hours
+    python -m soak --real --duration 3600         # the switchers in config.json, over BLE
+    python -m soak --gui                          # pressed through SwitchApp, in a Tk window
+    python -m soak --json
+
+Toggles go round-robin over every channel of every switcher through the
+same path as the app (SwitcherCore.send: state tracking, per-device
+queue, warm links, notifications; with --gui also the window's buttons,
+OperationBridge and frame pump). Every --sample seconds a sample records
+the process RSS, thread count, open handles (file descriptors, or kernel
+handles on Windows), the Tk after-queue depth (--gui) and the command
+latency percentiles over about the last interval. Samples taken during
+the first --warmup seconds (imports, first connects) are not used as the
+baseline.
+
+At most one press per channel is in flight: a press that comes due while
+the previous one to that channel is still pending is skipped and counted
+(the link is slower than --rate), so the harness itself never builds up a
+queue. Samples report the skipped presses and the channels in flight.
+
+The run fails (exit status 1) when a limit is breached: RSS, thread or
+handle growth from the baseline to the end, after-queue depth, latency
+drift (last p50 over baseline p50) or the overall failure rate.
+Simulated runs use a temporary config directory, so the real state.json
+and friends are not touched.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Optional
+
+from config_store import ConfigError
+
+SOAK_MACS = ("AA:BB:CC:DD:EE:01", "AA:BB:CC:DD:EE:02")
+DEFAULT_DURATION = 600.0
+DEFAULT_RATE = 2.0
+DEFAULT_SAMPLE = 30.0
+DEFAULT_WARMUP = 60.0
+
+
+@dataclass
+class Limits:
+    rss_growth_mb: float = 32.0
+    thread_growth: int = 4
+    handle_growth: int = 32
+    after_depth: int = 100
+    # Last interval's p50 over the baseline's
+    latency_drift: float = 2.0
+    failure_rate: float = 0.02
+
+
+@dataclass
+class Sample:
+    t: float
+    commands: int
+    failures: int
+    rss_mb: Optional[float]
+    threads: int
+    handles: Optional[int]
+    after_depth: Optional[int]
+    # Command (press-to-ack) latency in ms over about the last interval
+    p50: float
+    p95: float
+    # Presses skipped so far because the previous one to that channel was still in flight
+    skipped: int = 0
+    # Channels with a press in flight right now
+    backlog: int = 0
+
+
+def rss_mb() -> Optional[float]:
+    """Resident set size of this process, None where it cannot be read."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize / 2 ** 20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def thread_count() -> int:
+    """OS threads where they can be listed (bleak/D-Bus ones too), else Python threads."""
+    try:
+        return len(os.listdir("/proc/self/task"))
+    except OSError:
+        return threading.active_count()
+
+
+def handle_count() -> Optional[int]:
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        count = wintypes.DWORD()
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.kernel32.GetProcessHandleCount(process, ctypes.byref(count)):
+            return None
+        return count.value
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return None
+
+
+def evaluate(samples: list, limits: Limits, warmup: float) -> list:
+    """Breached limits, as text; empty when the run passed."""
+    if not samples:
+        return ["no samples"]
+    measured = [s for s in samples if s.t >= warmup] or samples[-1:]
+    base, last = measured[0], measured[-1]
+    breaches = []
+    if base.rss_mb is not None and last.rss_mb is not None and last.rss_mb - base.rss_mb > limits.rss_growth_mb:
+        breaches.append(f"RSS grew {last.rss_mb - base.rss_mb:.1f} MB ({base.rss_mb:.1f} -> {last.rss_mb:.1f})")
+    if last.threads - base.threads > limits.thread_growth:
+        breaches.append(f"threads grew by {last.threads - base.threads} ({base.threads} -> {last.threads})")
+    if base.handles is not None and last.handles is not None and last.handles - base.handles > limits.handle_growth:
+        breaches.append(f"handles grew by {last.handles - base.handles} ({base.handles} -> {last.handles})")
+    depth = max((s.after_depth for s in samples if s.after_depth is not None), default=None)
+    if depth is not None and depth > limits.after_depth:
+        breaches.append(f"Tk after queue reached {depth} callbacks")
+    if base.p50 > 0 and last.p50 / base.p50 > limits.latency_drift:
+        breaches.append(f"latency p50 drifted {last.p50 / base.p50:.1f}x ({base.p50:.0f} -> {last.p50:.0f} ms)")
+    if last.commands and last.failures / last.commands > limits.failure_rate:
+        breaches.append(f"{last.failures}/{last.commands} commands failed")
+    return breaches
+
+
+class SoakRun:
+    """Drives the presses and takes the samples, on the core's loop.
+
+    press(device, channel) sends one toggle; the default awaits
+    core.send in a task. It is not called while the channel still has a
+    press pending in the core's StateStore. after_depth() is read at every
+    sample (--gui).
+    """
+
+    def __init__(self, core, duration: float, rate: float, sample_every: float, press=None, after_depth=None):
+        self.core = core
+        self.duration = duration
+        self.rate = rate
+        self.sample_every = sample_every
+        self.press = press or self._send
+        self.after_depth = after_depth or (lambda: None)
+        self.samples = []
+        self.skipped = 0
+        self._channels = []
+        self._tasks = set()
+        self._started = None
+        # Each snapshot's percentiles then cover about one sample interval
+        core.telemetry.window = max(10, int(rate * sample_every))
+
+    def _send(self, device, channel: int):
+        task = asyncio.get_running_loop().create_task(self.core.send(device, channel, "toggle"))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def sample(self) -> Sample:
+        # Garbage that is merely uncollected yet is not a leak
+        gc.collect()
+        snapshot = self.core.telemetry.snapshot()
+        counts = snapshot["devices"].values()
+        command = snapshot["phases"].get("command", {})
+        sample = Sample(t=round(time.monotonic() - self._started, 1),
+                        commands=sum(d["ok"] + d["failed"] for d in counts),
+                        failures=sum(d["failed"] for d in counts),
+                        rss_mb=rss_mb(), threads=thread_count(), handles=handle_count(),
+                        after_depth=self.after_depth(),
+                        p50=command.get("p50", 0.0), p95=command.get("p95", 0.0), skipped=self.skipped,
+                        backlog=sum(1 for d, ch in self._channels if self.core.state.is_pending(d.mac, ch)))
+        self.samples.append(sample)
+        return sample
+
+    async def run(self, on_sample=None) -> list:
+        channels = self._channels = [(d, ch) for d in self.core.registry for ch in d.channels]
+        if not channels:
+            raise ValueError("no switchers configured")
+        self._started = time.monotonic()
+        end = self._started + self.duration
+        next_sample = self._started + self.sample_every
+        interval = 1.0 / self.rate
+        presses = 0
+        while time.monotonic() < end:
+            device, channel = channels[presses % len(channels)]
+            if self.core.state.is_pending(device.mac, channel):
+                self.skipped += 1
+            else:
+                self.press(device, channel)
+            presses += 1
+            # Paced from the start, so slow presses do not lower the rate
+            await asyncio.sleep(max(0.0, self._started + presses * interval - time.monotonic()))
+            if next_sample <= time.monotonic() < end:
+                sample = self.sample()
+                next_sample += self.sample_every
+                if on_sample is not None:
+                    on_sample(sample)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        sample = self.sample()
+        if on_sample is not None:
+            on_sample(sample)
+        return self.samples
+
+
+def _simulated_config() -> dict:
+    return {"devices": [{"name": f"soak{i + 1}", "mac": mac, "type": 2} for i, mac in enumerate(SOAK_MACS)]}
+
+
+def _simulated_transport(time_scale: float, seed: int):
+    from devices import DeviceRegistry
+    from fake_transport import REALISTIC, FakeTransport
+
+    return FakeTransport((d.mac for d in DeviceRegistry.from_config(_simulated_config())), profile=REALISTIC,
+                         time_scale=time_scale, seed=seed)
+
+
+def run_headless(duration: float = DEFAULT_DURATION, rate: float = DEFAULT_RATE, sample_every: float = DEFAULT_SAMPLE,
+                 transport=None, config: dict = None, on_sample=None) -> list:
+    from switcher_core import SwitcherCore
+
+    core = SwitcherCore(config if config is not None else _simulated_config(), transport=transport).start()
+    try:
+        run = SoakRun(core, duration, rate, sample_every)
+        return core.loop.run(run.run(on_sample))
+    finally:
+        core.close()
+
+
+def run_gui(duration: float = DEFAULT_DURATION, rate: float = DEFAULT_RATE, sample_every: float = DEFAULT_SAMPLE,
+            transport=None, on_sample=None) -> list:
+    """Press the dashboard buttons of a real SwitchApp window (needs a display)."""
+    import tkinter as tk
+    from gui import SwitchApp
+
+    root = tk.Tk()
+    app = SwitchApp(root, transport=transport)
+    depth = [None]
+
+    def watch_after_queue():
+        # Read on the Tk thread; the sampler on the BLE loop picks up the latest
+        depth[0] = len(root.tk.splitlist(root.tk.call("after", "info")))
+        root.after(1000, watch_after_queue)
+
+    def press(device, channel):
+        app.call_soon(lambda: app.on_device_action(device.name, channel, "toggle"))
+
+    run = SoakRun(app.core, duration, rate, sample_every, press=press, after_depth=lambda: depth[0])
+    watch_after_queue()
+    future = app.loop.submit(run.run(on_sample))
+    future.add_done_callback(lambda _f: app.call_soon(root.quit))
+    try:
+        root.mainloop()
+    finally:
+        app.on_close()
+    return future.result()
+
+
+def format_sample(s: Sample) -> str:
+    return (f"{s.t:>8.1f}s {s.commands:>7} {s.failures:>5} {s.rss_mb or 0:>8.1f} {s.threads:>4} "
+            f"{s.handles if s.handles is not None else '-':>5} {s.after_depth if s.after_depth is not None else '-':>5} "
+            f"{s.p50:>6.0f}ms {s.p95:>6.0f}ms {s.skipped:>5} {s.backlog:>4}")
+
+
+HEADER = (f"{'time':>9} {'cmds':>7} {'fail':>5} {'rss MB':>8} {'thr':>4} {'hdl':>5} {'after':>5} {'p50':>8} {'p95':>8}"
+          f" {'skip':>5} {'busy':>4}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="soak", description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="toggles per second")
+    parser.add_argument("--sample", type=float, default=DEFAULT_SAMPLE, help="seconds between samples")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP,
+                        help="seconds before the baseline sample")
+    parser.add_argument("--real", action="store_true", help="use the configured switchers over BLE")
+    parser.add_argument("--gui", action="store_true", help="press through the Tk window")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="simulated: wall seconds per model second")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    for f in fields(Limits):
+        parser.add_argument(f"--max-{f.name.replace('_', '-')}", dest=f.name, type=type(f.default), default=f.default)
+    args = parser.parse_args(argv)
+    limits = Limits(**{f.name: getattr(args, f.name) for f in fields(Limits)})
+
+    transport = None
+    if not args.real:
+        # Keep simulated switchers out of the real state/profile/health files
+        os.environ["XDG_CONFIG_HOME" if sys.platform != "win32" else "APPDATA"] = tempfile.mkdtemp()
+        transport = _simulated_transport(args.time_scale, args.seed)
+    if not args.json:
+        print(HEADER, flush=True)
+    on_sample = None if args.json else (lambda s: print(format_sample(s), flush=True))
+    try:
+        if args.gui:
+            if not args.real:
+                from switcher_core import ensure_user_config, write_config
+
+                ensure_user_config()
+                write_config(_simulated_config())
+            samples = run_gui(args.duration, args.rate, args.sample, transport, on_sample)
+        else:
+            from switcher_core import load_config
+
+            config = load_config() if args.real else None
+            samples = run_headless(args.duration, args.rate, args.sample, transport, config, on_sample)
+    except ConfigError as e:
+        print(f"Unreadable config: {e}", file=sys.stderr)
+        return 2
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    breaches = evaluate(samples, limits, args.warmup)
+    if args.json:
+        print(json.dumps({"samples": [asdict(s) for s in samples], "limits": asdict(limits),
+                          "breaches": breaches, "ok": not breaches}, indent=2))
+    else:
+        print("\n".join(["", "FAILED:", *(f"  {b}" for b in breaches)]) if breaches else "\nok")
+    return 1 if breaches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
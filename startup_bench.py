@@ -0,0 +1,171 @@
+"""Cold-start benchmark: time to first paint and to the first completed command.
+
+    python -m startup_bench                  # 5 cold starts of the GUI, lazy vs eager BLE import
+    python -m startup_bench --runs 10 --json
+    python -m startup_bench --headless       # SwitcherCore only, no Tk window
+
+Every run is a fresh interpreter (the cost being measured is mostly
+imports), started with an empty config directory holding one simulated
+switcher. Two orders are compared:
+
+    eager  the BLE stack (bleak, pyswitcherio) is imported before the
+           window is built, as the app used to do
+    lazy   the window is built and painted first; the BLE stack loads on
+           the core's loop thread meanwhile, as the app does now
+
+Times are wall seconds since the child process was spawned:
+
+    imported       the app module is imported
+    first_paint    the window has been drawn (Tk is idle after mapping it);
+                   headless: the core is constructed
+    ble_ready      the BLE stack is imported and the pool exists
+    first_command  a command sent right after the first paint is acknowledged
+
+This module only imports the standard library at the top so the child
+processes measure the app, not the benchmark.
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ORDERS = ("eager", "lazy")
+METRICS = ("imported", "first_paint", "ble_ready", "first_command")
+BENCH_MAC = "AA:BB:CC:DD:EE:01"
+
+
+def _child(order: str, headless: bool, spawned: float) -> dict:
+    marks = {}
+
+    def mark(name):
+        marks.setdefault(name, time.time() - spawned)
+
+    def install_fake(core):
+        # Runs on the loop thread like SwitcherCore.preload(); importing the
+        # fake transport loads the same modules the BLE transport needs.
+        # The link itself is instant, so only the app's own overhead counts.
+        from fake_transport import FakeTransport, LinkProfile
+
+        instant = LinkProfile(advertise=(0.0, 0.0), connect=(0.0, 0.0), write=(0.0, 0.0))
+        core.transport = FakeTransport([BENCH_MAC], profile=instant)
+        core.pool  # builds it
+        mark("ble_ready")
+
+    if order == "eager":
+        import connection_pool  # noqa: F401
+    if headless:
+        from switcher_core import SwitcherCore
+
+        mark("imported")
+        core = SwitcherCore().start()
+        core.loop.call_soon(install_fake, core)
+        mark("first_paint")
+        device = core.registry.by_mac(BENCH_MAC)
+        try:
+            result = core.loop.run(core.send(device, 1, "on", force=True), timeout=30)
+        finally:
+            core.close()
+        mark("first_command")
+        return {"marks": marks, "ok": result.ok}
+
+    import tkinter as tk
+    import gui
+
+    mark("imported")
+    root = tk.Tk()
+    app = gui.SwitchApp(root)
+    # Queued before the app's own preload, so the pool is built with the fake
+    app.core.loop.call_soon(install_fake, app.core)
+    outcome = {}
+
+    def painted():
+        mark("first_paint")
+        device = app.core.registry.by_mac(BENCH_MAC)
+        fut = app.loop.submit(app.core.send(device, 1, "on", force=True))
+
+        def check():
+            if not fut.done():
+                root.after(2, check)
+                return
+            mark("first_command")
+            outcome["ok"] = fut.exception() is None and fut.result().ok
+            app.on_close()
+
+        check()
+
+    root.after_idle(painted)
+    root.mainloop()
+    return {"marks": marks, "ok": outcome.get("ok", False)}
+
+
+def run_once(order: str, headless: bool = False) -> dict:
+    from switcher_core import APP_DIR_NAME
+
+    with tempfile.TemporaryDirectory() as home:
+        appdir = os.path.join(home, APP_DIR_NAME)
+        os.makedirs(appdir)
+        with open(os.path.join(appdir, "config.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": 2, "selected": "bench",
+                       "devices": [{"name": "bench", "mac": BENCH_MAC, "type": 2}]}, f)
+        env = {**os.environ, "XDG_CONFIG_HOME": home, "APPDATA": home}
+        args = [sys.executable, os.path.abspath(__file__), "--child", order, str(time.time())]
+        if headless:
+            args.append("--headless")
+        proc = subprocess.run(args, env=env, capture_output=True, text=True, timeout=120,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"startup child failed ({proc.returncode}): {proc.stderr.strip()[-500:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))]
+
+
+def run_all(runs: int = 5, headless: bool = False, orders=ORDERS) -> dict:
+    report = {"runs": runs, "headless": headless, "orders": {}}
+    for order in orders:
+        samples = [run_once(order, headless) for _ in range(runs)]
+        report["orders"][order] = {
+            "failures": sum(not s["ok"] for s in samples),
+            **{m: {"p50": _percentile([s["marks"][m] for s in samples], 50),
+                   "max": max(s["marks"][m] for s in samples)} for m in METRICS},
+        }
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{report['runs']} cold starts each{' (headless)' if report['headless'] else ''}, "
+             "p50 / max in ms since spawn", "",
+             f"{'order':<6} " + " ".join(f"{m:>17}" for m in METRICS) + f" {'fail':>5}"]
+    for order, r in report["orders"].items():
+        cells = " ".join(f"{r[m]['p50'] * 1000:>8.0f} / {r[m]['max'] * 1000:>5.0f}" for m in METRICS)
+        lines.append(f"{order:<6} {cells} {r['failures']:>5}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="startup_bench", description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--headless", action="store_true", help="measure SwitcherCore without a Tk window")
+    parser.add_argument("--order", action="append", choices=ORDERS, help="repeatable; default: both")
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    parser.add_argument("--child", nargs=2, metavar=("ORDER", "SPAWNED"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        print(json.dumps(_child(args.child[0], args.headless, float(args.child[1]))))
+        return 0
+    report = run_all(args.runs, args.headless, tuple(args.order or ORDERS))
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""Tracked on/off state per device channel.
+
+Every channel has a confirmed state (what the switch acknowledged last)
+and, while a command is in flight, a pending state. A press sets pending
+right away so the UI can show it, the ack makes it confirmed, and a
+failure just drops it, which rolls the display back to the confirmed
+state. States are user-level ("on" means the light is on), i.e. before the
+device's invert setting is applied.
+
+Confirmed states are persisted to state.json ({"MAC/channel": "on"}),
+shared by the GUI, the CLI and the daemon. Writes happen on a background
+thread after a short debounce, never on the BLE loop, and only the
+channels this process changed are written over what is on disk, so
+another process's states are kept. A confirmed state younger than
+ttl seconds is trusted enough to skip a write that would not change it;
+older ones are re-sent, since the switch may have been pressed by hand.
+States the switch reported by itself (report()) are shown but never
+trusted for skipping: the notification format is inferred, not
+documented, and a misread one must not swallow a real press.
+"""
+import itertools
+import json
+import logging
+import threading
+import time
+from typing import Optional
+
+from config_store import DEFAULT_DEBOUNCE, DeferredWriter, atomic_write_json
+
+_LOGGER = logging.getLogger(__name__)
+
+# How long a confirmed state is trusted for skipping redundant writes
+DEFAULT_STATE_TTL = 900.0
+
+
+def state_key(mac: str, channel: int) -> str:
+    return f"{mac.upper()}/{channel}"
+
+
+class _Channel:
+    __slots__ = ("confirmed", "confirmed_at", "pending", "token")
+
+    def __init__(self, confirmed=None, confirmed_at=0.0):
+        self.confirmed = confirmed
+        self.confirmed_at = confirmed_at
+        self.pending = None
+        self.token = None
+
+
+class StateStore:
+    """Thread-safe; listeners are called as fn(mac, channel, shown, pending) on the changing thread."""
+
+    def __init__(self, path: str = None, ttl: float = DEFAULT_STATE_TTL, debounce: float = DEFAULT_DEBOUNCE):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._channels = {}
+        # Keys confirmed since the last write
+        self._dirty = set()
+        self._writer = DeferredWriter(self._write, debounce, name="state-writer") if path else None
+        self._tokens = itertools.count(1)
+        self._listeners = []
+        if path:
+            self._load()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            _LOGGER.warning("Ignoring unreadable %s: %s", self.path, e)
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _load(self):
+        for key, value in self._read().items():
+            # Loaded states are never fresh enough to skip a write
+            if value in ("on", "off"):
+                self._channels[key.upper()] = _Channel(value)
+
+    def save(self):
+        """Write the changed channels soon, on a background thread."""
+        if self._writer is not None:
+            self._writer.schedule()
+
+    def flush(self):
+        """Write pending changes now (e.g. before exiting)."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def _write(self):
+        with self._lock:
+            ours = {k: self._channels[k].confirmed for k in self._dirty}
+            self._dirty.clear()
+        # Other processes (GUI, CLI, daemon) share the file: keep their channels
+        data = self._read()
+        data.update(ours)
+        try:
+            atomic_write_json(self.path, data)
+        except OSError as e:
+            _LOGGER.warning("Could not save %s: %s", self.path, e)
+            with self._lock:
+                self._dirty.update(ours)
+            self._writer.schedule()
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def _notify(self, mac, channel, ch: _Channel):
+        shown = ch.pending or ch.confirmed
+        for fn in list(self._listeners):
+            try:
+                fn(mac, channel, shown, ch.pending is not None)
+            except Exception:
+                _LOGGER.exception("State listener failed")
+
+    def _channel(self, mac: str, channel: int) -> _Channel:
+        key = state_key(mac, channel)
+        ch = self._channels.get(key)
+        if ch is None:
+            ch = self._channels[key] = _Channel()
+        return ch
+
+    def get(self, mac: str, channel: int) -> Optional[str]:
+        """State to show: the pending one while a command is in flight, else the confirmed one."""
+        with self._lock:
+            ch = self._channels.get(state_key(mac, channel))
+            return None if ch is None else (ch.pending or ch.confirmed)
+
+    def confirmed(self, mac: str, channel: int) -> Optional[str]:
+        with self._lock:
+            ch = self._channels.get(state_key(mac, channel))
+            return None if ch is None else ch.confirmed
+
+    def is_pending(self, mac: str, channel: int) -> bool:
+        with self._lock:
+            ch = self._channels.get(state_key(mac, channel))
+            return ch is not None and ch.pending is not None
+
+    def toggled(self, mac: str, channel: int) -> str:
+        """The action that flips what is currently shown (unknown counts as off)."""
+        return "off" if self.get(mac, channel) == "on" else "on"
+
+    def is_redundant(self, mac: str, channel: int, desired: str) -> bool:
+        """True if desired is already confirmed recently and nothing else is in flight."""
+        with self._lock:
+            ch = self._channels.get(state_key(mac, channel))
+            return (ch is not None and ch.pending is None and ch.confirmed == desired
+                    and time.monotonic() - ch.confirmed_at < self.ttl)
+
+    def begin(self, mac: str, channel: int, desired: str) -> int:
+        """Show desired optimistically; returns a token for confirm()/rollback()."""
+        with self._lock:
+            ch = self._channel(mac, channel)
+            ch.pending = desired
+            ch.token = next(self._tokens)
+            token = ch.token
+        self._notify(mac, channel, ch)
+        return token
+
+    def confirm(self, mac: str, channel: int, actual: str, token: int = None):
+        """Record what the switch acknowledged; clears pending unless a newer press is in flight."""
+        with self._lock:
+            ch = self._channel(mac, channel)
+            ch.confirmed = actual
+            ch.confirmed_at = time.monotonic()
+            self._dirty.add(state_key(mac, channel))
+            if token is None or token == ch.token:
+                ch.pending = None
+        self._notify(mac, channel, ch)
+        self.save()
+
+    def report(self, mac: str, channel: int, actual: str) -> bool:
+        """Record a state the switch reported by itself (a notification).
+
+        A command in flight keeps its pending state; its ack settles it. A
+        reported change is not trusted by is_redundant(). Returns True if
+        this changed the known state while nothing was in flight, i.e. the
+        switch was operated by hand.
+        """
+        with self._lock:
+            ch = self._channel(mac, channel)
+            # While pending, what is shown does not change (and the ack will save)
+            external = ch.pending is None and ch.confirmed != actual
+            if ch.confirmed != actual:
+                # Like a loaded state: shown, but not fresh enough to skip a write
+                ch.confirmed = actual
+                ch.confirmed_at = 0.0
+                self._dirty.add(state_key(mac, channel))
+        if external:
+            self._notify(mac, channel, ch)
+            self.save()
+        return external
+
+    def rollback(self, mac: str, channel: int, token: int):
+        with self._lock:
+            ch = self._channel(mac, channel)
+            if token != ch.token:
+                return
+            ch.pending = None
+        self._notify(mac, channel, ch)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {k: c.pending or c.confirmed for k, c in self._channels.items()}
@@ -0,0 +1,384 @@
+"""GUI-free control core shared by the Tk app and the command line.
+
+Holds the config file helpers and SwitcherCore, which bundles the shared
+event loop, the connection pool and the device registry. Nothing here
+imports tkinter, and nothing touches the filesystem at import time.
+"""
+import asyncio
+import dataclasses
+import logging
+import os
+import shutil
+import sys
+import threading
+
+import config_store
+from command_events import CommandResult
+from config_store import ConfigError  # noqa: F401 (re-exported)
+from device_reports import HealthCache
+from devices import Device, DeviceRegistry
+from retry_policy import RetryPolicy
+from scenes import load_scenes
+from scheduler import Scheduler, load_rules
+from state_store import DEFAULT_STATE_TTL, StateStore, state_key  # noqa: F401 (re-exported)
+
+_LOGGER = logging.getLogger(__name__)
+
+APP_DIR_NAME = "IO-Switcher-Local"
+
+
+# Resource helpers to support PyInstaller onefile as well as running from source
+def resource_path(relative_path: str) -> str:
+    """Return absolute path to resource; handles PyInstaller _MEIPASS when bundled."""
+    base = getattr(sys, '_MEIPASS', os.path.abspath(os.path.dirname(__file__)))
+    return os.path.join(base, relative_path)
+
+
+def get_user_config_dir() -> str:
+    """Return the writable app directory in %APPDATA% (win) or XDG for others."""
+    if sys.platform == 'win32':
+        base = os.environ.get('APPDATA', os.path.expanduser("~"))
+    else:
+        base = os.environ.get('XDG_CONFIG_HOME', os.path.expanduser("~/.config"))
+    appdir = os.path.join(base, APP_DIR_NAME)
+    os.makedirs(appdir, exist_ok=True)
+    return appdir
+
+
+def get_user_config_path() -> str:
+    """Return the path to the writable user config."""
+    return os.path.join(get_user_config_dir(), "config.json")
+
+
+def ensure_user_config() -> str:
+    """Ensure a writable user config exists. If missing, copy the bundled default config.json into user path."""
+    user_config = get_user_config_path()
+    if not os.path.exists(user_config):
+        bundled = resource_path('config.json')
+        try:
+            shutil.copyfile(bundled, user_config)
+        except Exception:
+            # Fall back to creating an empty/default config
+            try:
+                config_store.write_config(config_store.default_config(), user_config)
+            except Exception:
+                pass
+    return user_config
+
+
+def load_config(path: str = None) -> dict:
+    """Read (and migrate) the config; raises ConfigError if the file is unreadable."""
+    return config_store.read_config(path or ensure_user_config())
+
+
+def write_config(config: dict, path: str = None):
+    config_store.write_config(config, path or ensure_user_config())
+
+
+def get_profiles_path() -> str:
+    """Remembered GATT profiles per switcher, next to config.json."""
+    return os.path.join(os.path.dirname(get_user_config_path()), "profiles.json")
+
+
+def get_state_path() -> str:
+    return os.path.join(get_user_config_dir(), "state.json")
+
+
+def get_health_path() -> str:
+    return os.path.join(get_user_config_dir(), "health.json")
+
+
+def load_health() -> HealthCache:
+    """Battery level and last report per switcher, as last reported over BLE."""
+    return HealthCache(get_health_path())
+
+
+def load_state(ttl: float = DEFAULT_STATE_TTL) -> StateStore:
+    """Confirmed on/off per "MAC/channel", shared by the GUI, CLI and daemon."""
+    return StateStore(get_state_path(), ttl)
+
+
+def parse_target(target: str):
+    """Split "name:2" into ("name", 2); plain targets give (target, None).
+
+    MAC addresses contain colons too, so only a trailing ":1"/":2" counts.
+    """
+    head, sep, tail = target.rpartition(":")
+    if sep and tail in ("1", "2") and head:
+        return head, int(tail)
+    return target, None
+
+
+def resolve_target(registry: DeviceRegistry, target: str):
+    """(Device, channels) for a device name, MAC or "name:channel"; raises KeyError if unknown."""
+    name, channel = parse_target(target)
+    device = registry.get(name) or registry.by_mac(name)
+    if device is None:
+        if name.count(":") != 5:
+            raise KeyError(f"Unknown device: {target}")
+        # Unregistered MAC: treat as a 2-gang switcher without invert
+        device = Device(name=name.upper(), mac=name.upper())
+    if channel is not None:
+        if channel not in device.channels:
+            raise KeyError(f"{device.name} has no channel {channel}")
+        return device, (channel,)
+    return device, device.channels
+
+
+class SwitcherCore:
+    """Event loop + connection pool + device registry, without any UI.
+
+    The BLE stack (bleak, pyswitcherio) is only imported when the pool is
+    first used, so a front end can show itself before paying for it (and
+    preload() it in the background), and code that only needs config
+    (e.g. CLI "status") never does.
+    """
+
+    def __init__(self, config: dict = None, transport=None):
+        from device_profiles import ProfileStore
+        from event_loop import LoopThread
+        from telemetry import Telemetry
+
+        self.config = load_config() if config is None else config
+        self.registry = DeviceRegistry.from_config(self.config)
+        # Used when the pool is built; None means real BLE
+        self.transport = transport
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # One event loop for every BLE operation, alive as long as the core
+        self.loop = LoopThread()
+        # Per-phase timings; "trace_file" in the config also writes them as JSON lines
+        self.telemetry = Telemetry(trace_path=self.config.get("trace_file") or None)
+        # ble_recording.Recorder when "record_file" is set: every radio operation
+        # and command event as JSON lines, replayable with ReplayTransport
+        self.recorder = None
+        # GATT layout remembered per switcher, so reconnects only resolve the switch services
+        self.profiles = ProfileStore(get_profiles_path())
+        # Tracked per-channel state; "state_ttl" is how long an ack is trusted
+        # for skipping writes that would not change anything (0 = never skip)
+        self.state = load_state(float(self.config.get("state_ttl", DEFAULT_STATE_TTL)))
+        # Battery/last report per switcher, fed by notifications (see device_reports)
+        self.health = load_health()
+        self._report_listeners = []
+        # presence.PresenceMonitor once start_presence() ran with config["presence"] set
+        self.presence = None
+        self._presence_wanted = False
+        # Timed/recurring rules from config["schedules"]; runs once start_scheduler() is called
+        self.scheduler = Scheduler(self._fire_rule, self._prewarm_rule)
+        self.scheduler.set_rules(load_rules(self.config))
+        # Named multi-step actions from config["scenes"]
+        self.scenes = load_scenes(self.config)
+
+    @property
+    def pool(self):
+        """Warm BLE connections, one per switcher (shared by both channels); built on first use."""
+        with self._pool_lock:
+            if self._pool is None:
+                from adapters import ble_transport
+                from connection_pool import ConnectionPool
+
+                # Several local adapters are used together when available
+                transport = self.transport if self.transport is not None else ble_transport(self.config)
+                if self.config.get("record_file"):
+                    from ble_recording import Recorder, RecordingTransport
+
+                    self.recorder = Recorder(self.config["record_file"])
+                    transport = RecordingTransport(transport, self.recorder)
+                # "idle_timeout": seconds an unused link stays open,
+                # "max_connections": simultaneous links across all switchers
+                # (by default what all adapters together can hold)
+                limits = {}
+                if "idle_timeout" in self.config:
+                    limits["idle_timeout"] = float(self.config["idle_timeout"])
+                if "max_connections" in self.config:
+                    limits["max_connections"] = int(self.config["max_connections"])
+                elif hasattr(transport, "adapters"):
+                    limits["max_connections"] = transport.max_connections
+                self._pool = ConnectionPool(transport=transport, telemetry=self.telemetry,
+                                            profiles=self.profiles, retry=self._retry_policy(),
+                                            on_report=self._on_report, **limits)
+            return self._pool
+
+    @pool.setter
+    def pool(self, pool):
+        with self._pool_lock:
+            self._pool = pool
+
+    def _retry_policy(self) -> RetryPolicy:
+        # Retries/backoff/breaker from config["retry"]
+        try:
+            return RetryPolicy.from_config(self.config)
+        except (TypeError, ValueError) as e:
+            _LOGGER.warning("Ignoring retry settings: %s", e)
+            return RetryPolicy()
+
+    def start(self):
+        self.loop.start()
+        return self
+
+    def add_report_listener(self, fn):
+        """fn(DeviceReport) for every notification, called on the loop thread.
+
+        States are user-level here, and a state nobody asked for arrives as
+        kind "press": the switch was used by hand.
+        """
+        self._report_listeners.append(fn)
+
+    def _on_report(self, report):
+        if report.kind == "state":
+            device = self.registry.by_mac(report.mac)
+            state = device.wire_action(report.state) if device is not None else report.state
+            pressed = self.state.report(report.mac, report.channel, state)
+            report = dataclasses.replace(report, kind="press" if pressed else "state", state=state)
+            if pressed:
+                _LOGGER.info("%s: channel %d switched %s at the switch", report.mac, report.channel, state)
+        self.health.update(report)
+        for fn in list(self._report_listeners):
+            try:
+                fn(report)
+            except Exception:
+                _LOGGER.exception("Report listener failed")
+
+    def preload(self):
+        """Import the BLE stack and build the pool on the loop thread, without blocking the caller."""
+        self.loop.call_soon(lambda: self.pool)
+
+    def apply_config(self, config: dict):
+        """Pick up an edited config (e.g. changed by another process) without restarting.
+
+        Existing connections stay open; switchers that were removed just
+        idle out. Call from the thread that owns the core's front end.
+        """
+        self.config = config
+        self.registry.replace(DeviceRegistry.from_config(config))
+        if self._pool is not None:
+            from connection_pool import DEFAULT_IDLE_TIMEOUT
+
+            self._pool.set_idle_timeout(float(config.get("idle_timeout", DEFAULT_IDLE_TIMEOUT)))
+            self._pool.set_retry_policy(self._retry_policy())
+        self.state.ttl = float(config.get("state_ttl", DEFAULT_STATE_TTL))
+        self.scenes = load_scenes(config)
+        rules = load_rules(config)
+        if self.loop.is_running:
+            self.loop.call_soon(self.scheduler.set_rules, rules)
+            if self._presence_wanted:
+                self.loop.call_soon(self._configure_presence)
+        else:
+            self.scheduler.set_rules(rules)
+
+    def start_scheduler(self):
+        """Run schedules (long-running front ends only: the GUI and the daemon)."""
+        self.loop.call_soon(self.scheduler.start)
+
+    def start_presence(self):
+        """Track switchers' advertisements if config["presence"] asks for it (GUI and daemon)."""
+        self._presence_wanted = True
+        self.loop.call_soon(self._configure_presence)
+
+    def _configure_presence(self):
+        # Loop thread: start, retune or stop the monitor to match the config
+        from presence import PresenceMonitor, presence_settings
+
+        try:
+            settings = presence_settings(self.config)
+        except (TypeError, ValueError) as e:
+            _LOGGER.warning("Ignoring presence settings: %s", e)
+            settings = None
+        if settings is None:
+            if self.presence is not None:
+                monitor, self.presence = self.presence, None
+                self.pool.set_presence(None)
+                asyncio.get_running_loop().create_task(monitor.close())
+            return
+        if self.presence is not None:
+            self.presence.configure(**settings)
+            return
+        pool = self.pool
+        self.presence = PresenceMonitor(pool, lambda: [d.mac for d in self.registry],
+                                        scanner_factory=getattr(pool.transport, "scanner", None), **settings)
+        pool.set_presence(self.presence)
+        self.presence.start()
+
+    async def _fire_rule(self, rule) -> bool:
+        outcomes = await self.send_targets([self.resolve(rule.target)], rule.action)
+        return all(not isinstance(r, Exception) and r.ok for _, _, r in outcomes)
+
+    async def _prewarm_rule(self, rule):
+        device, _ = self.resolve(rule.target)
+        await self.pool.warm(device.mac)
+
+    def resolve(self, target: str):
+        """Return (Device, channels) for a device name, MAC or "name:channel"."""
+        return resolve_target(self.registry, target)
+
+    async def send(self, device, channel: int, action: str, on_event=None, force: bool = False):
+        """Send a user-level on/off/toggle to one channel, tracking its state.
+
+        Invert is applied here. The channel shows the new state at once,
+        which becomes confirmed on ack or rolls back on failure. A press
+        that matches the recently confirmed state is answered without a
+        write (result.skipped) unless force is set.
+        """
+        if action == "toggle":
+            action = self.state.toggled(device.mac, channel)
+        if not force and self.state.is_redundant(device.mac, channel, action):
+            return CommandResult(True, device.mac.upper(), channel, device.wire_action(action),
+                                 attempts=0, skipped=True)
+        # Built on first use, with the recorder if "record_file" is set
+        pool = self.pool
+        if self.recorder is not None:
+            on_event = self._recording(on_event)
+        token = self.state.begin(device.mac, channel, action)
+        try:
+            result = await pool.send(device.mac, channel, device.wire_action(action), on_event)
+        except BaseException:
+            self.state.rollback(device.mac, channel, token)
+            raise
+        if result.ok:
+            # A coalesced press reports the write that actually went out
+            self.state.confirm(device.mac, channel, device.wire_action(result.action), token)
+        else:
+            self.state.rollback(device.mac, channel, token)
+        return result
+
+    def _recording(self, on_event):
+        def recorded(event):
+            self.recorder.command_event(event)
+            if on_event is not None:
+                on_event(event)
+        return recorded
+
+    async def run_scene(self, name: str, on_event=None):
+        """Run the named scene (see scenes.py); returns a SceneResult. Raises KeyError if unknown."""
+        from scenes import run_scene
+
+        scene = self.scenes.get(name)
+        if scene is None:
+            raise KeyError(f"Unknown scene: {name}")
+        result = await run_scene(scene, self, on_event)
+        self.telemetry.record("scene", result.elapsed, ok=result.ok, scene=name, steps=len(result.steps))
+        return result
+
+    async def send_targets(self, targets, action: str, on_event=None, force: bool = False):
+        """Fan action out to (device, channels) pairs in parallel."""
+        jobs = [(d, ch) for d, chs in targets for ch in chs]
+        outcomes = await asyncio.gather(*(self.send(d, ch, action, on_event, force) for d, ch in jobs),
+                                        return_exceptions=True)
+        return [(d, ch, r) for (d, ch), r in zip(jobs, outcomes)]
+
+    def close(self, timeout: float = 5.0):
+        if self.loop.is_running:
+            try:
+                self.loop.run(self.scheduler.stop(), timeout=timeout)
+                if self.presence is not None:
+                    self.loop.run(self.presence.close(), timeout=timeout)
+                if self._pool is not None:
+                    self.loop.run(self._pool.close(), timeout=timeout)
+            finally:
+                self.loop.stop()
+        self.state.close()
+        self.profiles.close()
+        self.health.close()
+        self.telemetry.close()
+        if self.recorder is not None:
+            self.recorder.close()
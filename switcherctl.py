@@ -0,0 +1,274 @@
+"""Command line control for I/O switchers, without the Tk GUI.
+
+    python -m switcherctl on 거실 안방:2      # several devices in one call
+    python -m switcherctl off all
+    python -m switcherctl toggle AA:BB:CC:DD:EE:01:1
+    python -m switcherctl scan --timeout 3
+    python -m switcherctl status
+    python -m switcherctl schedule add lamp 거실 off --time 23:00 --days mon,fri
+    python -m switcherctl schedule list
+    python -m switcherctl scene add 취침 거실:1=on 거실:2=off wait=2 거실:2=on
+    python -m switcherctl scene run 취침
+
+Targets are device names from the config, MAC addresses, or "all"; append
+":1"/":2" to address a single channel. Exit status is 0 when every command
+succeeded, 1 when any failed and 2 for usage errors.
+"""
+import argparse
+import concurrent.futures
+import sys
+
+from switcher_core import (ConfigError, load_config, load_health, load_state, parse_target, resolve_target,
+                           write_config)
+from device_reports import format_battery
+from scenes import DEFAULT_BATCH_TIMEOUT
+from devices import DeviceRegistry
+
+
+def _resolve_all(core, targets):
+    if targets == ["all"]:
+        return [(d, d.channels) for d in core.registry]
+    return [core.resolve(t) for t in targets]
+
+
+def cmd_switch(args) -> int:
+    from switcher_core import SwitcherCore
+
+    config = load_config()
+    if args.record:
+        config["record_file"] = args.record
+    core = SwitcherCore(config)
+    if args.trace:
+        core.telemetry.set_trace_file(args.trace)
+    try:
+        resolved = _resolve_all(core, args.targets)
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 2
+    if not resolved:
+        print("No devices configured.", file=sys.stderr)
+        return 2
+
+    core.start()
+    try:
+        # toggle is resolved per channel from the tracked state
+        outcomes = core.loop.run(core.send_targets(resolved, args.command, force=args.force),
+                                 timeout=args.timeout)
+    except concurrent.futures.TimeoutError:
+        print(f"Timed out after {args.timeout:g}s", file=sys.stderr)
+        return 1
+    finally:
+        core.close()
+
+    failed = 0
+    for device, ch, result in outcomes:
+        if isinstance(result, Exception) or not result.ok:
+            failed += 1
+            reason = result if isinstance(result, Exception) else result.error
+            print(f"{device.name} ch{ch} {args.command}: FAILED ({reason})")
+        elif result.skipped:
+            print(f"{device.name} ch{ch} {core.state.get(device.mac, ch)}: already")
+        else:
+            print(f"{device.name} ch{ch} {core.state.get(device.mac, ch)}: ok ({result.elapsed * 1000:.0f} ms)")
+    return 1 if failed else 0
+
+
+def cmd_scan(args) -> int:
+    from discovery import DeviceCache, stream_scan
+    from event_loop import LoopThread
+
+    def found(s):
+        print(f"{s.name}\t{s.address}\t{s.rssi if s.rssi is not None else '?'} dBm", flush=True)
+
+    loop = LoopThread()
+    loop.start()
+    try:
+        sightings = loop.run(stream_scan(DeviceCache(), found, timeout=args.timeout))
+    finally:
+        loop.stop()
+    if not sightings:
+        print("No SWITCHER_M devices found.", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_status(args) -> int:
+    config = load_config()
+    registry = DeviceRegistry.from_config(config)
+    state = load_state()
+    health = load_health()
+    names = args.targets or registry.names()
+    for name in names:
+        device = registry.get(parse_target(name)[0]) or registry.by_mac(name)
+        if device is None:
+            print(f"{name}: unknown device", file=sys.stderr)
+            continue
+        channels = ", ".join(f"ch{ch}={state.get(device.mac, ch) or '?'}" for ch in device.channels)
+        flags = " invert" if device.invert else ""
+        print(f"{device.name}\t{device.mac}\t{device.type}구{flags}\t{channels}\t"
+              f"battery={format_battery(health.get(device.mac))}")
+    if not names:
+        print("No devices configured.", file=sys.stderr)
+    return 0
+
+
+def cmd_schedule(args) -> int:
+    from datetime import datetime
+    from scheduler import ScheduleRule, load_rules
+
+    config = load_config()
+    rules = load_rules(config)
+    if args.schedule_command == "list":
+        now = datetime.now()
+        for rule in rules:
+            nxt = rule.next_fire(now)
+            print(f"{rule.id}\t{rule.target}\t{rule.action}\t{rule.description}\t"
+                  f"next: {nxt.isoformat(timespec='minutes') if nxt else '-'}")
+        if not rules:
+            print("No schedules.", file=sys.stderr)
+        return 0
+    if args.schedule_command == "remove":
+        kept = [r for r in rules if r.id != args.id]
+        if len(kept) == len(rules):
+            print(f"Unknown schedule: {args.id}", file=sys.stderr)
+            return 2
+        rules = kept
+    else:
+        try:
+            rule = ScheduleRule(args.id, args.target, args.action, at=args.at, time=args.time,
+                                days=args.days.split(",") if args.days else None, cron=args.cron)
+            # Like the GUI: a rule for a device that does not exist would never fire
+            resolve_target(DeviceRegistry.from_config(config), rule.target)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        except KeyError as e:
+            print(e.args[0], file=sys.stderr)
+            return 2
+        rules = [r for r in rules if r.id != rule.id] + [rule]
+    config["schedules"] = [r.to_dict() for r in rules]
+    write_config(config)
+    return 0
+
+
+def cmd_scene(args) -> int:
+    from scenes import Scene, SceneStep, load_scenes
+
+    config = load_config()
+    scenes = load_scenes(config)
+    if args.scene_command == "list":
+        for scene in scenes.values():
+            print(f"{scene.name}\t{scene.description}")
+        if not scenes:
+            print("No scenes.", file=sys.stderr)
+        return 0
+    if args.scene_command == "run":
+        return _run_scene(config, args)
+    if args.scene_command == "remove":
+        if scenes.pop(args.name, None) is None:
+            print(f"Unknown scene: {args.name}", file=sys.stderr)
+            return 2
+    else:
+        try:
+            scenes[args.name] = Scene(args.name, [SceneStep.parse(s) for s in args.steps],
+                                      timeout=args.timeout, rollback=args.rollback)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+    config["scenes"] = [scene.to_dict() for scene in scenes.values()]
+    write_config(config)
+    return 0
+
+
+def _run_scene(config, args) -> int:
+    from switcher_core import SwitcherCore
+
+    if args.record:
+        config["record_file"] = args.record
+    core = SwitcherCore(config)
+    if args.name not in core.scenes:
+        print(f"Unknown scene: {args.name}", file=sys.stderr)
+        return 2
+    core.start()
+    try:
+        result = core.loop.run(core.run_scene(args.name), timeout=args.timeout)
+    except concurrent.futures.TimeoutError:
+        print(f"Scene {args.name}: timed out after {args.timeout:g}s", file=sys.stderr)
+        return 1
+    finally:
+        core.close()
+    for step in result.steps:
+        if not step.ran:
+            status = f"not run{f' ({step.error})' if step.error else ''}"
+        elif step.ok:
+            status = "already" if step.skipped else f"ok ({step.elapsed * 1000:.0f} ms, {step.late * 1000:.0f} ms late)"
+        else:
+            status = f"FAILED ({step.error})"
+        print(f"{step.device} ch{step.channel} {step.action}: {status}")
+    print(result.summary())
+    return 0 if result.ok else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="switcherctl", description="Control I/O switchers over BLE.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("on", "off", "toggle"):
+        p = sub.add_parser(name, help=f"turn channels {name}")
+        p.add_argument("targets", nargs="+", help='device name, MAC, "name:channel" or "all"')
+        p.add_argument("--timeout", type=float, default=60.0, help="give up after this many seconds")
+        p.add_argument("--trace", metavar="FILE", help="append per-phase timings to FILE as JSON lines")
+        p.add_argument("--record", metavar="FILE", help="record the BLE session to FILE for replay")
+        p.add_argument("--force", action="store_true",
+                       help="write even if the channel is already known to be in that state")
+        p.set_defaults(func=cmd_switch)
+    p = sub.add_parser("scan", help="list nearby SWITCHER_M devices as they are found")
+    p.add_argument("--timeout", type=float, default=5.0)
+    p.set_defaults(func=cmd_scan)
+    p = sub.add_parser("status", help="show configured devices and last known state")
+    p.add_argument("targets", nargs="*")
+    p.set_defaults(func=cmd_status)
+    p = sub.add_parser("schedule", help="manage timed actions (run by the GUI and switcherd)")
+    p.set_defaults(func=cmd_schedule)
+    ssub = p.add_subparsers(dest="schedule_command", required=True)
+    ssub.add_parser("list")
+    rm = ssub.add_parser("remove")
+    rm.add_argument("id")
+    add = ssub.add_parser("add", help="add or replace a rule")
+    add.add_argument("id")
+    add.add_argument("target", help='device name, MAC or "name:channel"')
+    add.add_argument("action", choices=("on", "off"))
+    when = add.add_mutually_exclusive_group(required=True)
+    when.add_argument("--at", help="once, at YYYY-MM-DDTHH:MM")
+    when.add_argument("--time", help="every day at HH:MM")
+    when.add_argument("--cron", help='five-field cron expression, e.g. "*/15 6-9 * * 1-5"')
+    add.add_argument("--days", help="with --time: comma-separated mon,tue,...")
+    p = sub.add_parser("scene", help="manage and run scenes (several steps as one unit)")
+    p.set_defaults(func=cmd_scene)
+    ssub = p.add_subparsers(dest="scene_command", required=True)
+    ssub.add_parser("list")
+    rm = ssub.add_parser("remove")
+    rm.add_argument("name")
+    run = ssub.add_parser("run")
+    run.add_argument("name")
+    run.add_argument("--timeout", type=float, default=120.0, help="give up after this many seconds")
+    run.add_argument("--record", metavar="FILE", help="record the BLE session to FILE for replay")
+    add = ssub.add_parser("add", help="add or replace a scene")
+    add.add_argument("name")
+    add.add_argument("steps", nargs="+", help='"name:channel=on|off|toggle" or "wait=SECONDS"')
+    add.add_argument("--timeout", type=float, default=DEFAULT_BATCH_TIMEOUT,
+                     help="seconds each batch may take before the scene fails")
+    add.add_argument("--rollback", action="store_true", help="undo the scene's changes if a step fails")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except ConfigError as e:
+        print(f"Unreadable config: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
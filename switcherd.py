@@ -0,0 +1,459 @@
+"""Local control daemon: HTTP + WebSocket in front of warm BLE connections.
+
+    python -m switcherd                      # 127.0.0.1:8765
+    python -m switcherd --host 0.0.0.0 --token SECRET   # expose on the LAN
+    python -m switcherd --fake               # simulated switchers, for testing
+    python -m switcherd --record s.jsonl     # record the BLE session (ble_recording)
+    python -m switcherd --replay s.jsonl --speed 10   # answer from a recording instead
+
+HTTP (JSON responses):
+    GET  /devices                            all devices with last known state and link health
+    GET  /devices/<name>                     one device
+    POST /devices/<name>/<on|off|toggle>     every channel; ?channel=1|2 for one,
+                                             ?force=1 to write even if already in that state
+    POST /all/<on|off>                       every channel of every device
+    GET  /stats                              per-phase timings and per-device counters
+    GET  /schedules                          schedule rules with fire/miss/lateness stats
+    GET  /scenes                             scenes from the config
+    POST /scenes/<name>                      run a scene; "ok" only if every step succeeded
+
+WebSocket at /ws pushes {"type": "state", ...} whenever a channel's state
+changes ("pending": true while the command is in flight, false once it was
+confirmed or rolled back), {"type": "event", ...} for command progress and
+{"type": "report", ...} for what switchers report by themselves ("press"
+when one was switched by hand, "battery"). Clients may also send
+{"action": "on", "targets": ["name:1", ...]} or {"scene": "name"}.
+
+Browsers let any page send requests to localhost, so requests carrying
+an Origin header other than a loopback one or one listed in
+"daemon_origins" (config.json) are refused with 403. With a token
+(--token, or "daemon_token" in config.json) every request must also send
+"Authorization: Bearer <token>" or ?token=<token> (browsers cannot set
+headers on a WebSocket), or gets 401.
+
+Requests share one SwitcherCore, so connections stay warm between calls,
+and concurrent requests to one device are serialized and coalesced by its
+command queue.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import signal
+import struct
+import sys
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from config_store import ConfigError, ConfigStore
+from switcher_core import SwitcherCore, ensure_user_config
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_HEADER_BYTES = 16 * 1024
+# We take all input from the URL; a body is only drained
+MAX_BODY_BYTES = 64 * 1024
+# Client WebSocket frames are small JSON commands
+MAX_WS_FRAME = 64 * 1024
+WS_CLOSE_TOO_BIG = 1009
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+                405: "Method Not Allowed", 413: "Payload Too Large", 502: "Bad Gateway"}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _ws_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    header = bytearray([0x80 | opcode])
+    n = len(payload)
+    if n < 126:
+        header.append(n)
+    elif n < 65536:
+        header.append(126)
+        header += struct.pack(">H", n)
+    else:
+        header.append(127)
+        header += struct.pack(">Q", n)
+    return bytes(header) + payload
+
+
+class FrameTooLarge(Exception):
+    pass
+
+
+async def _ws_read(reader, max_length: int = MAX_WS_FRAME):
+    """Read one client frame; returns (opcode, payload). Raises FrameTooLarge past max_length."""
+    b1, b2 = await reader.readexactly(2)
+    opcode = b1 & 0x0F
+    length = b2 & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", await reader.readexactly(8))[0]
+    if length > max_length:
+        raise FrameTooLarge(length)
+    mask = await reader.readexactly(4) if b2 & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+def _normalize_origin(origin: str) -> str:
+    return origin.strip().rstrip("/").lower()
+
+
+class ControlServer:
+    """token, if set, is required on every request; allowed_origins are accepted besides loopback ones."""
+
+    def __init__(self, core: SwitcherCore, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 token: str = None, allowed_origins=()):
+        self.core = core
+        self.host = host
+        self.port = port
+        self.token = token or None
+        self.allowed_origins = {_normalize_origin(o) for o in allowed_origins}
+        self._server = None
+        self._clients = set()
+        core.state.add_listener(self._on_state)
+        core.add_report_listener(self._on_report)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        _LOGGER.info("Listening on http://%s:%d", self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for writer in list(self._clients):
+            writer.close()
+        self._clients.clear()
+
+    # --- device operations -------------------------------------------------
+
+    def _device_json(self, device):
+        return {
+            "name": device.name,
+            "mac": device.mac,
+            "type": device.type,
+            "invert": device.invert,
+            "state": {str(ch): self.core.state.get(device.mac, ch) for ch in device.channels},
+            # Breaker state once the switcher has been used (see retry_policy)
+            "link": self.core.pool.health().get(device.mac.upper()),
+            # Last battery level/report, cached from notifications (see device_reports)
+            "health": self.core.health.get(device.mac),
+            # In range/RSSI from advertisements, when "presence" is enabled (see presence.py)
+            "presence": self.core.presence.snapshot().get(device.mac.upper()) if self.core.presence else None,
+        }
+
+    async def switch(self, targets, action: str, force: bool = False):
+        """Run on/off/toggle for (device, channels) pairs; returns per-channel results."""
+        outcomes = await self.core.send_targets(targets, action, on_event=self._on_event, force=force)
+        results = []
+        for device, ch, result in outcomes:
+            ok = not isinstance(result, Exception) and result.ok
+            error = str(result) if isinstance(result, Exception) else result.error
+            results.append({"device": device.name, "channel": ch, "action": self.core.state.get(device.mac, ch),
+                            "ok": ok, "skipped": ok and result.skipped, "error": None if ok else error,
+                            "elapsed_ms": None if isinstance(result, Exception) else round(result.elapsed * 1000, 1)})
+        return results
+
+    async def run_scene(self, name: str) -> dict:
+        try:
+            result = await self.core.run_scene(name, on_event=self._on_event)
+        except KeyError as e:
+            raise HttpError(404, e.args[0])
+        return result.to_dict()
+
+    def _on_state(self, mac, channel, state, pending):
+        device = self.core.registry.by_mac(mac)
+        msg = {"type": "state", "device": device.name if device else mac, "mac": mac.upper(),
+               "channel": channel, "state": state, "pending": pending}
+        asyncio.get_running_loop().create_task(self.broadcast(msg))
+
+    def _on_report(self, report):
+        if report.kind not in ("press", "battery"):
+            return
+        device = self.core.registry.by_mac(report.mac)
+        msg = {"type": "report", "kind": report.kind, "device": device.name if device else report.mac,
+               "mac": report.mac, "channel": report.channel, "state": report.state, "battery": report.battery}
+        asyncio.get_running_loop().create_task(self.broadcast(msg))
+
+    def _on_event(self, event):
+        msg = {"type": "event", "kind": event.kind.value, "mac": event.mac,
+               "channel": event.channel, "action": event.action, "attempt": event.attempt}
+        asyncio.get_running_loop().create_task(self.broadcast(msg))
+
+    async def broadcast(self, msg: dict):
+        frame = _ws_frame(json.dumps(msg, ensure_ascii=False).encode("utf-8"))
+        for writer in list(self._clients):
+            try:
+                writer.write(frame)
+                await writer.drain()
+            except (ConnectionError, RuntimeError):
+                self._clients.discard(writer)
+
+    def _targets(self, name: str, channel=None):
+        try:
+            device, channels = self.core.resolve(name if channel is None else f"{name}:{channel}")
+        except KeyError as e:
+            raise HttpError(404, e.args[0])
+        return [(device, channels)]
+
+    # --- HTTP ----------------------------------------------------------------
+
+    def _origin_allowed(self, origin: str) -> bool:
+        if _normalize_origin(origin) in self.allowed_origins:
+            return True
+        try:
+            url = urlsplit(origin.strip())
+        except ValueError:
+            return False
+        return url.scheme in ("http", "https") and url.hostname in LOOPBACK_HOSTS
+
+    def _authorize(self, headers: dict, url):
+        """Raise HttpError unless the request may be served (see the module docstring)."""
+        origin = headers.get("origin")
+        if origin is not None and not self._origin_allowed(origin):
+            raise HttpError(403, f"Origin not allowed: {origin}")
+        if self.token is None:
+            return
+        scheme, _, given = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer":
+            given = parse_qs(url.query).get("token", [""])[0]
+        if not hmac.compare_digest(given.strip().encode("utf-8"), self.token.encode("utf-8")):
+            raise HttpError(401, "Missing or wrong token")
+
+    async def _respond(self, writer, status: int, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        if len(head) > MAX_HEADER_BYTES:
+            writer.close()
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            writer.close()
+            return
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        url = urlsplit(target)
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            await self._respond(writer, 400, {"error": "Bad Content-Length"})
+            return
+        if length < 0:
+            await self._respond(writer, 400, {"error": "Bad Content-Length"})
+            return
+        if length > MAX_BODY_BYTES:
+            await self._respond(writer, 413, {"error": f"Body over {MAX_BODY_BYTES} bytes"})
+            return
+        try:
+            self._authorize(headers, url)
+        except HttpError as e:
+            await self._respond(writer, e.status, {"error": str(e)})
+            return
+        # Drain any request body; we take all input from the URL
+        if length:
+            try:
+                await reader.readexactly(length)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+                return
+
+        if url.path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+            await self._websocket(reader, writer, headers)
+            return
+        try:
+            status, body = 200, await self._route(method, url)
+        except HttpError as e:
+            status, body = e.status, {"error": str(e)}
+        except Exception as e:
+            _LOGGER.exception("Request failed")
+            status, body = 502, {"error": str(e)}
+        await self._respond(writer, status, body)
+
+    async def _route(self, method: str, url):
+        parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+        query = parse_qs(url.query)
+        channel = query.get("channel", [None])[0]
+        force = query.get("force", ["0"])[0] in ("1", "true")
+        if parts == ["devices"] and method == "GET":
+            return [self._device_json(d) for d in self.core.registry]
+        if parts == ["stats"] and method == "GET":
+            return {**self.core.telemetry.snapshot(), "adapters": self.core.pool.adapter_stats()}
+        if parts == ["schedules"] and method == "GET":
+            return self.core.scheduler.snapshot()
+        if parts == ["scenes"] and method == "GET":
+            return [{**scene.to_dict(), "description": scene.description} for scene in self.core.scenes.values()]
+        if len(parts) == 2 and parts[0] == "scenes":
+            if method != "POST":
+                raise HttpError(405, "Use POST")
+            return await self.run_scene(parts[1])
+        if len(parts) == 2 and parts[0] == "devices" and method == "GET":
+            device = self._targets(parts[1])[0][0]
+            return self._device_json(device)
+        if len(parts) == 3 and parts[0] == "devices":
+            if method != "POST":
+                raise HttpError(405, "Use POST")
+            if parts[2] not in ("on", "off", "toggle"):
+                raise HttpError(404, f"Unknown action: {parts[2]}")
+            return await self.switch(self._targets(parts[1], channel), parts[2], force)
+        if len(parts) == 2 and parts[0] == "all":
+            if method != "POST":
+                raise HttpError(405, "Use POST")
+            if parts[1] not in ("on", "off"):
+                raise HttpError(404, f"Unknown action: {parts[1]}")
+            return await self.switch([(d, d.channels) for d in self.core.registry], parts[1], force)
+        raise HttpError(404, "Not found")
+
+    # --- WebSocket -------------------------------------------------------------
+
+    async def _websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            writer.close()
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        await writer.drain()
+        self._clients.add(writer)
+        snapshot = {"type": "snapshot", "devices": [self._device_json(d) for d in self.core.registry]}
+        writer.write(_ws_frame(json.dumps(snapshot, ensure_ascii=False).encode("utf-8")))
+        try:
+            while True:
+                opcode, payload = await _ws_read(reader)
+                if opcode == 0x8:
+                    writer.write(_ws_frame(b"", 0x8))
+                    break
+                if opcode == 0x9:
+                    writer.write(_ws_frame(payload, 0xA))
+                elif opcode == 0x1:
+                    await self._ws_command(writer, payload)
+                await writer.drain()
+        except FrameTooLarge:
+            writer.write(_ws_frame(struct.pack(">H", WS_CLOSE_TOO_BIG) + b"Frame too large", 0x8))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _ws_command(self, writer, payload: bytes):
+        try:
+            msg = json.loads(payload.decode("utf-8"))
+            if "scene" in msg:
+                reply = {"type": "scene", **await self.run_scene(str(msg["scene"]))}
+                writer.write(_ws_frame(json.dumps(reply, ensure_ascii=False).encode("utf-8")))
+                return
+            action = msg["action"]
+            if action not in ("on", "off", "toggle"):
+                raise ValueError(f"Unknown action: {action}")
+            targets = [self.core.resolve(t) for t in msg["targets"]]
+        except (ValueError, KeyError, TypeError, HttpError) as e:
+            reply = {"type": "error", "error": str(e)}
+        else:
+            reply = {"type": "result", "results": await self.switch(targets, action)}
+        writer.write(_ws_frame(json.dumps(reply, ensure_ascii=False).encode("utf-8")))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="switcherd", description="Local HTTP/WebSocket switcher daemon.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="bind address (default: loopback only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--token", help="require this token on every request (default: \"daemon_token\" in config)")
+    radio = parser.add_mutually_exclusive_group()
+    radio.add_argument("--fake", action="store_true", help="use simulated switchers instead of BLE")
+    parser.add_argument("--trace", metavar="FILE", help="append per-phase timings to FILE as JSON lines")
+    parser.add_argument("--record", metavar="FILE", help="record the BLE session to FILE (see ble_recording)")
+    radio.add_argument("--replay", metavar="FILE", help="answer BLE operations from a recording instead")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="with --replay: replay this many times faster (0 = no delays)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+
+    try:
+        store = ConfigStore(ensure_user_config())
+    except ConfigError as e:
+        _LOGGER.error("%s", e)
+        return 2
+    config = store.snapshot()
+    transport = None
+    if args.fake:
+        from devices import DeviceRegistry
+        from fake_transport import FakeTransport
+        transport = FakeTransport(d.mac for d in DeviceRegistry.from_config(config))
+    elif args.replay:
+        from ble_recording import ReplayTransport
+        transport = ReplayTransport.from_file(args.replay, args.speed)
+    if args.record:
+        config["record_file"] = args.record
+    token = args.token or config.get("daemon_token")
+    if args.host not in LOOPBACK_HOSTS and not token:
+        _LOGGER.warning("Listening on %s without a token: anyone on the network can switch your devices",
+                        args.host)
+
+    core = SwitcherCore(config, transport=transport).start()
+    if args.trace:
+        core.telemetry.set_trace_file(args.trace)
+    core.start_scheduler()
+    core.start_presence()
+    # Devices/schedules edited in the GUI or with switcherctl apply without a restart
+    store.watch(lambda cfg: core.loop.call_soon(core.apply_config, cfg))
+    server = ControlServer(core, args.host, args.port, token=token,
+                           allowed_origins=config.get("daemon_origins") or ())
+    core.loop.run(server.start())
+    print(f"switcherd listening on http://{args.host}:{server.port}", flush=True)
+
+    stopped = asyncio.Event()
+    for name in ("SIGINT", "SIGTERM"):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda *a: core.loop.call_soon(stopped.set))
+    try:
+        core.loop.run(stopped.wait())
+    finally:
+        core.loop.run(server.stop(), timeout=5.0)
+        core.close()
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
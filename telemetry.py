@@ -0,0 +1,151 @@
+"""Per-phase timing for the BLE hot path.
+
+The command path records spans into a Telemetry object:
+
+    scan           find_device when the discovery cache missed
+    connect        BleakClient.connect (bleak resolves GATT services inside
+                   connect, so service discovery is part of this span)
+    write          write_gatt_char until it returned (the ack)
+    command        press-to-ack, including time spent in the device queue
+    ui_update      ack until the Tk thread showed the result
+    scan_first     streaming scan start until the first SWITCHER_M hit
+    scan_stream    a whole streaming scan (GUI "스위처 찾기", CLI scan)
+
+Each phase keeps a rolling window for percentiles and a histogram, and each
+device gets success/failure/retry counters. With a trace path set, every
+span is also appended to a JSON-lines file for offline analysis.
+"""
+import bisect
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_WINDOW = 500
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class Telemetry:
+    def __init__(self, window: int = DEFAULT_WINDOW, trace_path: str = None, enabled: bool = True):
+        self.enabled = enabled
+        self.window = window
+        self._lock = threading.Lock()
+        self._phases = {}
+        self._devices = {}
+        self._trace = None
+        if trace_path:
+            self.set_trace_file(trace_path)
+
+    def set_trace_file(self, path):
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+            self._trace = open(path, "a", encoding="utf-8", buffering=1) if path else None
+
+    def close(self):
+        self.set_trace_file(None)
+
+    @contextmanager
+    def span(self, name: str, mac: str = None, **attrs):
+        """Time the with-block as one span.
+
+        Yields the attrs dict so the block can add fields; setting
+        attrs["ok"] = False marks the span failed, as does raising.
+        """
+        if not self.enabled:
+            yield attrs
+            return
+        start = time.monotonic()
+        ok = True
+        try:
+            yield attrs
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            ok = attrs.pop("ok", True) and ok
+            self.record(name, time.monotonic() - start, mac, ok, **attrs)
+
+    def record(self, name: str, seconds: float, mac: str = None, ok: bool = True, **attrs):
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._phases.get(name)
+            if samples is None:
+                samples = self._phases[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            if self._trace is not None:
+                line = {"ts": round(time.time(), 6), "span": name, "ms": round(seconds * 1000, 3), "ok": ok}
+                if mac:
+                    line["mac"] = mac
+                line.update(attrs)
+                self._trace.write(json.dumps(line, ensure_ascii=False, default=str) + "\n")
+
+    def _device(self, mac: str) -> dict:
+        d = self._devices.get(mac)
+        if d is None:
+            d = self._devices[mac] = {"ok": 0, "failed": 0, "retries": 0}
+        return d
+
+    def count_result(self, mac: str, ok: bool, retries: int = 0):
+        if not self.enabled:
+            return
+        with self._lock:
+            d = self._device(mac)
+            d["ok" if ok else "failed"] += 1
+            d["retries"] += retries
+
+    def snapshot(self) -> dict:
+        """Percentiles and histograms per phase plus per-device counters (all times in ms)."""
+        with self._lock:
+            phases = {name: sorted(s) for name, s in self._phases.items()}
+            devices = {mac: dict(d) for mac, d in self._devices.items()}
+        out = {"phases": {}, "devices": {}}
+        for name, ordered in phases.items():
+            ms = [v * 1000 for v in ordered]
+            hist = [0] * (len(BUCKETS_MS) + 1)
+            for v in ms:
+                hist[bisect.bisect_left(BUCKETS_MS, v)] += 1
+            out["phases"][name] = {
+                "n": len(ms),
+                "p50": _percentile(ms, 50),
+                "p95": _percentile(ms, 95),
+                "max": ms[-1] if ms else 0.0,
+                "histogram": hist,
+            }
+        for mac, d in devices.items():
+            total = d["ok"] + d["failed"]
+            out["devices"][mac] = {**d, "success_rate": d["ok"] / total if total else None}
+        return out
+
+
+def format_stats(snapshot: dict, names=None) -> str:
+    """Plain-text table of a snapshot(), for the GUI stats panel."""
+    names = names or {}
+    labels = [f"<{b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+    lines = [f"{'phase':<12} {'n':>5} {'p50':>8} {'p95':>8} {'max':>8}  histogram (ms)"]
+    for name, p in sorted(snapshot["phases"].items()):
+        peak = max(p["histogram"]) or 1
+        bars = "".join(" ▁▂▃▄▅▆▇█"[math.ceil(c * 8 / peak)] for c in p["histogram"])
+        lines.append(f"{name:<12} {p['n']:>5} {p['p50']:>6.0f}ms {p['p95']:>6.0f}ms {p['max']:>6.0f}ms  {bars}")
+    lines.append(f"{'':<47}{labels[0]} … {labels[-1]}")
+    if snapshot["devices"]:
+        lines += ["", f"{'device':<20} {'ok':>5} {'fail':>5} {'retry':>5} {'success':>8}"]
+        for mac, d in sorted(snapshot["devices"].items()):
+            rate = "-" if d["success_rate"] is None else f"{d['success_rate'] * 100:.0f}%"
+            lines.append(f"{names.get(mac, mac):<20} {d['ok']:>5} {d['failed']:>5} {d['retries']:>5} {rate:>8}")
+    return "\n".join(lines)
+
+
+# Shared no-op instance for code paths constructed without telemetry
+DISABLED = Telemetry(enabled=False)
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from adapters import MultiAdapterTransport, format_adapters, list_adapters
+from connection_pool import ConnectionPool
+from fake_transport import FakeTransport, LinkProfile
+
+A, B, C = "AA:BB:CC:DD:EE:01", "AA:BB:CC:DD:EE:02", "AA:BB:CC:DD:EE:03"
+profile = LinkProfile(advertise=(0.02, 0.0), connect=(0.2, 0.0), write=(0.0, 0.0))
+
+
+def adapter(rssi: dict) -> FakeTransport:
+    # Each adapter hears every switcher, at its own signal strength
+    transport = FakeTransport(profile=profile)
+    for mac, value in rssi.items():
+        transport.add(mac, rssi=value)
+    return transport
+
+
+async def main():
+    hci0 = adapter({A: -80, B: -70, C: -60})
+    hci1 = adapter({A: -50, B: -55, C: -90})
+    multi = MultiAdapterTransport({"hci0": hci0, "hci1": hci1}, max_connections=1, settle=0.1)
+    pool = ConnectionPool(transport=multi)
+
+    # A goes to the adapter that hears it best
+    assert (await pool.send(A, 1, "on")).ok
+    assert hci1.switchers[A].state[1] == "on" and hci0.writes == 0
+    # B is heard best by hci1 too, but hci1 is full
+    assert (await pool.send(B, 1, "on")).ok
+    assert hci0.switchers[B].state[1] == "on"
+    stats = multi.stats()
+    assert stats["hci1"]["devices"] == [A] and stats["hci0"]["devices"] == [B], stats
+    print(format_adapters(stats))
+
+    # Dropping a link frees its slot
+    await pool.session(A).disconnect()
+    assert multi.stats()["hci1"]["links"] == 0
+    await pool.close()
+
+    # Connects on different adapters run in parallel, on one adapter in turn
+    hci0 = adapter({A: -60, B: -90})
+    hci1 = adapter({A: -90, B: -60})
+    multi = MultiAdapterTransport({"hci0": hci0, "hci1": hci1}, settle=0.0)
+    pool = ConnectionPool(transport=multi)
+    started = time.monotonic()
+    results = await asyncio.gather(pool.send(A, 1, "on"), pool.send(B, 1, "on"))
+    assert all(r.ok for r in results)
+    assert time.monotonic() - started < 0.38
+    assert multi.stats()["hci0"]["devices"] == [A] and multi.stats()["hci1"]["devices"] == [B]
+    await pool.close()
+
+    single = MultiAdapterTransport({"hci0": adapter({A: -60, B: -60})}, settle=0.0)
+    pool = ConnectionPool(transport=single)
+    started = time.monotonic()
+    assert all(r.ok for r in await asyncio.gather(pool.send(A, 1, "on"), pool.send(B, 1, "on")))
+    assert time.monotonic() - started >= 0.4
+    assert single.stats()["hci0"]["peak_links"] == 2 and single.stats()["hci0"]["connects"] == 2
+    await pool.close()
+
+    # Nobody hears it: not found
+    assert await multi.find_device("AA:BB:CC:DD:EE:99", 0.1) is None
+
+asyncio.run(main())
+assert isinstance(list_adapters(), list)
+print("adapters ok")
@@ -0,0 +1,24 @@
+import asyncio
+
+import bench
+from fake_transport import LinkProfile
+
+assert bench.percentile([], 50) == 0.0
+assert bench.percentile([3, 1, 2, 4], 50) == 2
+assert bench.percentile(list(range(1, 101)), 99) == 99
+
+profile = LinkProfile(advertise=(0.3, 0.0), connect=(0.2, 0.0), write=(0.02, 0.0))
+report = asyncio.run(bench.run_all(presses=12, burst=6, profile=profile, time_scale=0.05))
+modes = report["modes"]
+print(bench.format_report(report))
+
+# Warm links take the scan + connect out of every press
+assert modes["pooled"]["sequential"]["p50"] < modes["per-press"]["sequential"]["p50"] / 5
+assert modes["pooled"]["connects"] == 1 and modes["per-press"]["connects"] == 24
+# Queued bursts coalesce superseded presses: fewer writes for the same presses
+# (counted, not timed, so the check does not depend on the machine's speed)
+assert modes["pooled"]["burst"]["writes"] == 12
+assert modes["queued"]["burst"]["writes"] < modes["pooled"]["burst"]["writes"]
+# The streaming scanner reports the device long before a one-shot scan would return
+assert report["scan"]["misses"] == 0
+assert report["scan"]["streaming"]["p99"] < report["scan"]["one_shot"] / 5
@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import time
+
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp()
+os.environ.pop('APPDATA', None)
+
+from ble_recording import ReplayTransport, load_recording
+from command_events import EventKind
+from fake_transport import FakeTransport, LinkProfile
+from switcher_core import SwitcherCore
+
+A, B = "AA:BB:CC:DD:EE:01", "AA:BB:CC:DD:EE:02"
+path = os.path.join(tempfile.mkdtemp(), "session.jsonl")
+config = {"devices": [{"name": "거실", "mac": A, "type": 2}, {"name": "안방", "mac": B, "type": 1}],
+          "retry": {"retries": 2, "base_delay": 0.05, "jitter": 0}}
+
+
+def run(core, on_event=None):
+    living, bedroom = core.registry.get("거실"), core.registry.get("안방")
+    started = time.monotonic()
+    results = [core.loop.run(core.send(living, 1, "on", on_event)),
+               core.loop.run(core.send(bedroom, 1, "on")),
+               core.loop.run(core.send(living, 2, "on"))]
+    return results, time.monotonic() - started
+
+
+# Record a session in which the first connect fails and is retried
+transport = FakeTransport([A, B], profile=LinkProfile(advertise=(0.1, 0.0), connect=(0.1, 0.0), write=(0.03, 0.0),
+                                                      connect_failure_rate=1.0))
+
+
+def recover(event):
+    if event.kind == EventKind.RETRYING:
+        transport.profile.connect_failure_rate = 0.0
+
+
+core = SwitcherCore({**config, "record_file": path}, transport=transport).start()
+recorded, recorded_time = run(core, recover)
+assert [r.attempts for r in recorded] == [2, 1, 1] and all(r.ok for r in recorded)
+time.sleep(0.1)
+core.close()
+
+events = load_recording(path)
+assert events[0]["op"] == "start" and events[0]["version"] == 1
+ops = [(e["op"], e.get("error")) for e in events if e.get("mac") == A and e["op"] in ("find", "connect", "write")]
+assert ops == [("find", None), ("connect", f"{A}: simulated connect failure"), ("find", None),
+               ("connect", None), ("write", None), ("write", None)], ops
+connect = next(e for e in events if e["op"] == "connect" and "services" in e)
+assert connect["ms"] >= 100 and any(s["chars"] for s in connect["services"])
+assert [e["kind"] for e in events if e["op"] == "command" and e["mac"] == A][:3] == \
+    ["retrying", "connected", "written"]
+assert any(e["op"] == "notify" for e in events) and any(e["op"] == "read" for e in events)
+assert all(json.loads(line) for line in open(path, encoding="utf-8"))
+
+# Replayed 5x faster: same outcomes, same attempts, a fifth of the time
+replay = ReplayTransport.from_file(path, speed=5)
+assert replay.macs == [A, B]
+core = SwitcherCore(config, transport=replay).start()
+reports = []
+core.add_report_listener(reports.append)
+replayed, replay_time = run(core)
+assert [(r.ok, r.attempts, r.error) for r in replayed] == [(r.ok, r.attempts, r.error) for r in recorded]
+assert replay_time < recorded_time / 2, (replay_time, recorded_time)
+assert replay.unmatched == 0 and replay.mismatches == 0
+time.sleep(0.05)
+assert any(r.kind == "battery" and r.battery == 100 for r in reports)
+# A press the recording does not have fails instead of guessing
+extra = core.loop.run(core.send(core.registry.get("안방"), 1, "off"))
+assert not extra.ok and replay.unmatched > 0
+core.close()
+
+# A stricter retry policy against the same radio now fails the first press
+replay = ReplayTransport.from_file(path, speed=0)
+core = SwitcherCore({**config, "retry": {"retries": 0}}, transport=replay).start()
+strict, _ = run(core)
+assert not strict[0].ok and strict[0].error == f"{A}: simulated connect failure"
+assert strict[1].ok
+core.close()
+print("ble recording ok")
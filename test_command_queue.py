@@ -0,0 +1,35 @@
+import asyncio
+
+from command_events import CommandResult
+from command_queue import DeviceCommandQueue
+
+sent = []
+
+
+class SlowSession:
+    mac = 'AA:BB:CC:DD:EE:01'
+
+    async def send(self, channel, action, on_event=None):
+        sent.append((channel, action))
+        await asyncio.sleep(0.05)
+        return CommandResult(True, self.mac, channel, action)
+
+
+async def main():
+    q = DeviceCommandQueue(SlowSession())
+    # switch1 ON goes out immediately; OFF and ON pile up behind it and
+    # collapse into the final ON. Switch 2 is queued independently.
+    f1 = q.submit(1, 'on')
+    await asyncio.sleep(0)
+    f2 = q.submit(1, 'off')
+    f3 = q.submit(2, 'on')
+    f4 = q.submit(1, 'on')
+    results = await asyncio.gather(f1, f2, f3, f4)
+    assert sent == [(1, 'on'), (1, 'on'), (2, 'on')], sent
+    # The superseded OFF resolves with the command that replaced it
+    assert results[1] is results[3] and results[1].action == 'on'
+    assert q.coalesced == 1 and len(q) == 0
+    print('sent:', sent)
+
+
+asyncio.run(main())
@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from config_store import CONFIG_VERSION, ConfigError, ConfigStore, migrate, read_config, set_aside, write_config
+from devices import DeviceRegistry
+
+tmp = tempfile.mkdtemp()
+path = os.path.join(tmp, "config.json")
+
+
+def write_raw(data):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data if isinstance(data, str) else json.dumps(data))
+
+
+# Missing file: defaults
+assert read_config(path) == {"version": CONFIG_VERSION, "devices": []}
+
+# Today's single-switcher layout is folded into "devices"
+config = migrate({"mac": "aa:bb:cc:dd:ee:01", "type": 1, "invert": True, "idle_timeout": 60})
+assert config["version"] == CONFIG_VERSION and config["idle_timeout"] == 60
+assert config["devices"] == [{"name": "스위처 1", "mac": "aa:bb:cc:dd:ee:01", "type": 1, "invert": True}]
+assert config["selected"] == "스위처 1" and "mac" not in config and "type" not in config
+assert DeviceRegistry.from_config(config).get("스위처 1").invert
+# A config with devices keeps them; the legacy editor's MAC picks the selection
+config = migrate({"mac": "AA:BB:CC:DD:EE:02", "type": 2, "invert": False, "devices": [
+    {"name": "a", "mac": "AA:BB:CC:DD:EE:01"}, {"name": "b", "mac": "AA:BB:CC:DD:EE:02"}]})
+assert [d["name"] for d in config["devices"]] == ["a", "b"] and config["selected"] == "b"
+assert migrate(config) == config
+try:
+    migrate({"version": CONFIG_VERSION + 1})
+    raise AssertionError("newer version accepted")
+except ConfigError:
+    pass
+
+# A broken file raises instead of acting empty, and can be set aside
+write_raw('{"devices": [')
+try:
+    read_config(path)
+    raise AssertionError("broken config accepted")
+except ConfigError:
+    pass
+backup = set_aside(path)
+assert not os.path.exists(path) and open(backup, encoding="utf-8").read() == '{"devices": ['
+os.remove(backup)
+
+# Writes are atomic: no temp files left, unicode kept readable
+write_config({"devices": [{"name": "거실", "mac": "AA:BB:CC:DD:EE:01"}]}, path)
+assert os.listdir(tmp) == ["config.json"]
+assert "거실" in open(path, encoding="utf-8").read()
+assert read_config(path)["version"] == CONFIG_VERSION
+
+# Debounced: many updates, one write after the quiet period
+store = ConfigStore(path, debounce=0.2)
+writes = []
+real_replace = os.replace
+os.replace = lambda *a: (writes.append(a), real_replace(*a))
+try:
+    for i in range(10):
+        store.update({"idle_timeout": i})
+    store.update({"idle_timeout": 9})
+    assert read_config(path).get("idle_timeout") is None
+    time.sleep(0.5)
+    assert len(writes) == 1 and read_config(path)["idle_timeout"] == 9
+    # An unchanged value does not schedule a write
+    store.update({"idle_timeout": 9})
+    time.sleep(0.3)
+    assert len(writes) == 1
+finally:
+    os.replace = real_replace
+
+# Someone else edits the file: their keys survive our next save
+time.sleep(0.01)
+on_disk = read_config(path)
+on_disk["schedules"] = [{"id": "lamp", "target": "거실", "action": "off", "time": "23:00"}]
+write_config(on_disk, path)
+store.update({"selected": "거실"})
+store.flush()
+saved = read_config(path)
+assert saved["selected"] == "거실" and saved["schedules"][0]["id"] == "lamp" and saved["idle_timeout"] == 9
+assert store.get("schedules")[0]["id"] == "lamp"
+store.close()
+
+# The watcher reports external edits
+store = ConfigStore(path)
+seen = threading.Event()
+changes = []
+store.watch(lambda cfg: (changes.append(cfg), seen.set()), interval=0.05)
+time.sleep(0.1)
+assert not changes
+edited = read_config(path)
+edited["devices"].append({"name": "안방", "mac": "AA:BB:CC:DD:EE:02", "type": 1})
+write_config(edited, path)
+assert seen.wait(2)
+assert [d["name"] for d in changes[-1]["devices"]] == ["거실", "안방"]
+assert store.get("devices") == changes[-1]["devices"]
+store.close()
+
+print("config store ok")
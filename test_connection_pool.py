@@ -0,0 +1,104 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import connection_pool
+from command_events import EventKind
+from event_loop import LoopThread
+from retry_policy import RetryPolicy
+
+events = []
+
+
+class FakeScanner:
+    @staticmethod
+    async def find_device_by_address(mac, timeout=10.0):
+        events.append(('scan', mac))
+        return SimpleNamespace(name='SWITCHER_M', address=mac)
+
+
+class FakeClient:
+    instances = []
+    fail_writes = False
+
+    def __init__(self, device, disconnected_callback=None):
+        self.device = device
+        self.cb = disconnected_callback
+        self.is_connected = False
+        FakeClient.instances.append(self)
+
+    async def connect(self):
+        events.append(('connect', self.device.address))
+        self.is_connected = True
+
+    async def disconnect(self):
+        events.append(('disconnect', self.device.address))
+        self.is_connected = False
+        if self.cb:
+            self.cb(self)
+
+    async def write_gatt_char(self, uuid, data):
+        if FakeClient.fail_writes:
+            raise OSError('write failed')
+        events.append(('write', self.device.address, data))
+
+    def drop(self):
+        # Simulate the link going away without us asking
+        self.is_connected = False
+        self.cb(self)
+
+
+connection_pool.BleakScanner = FakeScanner
+connection_pool.BleakClient = FakeClient
+connection_pool.RECONNECT_DELAYS = (0.05,)
+
+loop = LoopThread()
+loop.start()
+pool = connection_pool.ConnectionPool(idle_timeout=0.5)
+
+# Channel 1 and channel 2 of one switcher share a single connection
+seen = []
+result = loop.run(pool.send('aa:bb:cc:dd:ee:01', 1, 'on', on_event=seen.append))
+assert result.ok and result.attempts == 1
+assert [e.kind for e in seen] == [EventKind.CONNECTED, EventKind.WRITTEN, EventKind.ACKNOWLEDGED]
+seen.clear()
+assert loop.run(pool.send('AA:BB:CC:DD:EE:01', 2, 'off', on_event=seen.append)).ok
+assert [e.kind for e in seen] == [EventKind.WRITTEN, EventKind.ACKNOWLEDGED]
+assert [e[0] for e in events] == ['scan', 'connect', 'write', 'write'], events
+assert events[2][2] == connection_pool.command_key(1, 'on')
+assert events[3][2] == connection_pool.command_key(2, 'off')
+
+# An unexpected drop is repaired in the background
+FakeClient.instances[-1].drop()
+time.sleep(0.2)
+assert events[-1][0] == 'connect', events
+assert len(FakeClient.instances) == 2
+# ...straight from the discovery cache, without scanning again
+assert events.count(('scan', 'AA:BB:CC:DD:EE:01')) == 1
+
+# Idle links are dropped after idle_timeout
+time.sleep(0.8)
+assert events[-1][0] == 'disconnect', events
+
+# With max_connections=1 a second switcher evicts the idle first link
+small = connection_pool.ConnectionPool(idle_timeout=30, max_connections=1)
+assert loop.run(small.send('AA:BB:CC:DD:EE:02', 1, 'on')).ok
+assert loop.run(small.send('AA:BB:CC:DD:EE:03', 1, 'on')).ok
+assert small.connected_count == 1
+assert ('disconnect', 'AA:BB:CC:DD:EE:02') in events
+loop.run(small.close())
+
+# A failing write reports retrying/failed events and a failed result
+FakeClient.fail_writes = True
+seen.clear()
+session = pool.session('AA:BB:CC:DD:EE:01')
+session.retry = RetryPolicy(retries=1, base_delay=0)
+result = loop.run(session.send(1, 'on', on_event=seen.append))
+assert not result.ok and result.attempts == 2 and result.error == 'write failed', result
+assert [e.kind for e in seen if e.kind in (EventKind.RETRYING, EventKind.FAILED)] == [EventKind.RETRYING, EventKind.FAILED]
+# Writes that raised are never reported as written
+assert EventKind.WRITTEN not in [e.kind for e in seen], seen
+
+loop.run(pool.close())
+loop.stop()
+print('events:', events)
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import os
+import tempfile
+
+from connection_pool import ConnectionPool
+from device_profiles import DeviceProfile, ProfileStore
+from fake_transport import SERVICE_UUID, FakeTransport, LinkProfile
+from retry_policy import RetryPolicy
+
+MAC = "AA:BB:CC:DD:EE:01"
+path = os.path.join(tempfile.mkdtemp(), "profiles.json")
+transport = FakeTransport([MAC], profile=LinkProfile(discovery=(0.05, 0.0)))
+switcher = transport.switchers[MAC]
+
+
+async def press(pool, action):
+    result = await pool.send(MAC, 1, action)
+    assert result.ok, result
+    return result
+
+
+async def main():
+    # First run: full discovery, then the profile is written to disk
+    pool = ConnectionPool(transport=transport, profiles=ProfileStore(path))
+    await press(pool, "on")
+    await pool.close()
+    # Written in the background; flushed here like SwitcherCore.close() does
+    assert not os.path.exists(path)
+    pool.profiles.flush()
+    assert transport.discoveries == 1
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)[MAC]
+    assert saved["service_uuid"] == SERVICE_UUID and saved["char_handle"] == 0x0010
+    assert saved["write_response"] is True and saved["connect_time"] > 0
+
+    # Next run (fresh store from disk): reconnects only resolve the profile's services
+    pool = ConnectionPool(transport=transport, profiles=ProfileStore(path))
+    await press(pool, "off")
+    await pool.session(MAC).disconnect()
+    await press(pool, "on")
+    assert transport.discoveries == 1 and transport.filtered_discoveries == 2 and transport.connects == 3
+    # Same layout on every connect: nothing to write
+    pool.profiles.flush()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)[MAC] == saved
+
+    # The remembered handle is never handed to the client: a moved characteristic
+    # is simply found again by the filtered discovery
+    switcher.char_handle = 0x0020
+    await pool.session(MAC).disconnect()
+    result = await press(pool, "off")
+    assert result.attempts == 1 and pool.profiles.get(MAC).char_handle == 0x0020
+    pool.profiles.flush()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)[MAC]["char_handle"] == 0x0020
+
+    # Windows keeps its own GATT cache (use_cached_services): no discovery at all...
+    transport.cached_services = True
+    await pool.session(MAC).disconnect()
+    await press(pool, "on")
+    assert transport.discoveries == 1 and transport.filtered_discoveries == 3
+
+    # ...until a firmware update makes it stale: the write fails once, the
+    # profile is dropped and the retry connects without it (full discovery)
+    switcher.char_handle = 0x0030
+    await pool.session(MAC).disconnect()
+    pool.session(MAC).retry = RetryPolicy(base_delay=0)
+    result = await press(pool, "off")
+    assert result.attempts == 2 and switcher.state[1] == "off"
+    assert transport.discoveries == 2
+    assert pool.profiles.get(MAC).char_handle == 0x0030
+    await pool.close()
+    pool.profiles.close()
+
+asyncio.run(main())
+
+# Unknown keys from newer versions are ignored; bad files start empty
+profile = DeviceProfile.from_dict({"mac": MAC, "char_handle": 5, "future": 1})
+assert profile.char_handle == 5
+with open(path, "w", encoding="utf-8") as f:
+    f.write("{not json")
+assert len(ProfileStore(path)) == 0
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import time
+
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp()
+os.environ.pop('APPDATA', None)
+
+from connection_pool import command_key
+from device_reports import BATTERY_LEVEL_UUID, STATE_KEYS, HealthCache, parse_report
+from fake_transport import FakeTransport, LinkProfile
+from switcher_core import SwitcherCore, load_health
+
+A, B = "AA:BB:CC:DD:EE:01", "AA:BB:CC:DD:EE:02"
+
+# Reports use the same keys that are written
+assert STATE_KEYS == {command_key(ch, action): (ch, action) for ch in (1, 2) for action in ("on", "off")}
+report = parse_report(A, BATTERY_LEVEL_UUID.upper(), bytearray([87]))
+assert report.kind == "battery" and report.battery == 87
+report = parse_report(A, "000015ba-0000-1000-8000-00805f9b34fb", b"\x05")
+assert (report.kind, report.channel, report.state) == ("state", 2, "on")
+assert parse_report(A, "000015ba-0000-1000-8000-00805f9b34fb", b"\x7f\x01").kind == "raw"
+
+path = os.path.join(tempfile.mkdtemp(), "health.json")
+cache = HealthCache(path)
+cache.update(parse_report(A, BATTERY_LEVEL_UUID, b"\x40"))
+# Throttled: written in the background, not by update() itself
+assert not os.path.exists(path)
+cache.flush()
+assert HealthCache(path).battery(A.lower()) == 64 and HealthCache(path).get(B) == {}
+
+config = {"devices": [{"name": "거실", "mac": A, "type": 2},
+                      {"name": "안방", "mac": B, "type": 1, "invert": True}]}
+transport = FakeTransport([A, B], profile=LinkProfile(advertise=(0.01, 0.0), connect=(0.01, 0.0)))
+transport.switchers[A].battery = 73
+core = SwitcherCore(config, transport=transport).start()
+reports = []
+core.add_report_listener(reports.append)
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+# Our own write is echoed back, but that is not a press
+living, bedroom = core.registry.get("거실"), core.registry.get("안방")
+assert core.loop.run(core.send(living, 1, "on")).ok
+assert wait_for(lambda: any(r.kind == "battery" for r in reports))
+assert not [r for r in reports if r.kind == "press"], reports
+# Battery was read on connect and is cached for later, without connecting
+core.health.flush()
+assert load_health().battery(A) == 73
+
+# Someone uses the switch itself: the state follows live, and listeners see a press
+core.loop.call_soon(transport.switchers[A].press, 2)
+assert wait_for(lambda: any(r.kind == "press" for r in reports)) and core.state.get(A, 2) == "on"
+press = [r for r in reports if r.kind == "press"]
+assert [(r.mac, r.channel, r.state) for r in press] == [(A, 2, "on")], press
+# ...but a reported state is not trusted to skip a write: pressing "on" still goes out
+writes = transport.writes
+result = core.loop.run(core.send(living, 2, "on"))
+assert result.ok and not result.skipped and transport.writes == writes + 1, result
+# Once our own write is acknowledged, the state is fresh again
+assert core.loop.run(core.send(living, 2, "on")).skipped and transport.writes == writes + 1
+
+# States are reported at user level (invert applied)
+assert core.loop.run(core.send(bedroom, 1, "on")).ok
+assert wait_for(lambda: any(r.kind == "battery" and r.mac == B for r in reports))
+core.loop.call_soon(transport.switchers[B].press, 1)
+assert wait_for(lambda: len([r for r in reports if r.kind == "press"]) == 2) and core.state.get(B, 1) == "off"
+assert [(r.mac, r.state) for r in reports if r.kind == "press"][-1] == (B, "off")
+core.health.flush()
+assert load_health().get(B)["presses"] == 1
+
+core.close()
+print("device reports ok")
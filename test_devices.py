@@ -0,0 +1,58 @@
+import asyncio
+import os
+import tempfile
+
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp()
+os.environ.pop('APPDATA', None)
+
+from command_events import CommandResult
+from devices import Device, DeviceRegistry
+from switcher_core import SwitcherCore
+
+# Legacy single-device config becomes a one-device registry
+legacy = DeviceRegistry.from_config({"mac": "AA:BB:CC:DD:EE:01", "type": 1, "invert": True})
+assert len(legacy) == 1
+d = list(legacy)[0]
+assert d.channels == (1,) and d.wire_action("on") == "off"
+
+registry = DeviceRegistry.from_config({"devices": [
+    {"name": "거실", "mac": "AA:BB:CC:DD:EE:01", "type": 2},
+    {"name": "안방", "mac": "AA:BB:CC:DD:EE:02", "type": 1, "invert": True},
+    {"name": "broken"},
+]})
+assert registry.names() == ["거실", "안방"]
+assert registry.by_mac("aa:bb:cc:dd:ee:02").name == "안방"
+assert DeviceRegistry.from_config({"devices": registry.to_config()}).to_config() == registry.to_config()
+
+
+class FakePool:
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.sent = []
+
+    async def send(self, mac, channel, action, on_event=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.05)
+        self.active -= 1
+        self.sent.append((mac, channel, action))
+        return CommandResult(True, mac, channel, action)
+
+    async def close(self):
+        pass
+
+
+# Group actions go through SwitcherCore.send_targets (state tracking, invert, parallel fan-out)
+core = SwitcherCore({"devices": registry.to_config()}).start()
+pool = core.pool = FakePool()
+outcomes = core.loop.run(core.send_targets([(d, d.channels) for d in core.registry], "off"))
+# 거실 ch1+ch2 and 안방 ch1 (inverted -> "on") all go out in parallel
+assert sorted(pool.sent) == [("AA:BB:CC:DD:EE:01", 1, "off"), ("AA:BB:CC:DD:EE:01", 2, "off"),
+                             ("AA:BB:CC:DD:EE:02", 1, "on")], pool.sent
+assert pool.peak == 3
+assert all(r.ok for _, _, r in outcomes)
+assert [(dev.name, ch) for dev, ch, _ in outcomes] == [("거실", 1), ("거실", 2), ("안방", 1)]
+assert core.state.get("AA:BB:CC:DD:EE:02", 1) == "off"
+core.close()
+print('group outcomes:', [(dev.name, ch, r.action) for dev, ch, r in outcomes])
@@ -0,0 +1,52 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import discovery
+
+
+class FakeScanner:
+    """Advertises one switcher after 50 ms and another after 3 s."""
+
+    def __init__(self, detection_callback=None):
+        self.cb = detection_callback
+        self.tasks = []
+
+    async def start(self):
+        async def advertise(delay, name, addr, rssi):
+            await asyncio.sleep(delay)
+            self.cb(SimpleNamespace(name=name, address=addr), SimpleNamespace(local_name=name, rssi=rssi))
+        self.tasks = [asyncio.create_task(advertise(0.05, 'SWITCHER_M', 'aa:bb:cc:dd:ee:01', -55)),
+                      asyncio.create_task(advertise(0.06, 'Headphones', '11:22:33:44:55:66', -40)),
+                      asyncio.create_task(advertise(3.0, 'SWITCHER_M', 'aa:bb:cc:dd:ee:02', -80))]
+
+    async def stop(self):
+        for t in self.tasks:
+            t.cancel()
+
+
+discovery.BleakScanner = FakeScanner
+
+
+async def main():
+    cache = discovery.DeviceCache(ttl=0.3)
+    stop = asyncio.Event()
+    first_hit = []
+    start = time.monotonic()
+
+    def on_found(sighting):
+        first_hit.append(time.monotonic() - start)
+        stop.set()  # like pressing "Use" on the first row
+
+    found = await discovery.stream_scan(cache, on_found, timeout=5.0, stop_event=stop)
+    elapsed = time.monotonic() - start
+    assert [s.address for s in found] == ['AA:BB:CC:DD:EE:01'], found
+    assert first_hit[0] < 0.5 and elapsed < 0.5, (first_hit, elapsed)
+    assert cache.get('aa:bb:cc:dd:ee:01').rssi == -55
+    assert cache.get('11:22:33:44:55:66') is None
+    await asyncio.sleep(0.35)
+    assert cache.get('AA:BB:CC:DD:EE:01') is None and len(cache) == 0
+    print('first result after %.3fs, scan ended after %.3fs' % (first_hit[0], elapsed))
+
+
+asyncio.run(main())
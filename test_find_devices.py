@@ -3,16 +3,20 @@ import time
 from types import SimpleNamespace
 import gui
 
-# Monkeypatch BleakScanner.discover
+# Monkeypatch the streaming scanner used by discovery.stream_scan
 class FakeScanner:
-    @staticmethod
-    def discover(timeout=5.0):
-        return [SimpleNamespace(name='SWITCHER_M_01', address='AA:BB:CC:DD:EE:01'),
-                SimpleNamespace(name='Other', address='11:22:33:44:55:66'),
-                SimpleNamespace(name='SWITCHER_M_02', address='AA:BB:CC:DD:EE:02')]
+    def __init__(self, detection_callback=None):
+        self.cb = detection_callback
+    async def start(self):
+        for name, addr in [('SWITCHER_M_01', 'AA:BB:CC:DD:EE:01'),
+                           ('Other', '11:22:33:44:55:66'),
+                           ('SWITCHER_M_02', 'AA:BB:CC:DD:EE:02')]:
+            self.cb(SimpleNamespace(name=name, address=addr), SimpleNamespace(local_name=name, rssi=-60))
+    async def stop(self):
+        pass
 
-import bleak
-bleak.BleakScanner = FakeScanner
+import discovery
+discovery.BleakScanner = FakeScanner
 
 root = tk.Tk()
 app = gui.SwitchApp(root)
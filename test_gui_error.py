@@ -1,6 +1,5 @@
 import tkinter as tk
 import time
-import pyswitcherio
 from gui import SwitchApp
 
 root = tk.Tk()
@@ -9,14 +8,16 @@ app = SwitchApp(root)
 # Ensure mac is set
 app.mac_var.set('00:11:22:33:44:55')
 
-# Monkeypatch IOSwitcher to raise immediately
-class Bad:
-    def __init__(self, *a, **k):
-        raise RuntimeError('simulated init failure')
+# Replace the connection pool with one that fails immediately
+class BadPool:
+    async def send(self, *a, **k):
+        raise RuntimeError('simulated connect failure')
+    async def close(self):
+        pass
 
-pyswitcherio.IOSwitcher = Bad
+app.core.pool = BadPool()
 
-# Trigger toggle (this will start a background thread)
+# Trigger toggle (this runs on the app's background loop)
 app.on_action(1, 'on')
 
 # Run the event loop briefly to let scheduled callbacks run
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import time
+
+# Point the config at a scratch directory before anything reads it
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp()
+os.environ.pop('APPDATA', None)
+
+import tkinter as tk
+
+import switcher_core
+import switcherctl
+from fake_transport import FakeTransport
+from gui import SwitchApp
+from scheduler import ScheduleRule
+
+MAC = "AA:BB:CC:DD:EE:01"
+config = switcher_core.load_config()
+config["devices"] = [{"name": "거실", "mac": MAC, "type": 2}]
+config["schedules"] = []
+switcher_core.write_config(config)
+
+root = tk.Tk()
+app = SwitchApp(root, transport=FakeTransport([MAC]))
+
+
+def pump(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        root.update()
+        time.sleep(0.01)
+
+
+def saved_ids():
+    app.config_store.flush()
+    return [r["id"] for r in switcher_core.load_config().get("schedules", [])]
+
+
+pump(0.3)
+# A rule added with the CLI while the GUI holds the config...
+assert switcherctl.main(['schedule', 'add', 'lamp', '거실', 'off', '--time', '23:00']) == 0
+# ...is picked up (the watcher polls every second) and survives the GUI's next save
+pump(2.0)
+assert [r.id for r in app.core.scheduler.rules] == ['lamp']
+app._select_device('거실')
+assert saved_ids() == ['lamp']
+
+# A schedule edited in the GUI is saved together with the CLI's rule
+app._change_schedules(lambda: app.core.scheduler.add(ScheduleRule('wake', '거실:1', 'on', time='07:00')))
+pump(0.5)
+assert saved_ids() == ['lamp', 'wake']
+
+app.on_close()
+print('schedules ok')
@@ -1,24 +1,20 @@
 import tkinter as tk
 import time
-import pyswitcherio
+from command_events import CommandResult
 from gui import SwitchApp
 
 results = []
 
-class DummyIOSwitcher:
-    def __init__(self, mac, device, type=1):
-        results.append(('init', mac, type))
-    async def turn_on(self):
-        results.append(('on',))
-        return True
-    async def turn_off(self):
-        results.append(('off',))
-        return True
-
-pyswitcherio.IOSwitcher = DummyIOSwitcher
+class DummyPool:
+    async def send(self, mac, channel, action, on_event=None):
+        results.append((action, mac, channel))
+        return CommandResult(True, mac, channel, action)
+    async def close(self):
+        pass
 
 root = tk.Tk()
 app = SwitchApp(root)
+app.core.pool = DummyPool()
 app.mac_var.set('00:11:22:33:44:55')
 # set device config to 2-gang so both switches visible
 app.type_var.set(2)
@@ -0,0 +1,40 @@
+import logging
+import threading
+
+from log_pipeline import QueueLogHandler, parse_levels
+
+levels = parse_levels({"bleak": "DEBUG", "connection_pool": "WARNING", "bogus": "NOPE"})
+assert levels["bleak"] == logging.DEBUG and "bogus" not in levels
+
+handler = QueueLogHandler({"connection_pool": "WARNING"}, maxsize=50)
+handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+assert handler.min_level == logging.INFO
+root = logging.getLogger()
+root.addHandler(handler)
+root.setLevel(logging.DEBUG)
+try:
+    # BLE debug noise and below-threshold app logs never reach the queue
+    logging.getLogger("bleak.backends.bluezdbus").debug("noise")
+    logging.getLogger("bleak").warning("adapter off")
+    logging.getLogger("connection_pool").info("quiet")
+    logging.getLogger("connection_pool").warning("retrying %d", 3)
+    logging.getLogger("connection_pool_x").info("not a child of connection_pool")
+    lines = handler.drain()
+    assert [line.text for line in lines] == ["adapter off", "retrying 3", "not a child of connection_pool"], lines
+    assert lines[1].message == "WARNING connection_pool: retrying 3"
+
+    # Many threads logging at once: nothing blocks, overflow is counted
+    def spam():
+        for i in range(100):
+            logging.getLogger("worker").info("line %d", i)
+
+    threads = [threading.Thread(target=spam) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert handler.queue.qsize() == 50 and handler.dropped == 350
+    assert len(handler.drain(limit=20)) == 20
+    assert len(handler.drain()) == 30 and handler.drain() == []
+finally:
+    root.removeHandler(handler)
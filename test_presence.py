@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from connection_pool import ConnectionPool
+from fake_transport import FakeTransport, LinkProfile
+from presence import PresenceMonitor, presence_settings
+
+A, B = "AA:BB:CC:DD:EE:01", "AA:BB:CC:DD:EE:02"
+
+assert presence_settings({}) is None and presence_settings({"presence": True}) == {}
+assert presence_settings({"presence": {"interval": "5", "prewarm": 0}}) == {"interval": 5.0, "prewarm": False}
+for bad in ({"presence": {"window": 0}}, {"presence": "yes"}):
+    try:
+        presence_settings(bad)
+        raise AssertionError(f"accepted {bad}")
+    except ValueError:
+        pass
+
+
+async def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    return predicate()
+
+
+async def main():
+    transport = FakeTransport([A, B], profile=LinkProfile(advertise=(0.01, 0.0), connect=(0.05, 0.0)))
+    transport.switchers[B].in_range = False
+    pool = ConnectionPool(transport=transport)
+    changes = []
+    monitor = PresenceMonitor(pool, lambda: [A, B], window=0.05, interval=0.05, away_after=0.3,
+                              scanner_factory=transport.scanner)
+    monitor.on_change = lambda mac, present: changes.append((mac, present))
+    pool.set_presence(monitor)
+    monitor.start()
+
+    # A is heard and connected to before anyone presses anything
+    assert await wait_for(lambda: pool.session(A).is_connected)
+    assert pool.cache.get(A).rssi == -60 and monitor.prewarms == 1
+    started = time.monotonic()
+    assert (await pool.send(A, 1, "on")).ok
+    assert time.monotonic() - started < 0.05 and transport.connects == 1
+
+    # B is never heard: nothing counts as away at first, then presses fail at once
+    assert monitor.is_away(B) is None
+    await asyncio.sleep(0.35)
+    started = time.monotonic()
+    result = await pool.send(B, 1, "on")
+    assert result.fast_failed and "보이지 않음" in result.error, result
+    assert time.monotonic() - started < 0.05
+    # A holds a link (and so stops advertising) but is not away
+    assert monitor.is_away(A) is None and (await pool.send(A, 1, "off")).ok
+
+    # B shows up: pre-connected, and the next press goes straight out
+    transport.switchers[B].in_range = True
+    assert await wait_for(lambda: pool.session(B).is_connected)
+    connects = transport.connects
+    assert (await pool.send(B, 1, "on")).ok and transport.connects == connects
+    assert transport.switchers[B].state[1] == "on"
+    assert (A, True) in changes and (B, True) in changes
+
+    # A held its link far longer than away_after without advertising: still present
+    assert (A, False) not in changes and monitor.is_away(A) is None
+
+    # A's link idles out: A advertises again, but is not reopened by it (no prewarm loop)
+    prewarms = monitor.prewarms
+    pool.set_idle_timeout(0.1)
+    assert (await pool.send(A, 2, "on")).ok
+    assert await wait_for(lambda: not pool.session(A).is_connected)
+    await asyncio.sleep(0.5)
+    assert not pool.session(A).is_connected and monitor.prewarms == prewarms
+    assert (A, False) not in changes
+    result = await pool.send(A, 2, "off")
+    assert result.ok and not result.fast_failed, result
+    pool.set_idle_timeout(300)
+
+    # Out of range again: marked away once away_after passes without sightings
+    await pool.session(B).disconnect()
+    transport.switchers[B].in_range = False
+    assert await wait_for(lambda: (B, False) in changes)
+    assert monitor.snapshot()[B]["present"] is False and monitor.scans > 5
+
+    await monitor.close()
+    assert not monitor.running
+    await pool.close()
+
+asyncio.run(main())
+print("presence ok")
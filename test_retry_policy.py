@@ -0,0 +1,81 @@
+import asyncio
+import random
+import time
+
+from connection_pool import ConnectionPool
+from fake_transport import FakeTransport, LinkProfile
+from retry_policy import CircuitBreaker, RetryPolicy
+
+MAC = "AA:BB:CC:DD:EE:01"
+
+# Exponential backoff, capped, with up to half of each delay jittered off
+policy = RetryPolicy(base_delay=0.5, multiplier=2.0, max_delay=3.0, jitter=0.5)
+rng = random.Random(1)
+for retry, full in enumerate([0.5, 1.0, 2.0, 3.0, 3.0]):
+    for _ in range(20):
+        assert full / 2 <= policy.delay(retry, rng) <= full
+assert RetryPolicy(jitter=0.0).delay(1) == 1.0
+
+assert RetryPolicy.from_config({}) == RetryPolicy()
+assert RetryPolicy.from_config({"retry": {"retries": "2", "attempt_timeout": 5, "unknown": 1}}) == \
+    RetryPolicy(retries=2, attempt_timeout=5.0)
+for bad in ({"retry": {"jitter": 2}}, {"retry": {"retries": -1}}, {"retry": [1]}):
+    try:
+        RetryPolicy.from_config(bad)
+        raise AssertionError(f"accepted {bad}")
+    except ValueError:
+        pass
+
+# Breaker: opens after the threshold, half-opens when a probe is due,
+# backs off after failed probes and closes on success
+now = [0.0]
+breaker = CircuitBreaker(RetryPolicy(breaker_threshold=2, breaker_reset=10, breaker_max_reset=25),
+                         clock=lambda: now[0])
+assert not breaker.record_failure() and breaker.state == "closed"
+assert breaker.record_failure() and breaker.state == "open" and not breaker.allow()
+now[0] = 10.0
+assert breaker.state == "half_open" and breaker.allow()
+breaker.record_failure()
+assert breaker.state == "open" and breaker.retry_in == 20.0
+now[0] = 30.0
+breaker.record_failure()
+assert breaker.retry_in == 25.0
+breaker.record_success()
+assert breaker.state == "closed" and breaker.failures == 0
+assert not CircuitBreaker(RetryPolicy(breaker_threshold=0)).record_failure()
+
+
+async def main():
+    # Out of range: two failed commands open the breaker, then presses fail at once
+    transport = FakeTransport([MAC], profile=LinkProfile(advertise=(0.01, 0.0)), time_scale=0.01)
+    switcher = transport.switchers[MAC]
+    switcher.in_range = False
+    pool = ConnectionPool(transport=transport, retry=RetryPolicy(
+        retries=1, base_delay=0, breaker_threshold=2, breaker_reset=0.3))
+    for _ in range(2):
+        result = await pool.send(MAC, 1, "on")
+        assert not result.ok and result.attempts == 2 and not result.fast_failed
+    assert pool.health()[MAC]["breaker"] == "open"
+    started = time.monotonic()
+    result = await pool.send(MAC, 1, "on")
+    assert result.fast_failed and result.attempts == 0 and time.monotonic() - started < 0.05, result
+    assert "응답 없음" in result.error
+
+    # Back in range: the background probe reconnects and closes the breaker
+    switcher.in_range = True
+    await asyncio.sleep(0.5)
+    assert pool.health()[MAC] == {"breaker": "closed", "failures": 0, "retry_in": 0.0, "connected": True}
+    assert (await pool.send(MAC, 1, "on")).ok
+    await pool.close()
+
+    # A hung connect is cut off by the per-attempt timeout
+    slow = FakeTransport([MAC], profile=LinkProfile(advertise=(0.0, 0.0), connect=(5.0, 0.0)))
+    pool = ConnectionPool(transport=slow, retry=RetryPolicy(retries=1, base_delay=0, attempt_timeout=0.1))
+    started = time.monotonic()
+    result = await pool.send(MAC, 1, "on")
+    assert not result.ok and result.attempts == 2 and "시간 초과" in result.error, result
+    assert time.monotonic() - started < 1.0
+    await pool.close()
+
+asyncio.run(main())
+print("retry policy ok")
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import time
+
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp()
+os.environ.pop('APPDATA', None)
+
+from fake_transport import FakeTransport, LinkProfile
+from retry_policy import RetryPolicy
+from scenes import Scene, SceneStep, load_scenes
+from switcher_core import SwitcherCore
+
+A, B = "AA:BB:CC:DD:EE:01", "AA:BB:CC:DD:EE:02"
+
+scene = Scene("bed", [SceneStep.parse("거실:1=on"), SceneStep.parse("거실:2=off"), SceneStep.parse("wait=0.2"),
+                      SceneStep.parse("거실:2=on"), SceneStep.parse("wait=0.1"), SceneStep.parse("안방=on")])
+assert [(round(offset, 3), [str(s) for s in steps]) for offset, steps in scene.batches()] == \
+    [(0.0, ["거실:1=on", "거실:2=off"]), (0.2, ["거실:2=on"]), (0.3, ["안방=on"])]
+assert Scene.from_dict(scene.to_dict()) == scene
+for bad in ("거실:1", "거실:1=dim", "wait=-1"):
+    try:
+        SceneStep.parse(bad)
+        raise AssertionError(f"accepted {bad}")
+    except ValueError:
+        pass
+assert list(load_scenes({"scenes": [scene.to_dict(), {"name": "empty", "steps": [{"wait": 1}]}]})) == ["bed"]
+
+config = {"devices": [{"name": "거실", "mac": A, "type": 2},
+                      {"name": "안방", "mac": B, "type": 1, "invert": True}],
+          "scenes": [scene.to_dict(),
+                     {"name": "broken", "steps": [{"target": "거실:1", "action": "off"},
+                                                  {"target": "안방", "action": "off"}, {"wait": 0.05},
+                                                  {"target": "거실:2", "action": "off"}], "rollback": True},
+                     {"name": "typo", "steps": [{"target": "거실:1", "action": "off"},
+                                                {"target": "부엌", "action": "on"}]}]}
+transport = FakeTransport([A, B], profile=LinkProfile(advertise=(0.05, 0.0), connect=(0.1, 0.0),
+                                                      write=(0.02, 0.0)))
+core = SwitcherCore(config, transport=transport).start()
+
+started = time.monotonic()
+result = core.loop.run(core.run_scene("bed"))
+elapsed = time.monotonic() - started
+assert result.ok and not result.failed, result
+assert [(s.device, s.channel, s.action) for s in result.steps] == \
+    [("거실", 1, "on"), ("거실", 2, "off"), ("거실", 2, "on"), ("안방", 1, "on")]
+# Both channels went out over one connection; 안방 was connected during the waits
+assert transport.connects == 2
+assert transport.switchers[A].writes == [(1, "on"), (2, "off"), (2, "on")]
+assert transport.switchers[B].state[1] == "off"  # inverted
+# Waits count from the start of the scene: the first batch's scan+connect
+# (~0.2 s) overlaps the 0.2 s wait instead of adding to it
+assert result.steps[2].late < 0.15 and result.steps[3].late < 0.15, result.to_dict()
+assert elapsed < 0.55, elapsed
+
+# A failing batch stops the scene and, with rollback, restores what it changed
+transport.switchers[B].in_range = False
+core.pool.set_retry_policy(RetryPolicy(retries=0, breaker_threshold=0))
+core.loop.run(core.pool.session(B).disconnect())
+result = core.loop.run(core.run_scene("broken"))
+assert not result.ok and result.rolled_back, result.to_dict()
+assert [(s.device, s.ran, s.ok) for s in result.steps] == [("거실", True, True), ("안방", True, False),
+                                                           ("거실", False, False)]
+assert transport.switchers[A].state == {1: "on", 2: "on"}
+assert core.state.get(A, 1) == "on"
+assert "실패: 안방 1" in result.summary()
+
+# Unknown targets: nothing is sent at all
+writes = transport.writes
+result = core.loop.run(core.run_scene("typo"))
+assert not result.ok and not any(s.ran for s in result.steps) and transport.writes == writes
+try:
+    core.loop.run(core.run_scene("nope"))
+    raise AssertionError("ran an unknown scene")
+except KeyError:
+    pass
+
+core.close()
+print("scenes ok")
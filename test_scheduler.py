@@ -0,0 +1,74 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from connection_pool import ConnectionPool
+from fake_transport import FakeTransport, LinkProfile
+from scheduler import CronSpec, ScheduleRule, Scheduler, load_rules
+
+# --- next-fire calculation -------------------------------------------------
+base = datetime(2026, 10, 16, 12, 0, 30)  # a Friday
+cron = CronSpec("*/15 6-9 * * 1-5")
+assert cron.next_after(base) == datetime(2026, 10, 19, 6, 0)  # Monday morning
+assert cron.next_after(datetime(2026, 10, 19, 6, 0)) == datetime(2026, 10, 19, 6, 15)
+assert CronSpec("0 0 1 * 0").next_after(base) == datetime(2026, 10, 18, 0, 0)  # dom OR dow
+assert CronSpec("30 8 29 2 *").next_after(base) == datetime(2028, 2, 29, 8, 30)
+
+daily = ScheduleRule("lamp", "거실", "off", time="23:00", days=["mon", "fri"])
+assert daily.next_fire(base) == datetime(2026, 10, 16, 23, 0)
+assert daily.next_fire(datetime(2026, 10, 16, 23, 0)) == datetime(2026, 10, 19, 23, 0)
+once = ScheduleRule("wake", "거실:1", "on", at="2026-10-17T07:30")
+assert once.next_fire(base) == datetime(2026, 10, 17, 7, 30) and once.next_fire(datetime(2026, 10, 18)) is None
+assert ScheduleRule.from_dict(daily.to_dict()) == daily
+
+rules = load_rules({"schedules": [daily.to_dict(), {"id": "bad", "target": "x", "action": "on"},
+                                  {"id": "bad2", "target": "x", "action": "on", "cron": "* * *"}]})
+assert [r.id for r in rules] == ["lamp"]
+
+# --- firing on the loop with pre-warming ---------------------------------------
+MAC = "AA:BB:CC:DD:EE:01"
+transport = FakeTransport([MAC], profile=LinkProfile(advertise=(0.2, 0.0), connect=(0.3, 0.0)))
+log = []
+
+
+async def main():
+    pool = ConnectionPool(transport=transport)
+    offset = [0.0]
+
+    async def fire(rule):
+        log.append(("fire", time.time(), transport.connects))
+        return (await pool.send(MAC, 1, rule.action)).ok
+
+    async def prewarm(rule):
+        log.append(("prewarm", time.time()))
+        await pool.warm(MAC)
+
+    sched = Scheduler(fire, prewarm, prewarm_lead=1.0, grace=5.0, clock=lambda: time.time() + offset[0])
+    sched.start()
+    at = datetime.now() + timedelta(seconds=1.6)
+    sched.add(ScheduleRule("soon", "x", "on", at=at.isoformat()))
+    await asyncio.sleep(2.2)
+    # The link was opened before the fire, so the write landed right away
+    kinds = [e[0] for e in log]
+    assert kinds == ["prewarm", "fire"], log
+    assert log[1][2] == 1, "connected during prewarm"
+    snap = sched.snapshot()[0]
+    assert snap["fired"] == 1 and snap["failed"] == 0 and snap["next_fire"] is None
+    assert snap["lateness"]["max"] < 0.1 and snap["landed"]["max"] < 0.15, snap
+    assert transport.switchers[MAC].state[1] == "on"
+
+    # A machine that slept through a fire records it as missed instead of firing late
+    sched.add(ScheduleRule("every", "x", "off", cron="* * * * *"))
+    offset[0] = 120.0
+    sched._poke()
+    await asyncio.sleep(0.2)
+    every = [s for s in sched.snapshot() if s["id"] == "every"][0]
+    assert every["missed"] == 1 and every["fired"] == 0, every
+    assert every["next_fire"] is not None
+
+    sched.remove("every")
+    assert [r.id for r in sched.rules] == ["soon"]
+    await sched.stop()
+    await pool.close()
+
+asyncio.run(main())
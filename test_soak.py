@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp()
+os.environ.pop('APPDATA', None)
+
+import soak
+from fake_transport import FakeTransport, LinkProfile
+
+
+def sample(t, commands=100, failures=0, rss=50.0, threads=5, handles=20, after=None, p50=40.0):
+    return soak.Sample(t, commands, failures, rss, threads, handles, after, p50, p50 * 2)
+
+
+limits = soak.Limits()
+steady = [sample(0, p50=300.0, rss=10.0), sample(60), sample(120, rss=52.0, p50=45.0), sample(180, threads=7)]
+# The warm-up sample (first connects, imports) is not the baseline
+assert soak.evaluate(steady, limits, warmup=60) == []
+assert len(soak.evaluate(steady, limits, warmup=0)) == 1
+leaky = steady + [sample(240, rss=90.0, threads=12, handles=80, after=150, p50=120.0, failures=5)]
+breaches = soak.evaluate(leaky, limits, warmup=60)
+assert [b.split()[0] for b in breaches] == ["RSS", "threads", "handles", "Tk", "latency", "5/100"], breaches
+assert soak.evaluate([], limits, 0) == ["no samples"]
+
+assert soak.rss_mb() > 1 and soak.thread_count() >= 1 and soak.handle_count() > 0
+
+# A short real run on simulated switchers: every sample filled in, nothing breached
+transport = FakeTransport(soak.SOAK_MACS, profile=LinkProfile(advertise=(0.05, 0.0), connect=(0.05, 0.0),
+                                                             write=(0.01, 0.0)))
+seen = []
+samples = soak.run_headless(duration=2.0, rate=20, sample_every=0.5, transport=transport, on_sample=seen.append)
+assert seen == samples and len(samples) >= 4
+last = samples[-1]
+assert last.commands >= 35 and last.failures == 0 and transport.connects == 2, last
+assert last.p50 > 0 and last.rss_mb and last.after_depth is None
+print(soak.HEADER)
+print("\n".join(soak.format_sample(s) for s in samples))
+assert soak.evaluate(samples, limits, warmup=0.5) == [] and last.skipped == 0 and last.backlog == 0
+
+# A rate beyond what the link can take: presses are skipped instead of piling up
+transport = FakeTransport(soak.SOAK_MACS, profile=LinkProfile(advertise=(0.05, 0.0), connect=(0.05, 0.0),
+                                                             write=(0.2, 0.0)))
+samples = soak.run_headless(duration=1.5, rate=40, sample_every=0.5, transport=transport)
+assert samples[-1].skipped > 20 and samples[-1].failures == 0, samples[-1]
+assert max(s.backlog for s in samples) <= 4 and samples[-1].backlog == 0
+print("soak ok")
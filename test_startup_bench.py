@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import startup_bench
+
+# Importing the GUI or building a core must not load the BLE stack
+probe = ("import sys, gui, switcher_core\n"
+         "core = switcher_core.SwitcherCore({'devices': []})\n"
+         "print(sorted(m for m in sys.modules if m.split('.')[0] in "
+         "('bleak', 'pyswitcherio', 'connection_pool', 'discovery')))")
+env = {**os.environ, "XDG_CONFIG_HOME": tempfile.mkdtemp()}
+out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True, env=env).stdout
+assert out.strip() == "[]", out
+
+report = startup_bench.run_all(runs=1, headless=True)
+print(startup_bench.format_report(report))
+for order, r in report["orders"].items():
+    assert r["failures"] == 0, order
+    assert r["imported"]["p50"] <= r["first_paint"]["p50"] <= r["first_command"]["p50"]
+    assert r["ble_ready"]["p50"] <= r["first_command"]["p50"]
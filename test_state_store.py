@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import time
+
+from state_store import StateStore
+
+path = os.path.join(tempfile.mkdtemp(), "state.json")
+store = StateStore(path, ttl=60)
+changes = []
+store.add_listener(lambda *c: changes.append(c))
+MAC = "aa:bb:cc:dd:ee:01"
+
+# Optimistic on press, confirmed on ack
+t1 = store.begin(MAC, 1, "on")
+assert store.get(MAC, 1) == "on" and store.is_pending(MAC, 1) and store.confirmed(MAC, 1) is None
+assert not store.is_redundant(MAC, 1, "on")
+store.confirm(MAC, 1, "on", t1)
+assert not store.is_pending(MAC, 1) and store.is_redundant(MAC, 1, "on")
+assert changes == [(MAC, 1, "on", True), (MAC, 1, "on", False)]
+# Saved after a short debounce on a background thread, never on the confirming one
+assert not os.path.exists(path)
+# Another process confirmed a channel meanwhile: it is kept
+with open(path, "w", encoding="utf-8") as f:
+    json.dump({"AA:BB:CC:DD:EE:09/1": "off"}, f)
+store.flush()
+with open(path, encoding="utf-8") as f:
+    assert json.load(f) == {"AA:BB:CC:DD:EE:01/1": "on", "AA:BB:CC:DD:EE:09/1": "off"}
+assert not [n for n in os.listdir(os.path.dirname(path)) if n.endswith(".tmp")]
+
+# Failure rolls the display back to the confirmed state
+t2 = store.begin(MAC, 1, "off")
+assert store.get(MAC, 1) == "off" and store.toggled(MAC, 1) == "on"
+store.rollback(MAC, 1, t2)
+assert store.get(MAC, 1) == "on" and not store.is_pending(MAC, 1)
+
+# Two quick toggles: the first ack must not clear the newer pending state,
+# and a stale rollback is ignored
+t3 = store.begin(MAC, 2, store.toggled(MAC, 2))
+t4 = store.begin(MAC, 2, store.toggled(MAC, 2))
+assert store.get(MAC, 2) == "off"
+store.confirm(MAC, 2, "on", t3)
+store.rollback(MAC, 2, t3)
+assert store.get(MAC, 2) == "off" and store.confirmed(MAC, 2) == "on" and store.is_pending(MAC, 2)
+store.confirm(MAC, 2, "off", t4)
+assert store.get(MAC, 2) == "off" and not store.is_pending(MAC, 2)
+
+# Reloaded states are shown but never trusted for skipping; neither are old ones
+store.flush()
+reloaded = StateStore(path, ttl=60)
+assert reloaded.get(MAC, 1) == "on" and not reloaded.is_redundant(MAC, 1, "on")
+store.ttl = 0.05
+time.sleep(0.06)
+assert not store.is_redundant(MAC, 1, "on")
+
+# Reported by the switch itself: a change nobody asked for is a press at the switch
+changes.clear()
+assert store.report(MAC, 1, "off") and store.get(MAC, 1) == "off"
+# ...shown, but not trusted to skip a write (the notification may have been misread)
+assert store.confirmed(MAC, 1) == "off" and not store.is_redundant(MAC, 1, "off")
+assert changes == [(MAC, 1, "off", False)]
+assert not store.report(MAC, 1, "off")
+# The echo of our own write while it is in flight is not
+t5 = store.begin(MAC, 1, "on")
+assert not store.report(MAC, 1, "on") and store.is_pending(MAC, 1)
+store.confirm(MAC, 1, "on", t5)
+assert changes == [(MAC, 1, "off", False), (MAC, 1, "on", True), (MAC, 1, "on", False)]
+
+# The debounced write goes out by itself, too
+store.confirm(MAC, 2, "on")
+deadline = time.monotonic() + 2
+while time.monotonic() < deadline:
+    with open(path, encoding="utf-8") as f:
+        if json.load(f).get("AA:BB:CC:DD:EE:01/2") == "on":
+            break
+    time.sleep(0.02)
+else:
+    raise AssertionError("state was never written")
+store.close()
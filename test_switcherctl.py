@@ -0,0 +1,128 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Point the config at a scratch directory before anything reads it
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp()
+os.environ.pop('APPDATA', None)
+
+import connection_pool
+from config_store import ConfigStore
+import switcher_core
+import switcherctl
+
+with open(switcher_core.get_user_config_path(), 'w', encoding='utf-8') as f:
+    json.dump({"devices": [
+        {"name": "living", "mac": "AA:BB:CC:DD:EE:01", "type": 2},
+        {"name": "bedroom", "mac": "AA:BB:CC:DD:EE:02", "type": 1, "invert": True},
+    ]}, f)
+
+writes = []
+connect_delay = 0.0
+
+
+class FakeScanner:
+    @staticmethod
+    async def find_device_by_address(mac, timeout=10.0):
+        return SimpleNamespace(name='SWITCHER_M', address=mac)
+
+
+class FakeClient:
+    def __init__(self, device, disconnected_callback=None):
+        self.device = device
+        self.is_connected = False
+
+    async def connect(self):
+        await asyncio.sleep(connect_delay)
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    async def write_gatt_char(self, uuid, data):
+        writes.append((self.device.address, data))
+
+
+connection_pool.BleakScanner = FakeScanner
+connection_pool.BleakClient = FakeClient
+
+assert switcherctl.main(['on', 'all']) == 0
+# living ch1 + ch2, bedroom ch1 inverted
+assert sorted(writes) == sorted([
+    ('AA:BB:CC:DD:EE:01', connection_pool.command_key(1, 'on')),
+    ('AA:BB:CC:DD:EE:01', connection_pool.command_key(2, 'on')),
+    ('AA:BB:CC:DD:EE:02', connection_pool.command_key(1, 'off')),
+]), writes
+
+writes.clear()
+assert switcherctl.main(['toggle', 'living:2']) == 0
+assert writes == [('AA:BB:CC:DD:EE:01', connection_pool.command_key(2, 'off'))], writes
+state = switcher_core.load_state()
+assert state.get('AA:BB:CC:DD:EE:01', 1) == 'on' and state.get('AA:BB:CC:DD:EE:01', 2) == 'off'
+
+# A fresh process doesn't trust state.json enough to skip; --force always writes
+writes.clear()
+assert switcherctl.main(['off', 'living:2']) == 0 and len(writes) == 1
+assert switcherctl.main(['off', 'living:2', '--force']) == 0 and len(writes) == 2
+
+# Giving up after --timeout is one line on stderr and a failure, not a traceback
+connect_delay = 5.0
+stderr = io.StringIO()
+with contextlib.redirect_stderr(stderr):
+    assert switcherctl.main(['on', 'living:1', '--timeout', '0.2']) == 1
+assert stderr.getvalue() == "Timed out after 0.2s\n", stderr.getvalue()
+connect_delay = 0.0
+
+assert switcherctl.main(['on', 'kitchen']) == 2
+assert switcherctl.main(['status']) == 0
+# In a fresh interpreter: whatever else this process imported does not count
+subprocess.run([sys.executable, '-c', "import switcherctl, sys; assert 'tkinter' not in sys.modules"],
+               check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+assert switcherctl.main(['schedule', 'add', 'lamp', 'living', 'off', '--time', '23:00', '--days', 'mon,fri']) == 0
+assert switcherctl.main(['schedule', 'add', 'pump', 'bedroom:1', 'on', '--cron', '*/15 6-9 * * 1-5']) == 0
+assert switcherctl.main(['schedule', 'add', 'bad', 'living', 'on', '--time', '25:00']) == 2
+# A misspelt device would never fire
+assert switcherctl.main(['schedule', 'add', 'typo', 'livng', 'on', '--time', '07:00']) == 2
+assert switcherctl.main(['schedule', 'add', 'typo', 'bedroom:2', 'on', '--time', '07:00']) == 2
+assert [r['id'] for r in switcher_core.load_config()['schedules']] == ['lamp', 'pump']
+assert switcherctl.main(['schedule', 'remove', 'pump']) == 0
+assert switcherctl.main(['schedule', 'remove', 'pump']) == 2
+assert switcherctl.main(['schedule', 'list']) == 0
+
+# Edits from the CLI survive a front end (GUI/daemon) that holds the config and saves later
+store = ConfigStore(switcher_core.get_user_config_path())
+core = switcher_core.SwitcherCore(store.snapshot()).start()
+store.watch(lambda cfg: core.loop.call_soon(core.apply_config, cfg), interval=0.05)
+assert switcherctl.main(['schedule', 'add', 'wake', 'bedroom', 'on', '--time', '07:00']) == 0
+deadline = time.monotonic() + 2
+while len(store.get('schedules') or []) < 2:
+    assert time.monotonic() < deadline
+    time.sleep(0.01)
+# What the GUI saves when a device is selected: everything but the schedules it was handed
+store.update({"selected": "bedroom", "devices": store.get("devices")})
+store.flush()
+assert [r['id'] for r in switcher_core.load_config()['schedules']] == ['lamp', 'wake']
+assert switcherctl.main(['schedule', 'remove', 'wake']) == 0
+core.close()
+store.close()
+config = switcher_core.load_config()
+assert config['schedules'] == [{'id': 'lamp', 'target': 'living', 'action': 'off', 'time': '23:00',
+                                'days': ['mon', 'fri']}] and len(config['devices']) == 2
+
+assert switcherctl.main(['scene', 'add', 'night', 'living:1=off', 'wait=0.5', 'bedroom=off', '--rollback']) == 0
+assert switcherctl.main(['scene', 'add', 'bad', 'living:1=dim']) == 2
+assert switcherctl.main(['scene', 'list']) == 0
+assert switcher_core.load_config()['scenes'] == [
+    {'name': 'night', 'steps': [{'target': 'living:1', 'action': 'off'}, {'wait': 0.5},
+                                {'target': 'bedroom', 'action': 'off'}], 'rollback': True}]
+assert switcherctl.main(['scene', 'run', 'nope']) == 2
+assert switcherctl.main(['scene', 'remove', 'night']) == 0 and 'scenes' in switcher_core.load_config()
+assert switcherctl.main(['scene', 'remove', 'night']) == 2
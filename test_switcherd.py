@@ -0,0 +1,190 @@
+import base64
+import json
+import os
+import socket
+import struct
+import tempfile
+import time
+import urllib.request
+
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp()
+os.environ.pop('APPDATA', None)
+
+from fake_transport import FakeTransport, LinkProfile
+from switcher_core import SwitcherCore
+from switcherd import ControlServer
+
+config = {"devices": [{"name": "거실", "mac": "AA:BB:CC:DD:EE:01", "type": 2},
+                      {"name": "안방", "mac": "AA:BB:CC:DD:EE:02", "type": 1, "invert": True}]}
+transport = FakeTransport(["AA:BB:CC:DD:EE:01", "AA:BB:CC:DD:EE:02"], 
+                          profile=LinkProfile(connect=(0.02, 0.0)))
+core = SwitcherCore(config, transport=transport).start()
+server = ControlServer(core, port=0)
+core.loop.run(server.start())
+base = f"http://127.0.0.1:{server.port}"
+
+
+def call(method, path, headers=None, url=None):
+    req = urllib.request.Request((url or base) + path, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+# WebSocket client: handshake, then expect a snapshot frame
+ws = socket.create_connection(("127.0.0.1", server.port), timeout=10)
+key = base64.b64encode(os.urandom(16)).decode()
+ws.sendall((f"GET /ws HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+buf = b""
+while b"\r\n\r\n" not in buf:
+    buf += ws.recv(1024)
+assert buf.startswith(b"HTTP/1.1 101"), buf
+rest = buf.split(b"\r\n\r\n", 1)[1]
+
+
+def read_frame():
+    global rest
+    while len(rest) < 2:
+        rest += ws.recv(4096)
+    n = rest[1] & 0x7F
+    off = 2
+    if n == 126:
+        while len(rest) < 4:
+            rest += ws.recv(4096)
+        n = struct.unpack(">H", rest[2:4])[0]
+        off = 4
+    while len(rest) < off + n:
+        rest += ws.recv(4096)
+    payload, rest = rest[off:off + n], rest[off + n:]
+    return json.loads(payload)
+
+
+assert read_frame()["type"] == "snapshot"
+
+status, body = call("POST", "/devices/%EA%B1%B0%EC%8B%A4/on?channel=2")
+assert status == 200 and body[0]["ok"] and body[0]["channel"] == 2, body
+assert transport.switchers["AA:BB:CC:DD:EE:01"].state == {1: "off", 2: "on"}
+
+# Pushed over the WebSocket: the optimistic state, progress events, then the confirmed state
+kinds = []
+states = []
+while True:
+    msg = read_frame()
+    if msg["type"] == "state":
+        states.append(msg)
+        if not msg["pending"]:
+            break
+    else:
+        kinds.append(msg["kind"])
+assert [(m["channel"], m["state"], m["pending"]) for m in states] == [(2, "on", True), (2, "on", False)], states
+assert "acknowledged" in kinds, kinds
+
+# Re-asserting a freshly confirmed state doesn't touch the radio
+writes = transport.writes
+status, body = call("POST", "/devices/%EA%B1%B0%EC%8B%A4/on?channel=2")
+assert body[0]["ok"] and body[0]["skipped"] and transport.writes == writes, body
+status, body = call("POST", "/devices/%EA%B1%B0%EC%8B%A4/on?channel=2&force=1")
+assert not body[0]["skipped"] and transport.writes == writes + 1, body
+
+status, body = call("POST", "/all/off")
+assert status == 200 and len(body) == 3 and all(r["ok"] for r in body), body
+# 안방 is inverted, so "off" is written as on
+assert transport.switchers["AA:BB:CC:DD:EE:02"].state[1] == "on"
+# Connections stayed warm across requests: one connect per device
+assert transport.connects == 2, transport.connects
+
+status, body = call("POST", "/devices/%EA%B1%B0%EC%8B%A4/toggle?channel=1")
+assert body[0]["action"] == "on"
+status, body = call("GET", "/devices")
+assert body[0]["state"] == {"1": "on", "2": "off"}, body
+assert call("GET", "/devices/nope")[0] == 404
+assert call("GET", "/devices/%EA%B1%B0%EC%8B%A4/on")[0] == 405
+
+# A config edited elsewhere is picked up without restarting the daemon
+core.loop.call_soon(core.apply_config, {**config, "devices": config["devices"][:1], "idle_timeout": 30,
+                                        "schedules": [{"id": "n", "target": "거실", "action": "off", "time": "23:00"}]})
+time.sleep(0.1)
+status, body = call("GET", "/devices")
+assert [d["name"] for d in body] == ["거실"] and core.pool.idle_timeout == 30
+assert [r["id"] for r in call("GET", "/schedules")[1]] == ["n"]
+
+# Presses at the switch itself are pushed too, and the battery level is served from the cache
+core.loop.call_soon(transport.switchers["AA:BB:CC:DD:EE:01"].press, 1)
+while True:
+    msg = read_frame()
+    if msg["type"] == "report" and msg["kind"] == "press":
+        break
+assert msg["device"] == "거실" and (msg["channel"], msg["state"]) == (1, "off"), msg
+assert call("GET", "/devices")[1][0]["health"]["battery"] == 100
+
+# Scenes run as one request; an unknown one is a 404
+core.loop.call_soon(core.apply_config, {**config, "scenes": [
+    {"name": "밤", "steps": [{"target": "거실:1", "action": "on"}, {"target": "안방", "action": "off"}]}]})
+time.sleep(0.1)
+assert call("GET", "/scenes")[1][0]["description"] == "거실:1=on, 안방=off"
+status, body = call("POST", "/scenes/%EB%B0%A4")
+assert status == 200 and body["ok"] and len(body["steps"]) == 2, body
+assert transport.switchers["AA:BB:CC:DD:EE:02"].state[1] == "on"
+assert call("POST", "/scenes/nope")[0] == 404
+
+# Pages on other sites cannot drive the daemon from the user's browser (CSRF / cross-site WebSocket)
+writes = transport.writes
+assert call("POST", "/all/on", {"Origin": "https://evil.example"})[0] == 403
+assert call("POST", "/all/on", {"Origin": "null"})[0] == 403
+assert transport.writes == writes
+assert call("GET", "/devices", {"Origin": f"http://localhost:{server.port}"})[0] == 200
+
+
+def raw(request: bytes) -> bytes:
+    sock = socket.create_connection(("127.0.0.1", server.port), timeout=10)
+    sock.sendall(request)
+    data = b""
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    sock.close()
+    return data
+
+
+upgrade = (f"GET /ws HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+           f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n")
+assert raw((upgrade + "Origin: https://evil.example\r\n\r\n").encode()).startswith(b"HTTP/1.1 403")
+
+# Bad or oversized bodies are refused instead of crashing the handler
+assert raw(b"POST /all/on HTTP/1.1\r\nContent-Length: abc\r\n\r\n").startswith(b"HTTP/1.1 400")
+assert raw(b"POST /all/on HTTP/1.1\r\nContent-Length: 99999999999\r\n\r\n").startswith(b"HTTP/1.1 413")
+
+# A WebSocket frame declaring more than MAX_WS_FRAME is closed with 1009 before it is read
+ws.sendall(bytes([0x81, 0x80 | 127]) + struct.pack(">Q", 1 << 40) + b"\0\0\0\0")
+while True:
+    while len(rest) < 2:
+        chunk = ws.recv(4096)
+        assert chunk, "closed without a close frame"
+        rest += chunk
+    opcode, n = rest[0] & 0x0F, rest[1] & 0x7F
+    if opcode == 0x8:
+        while len(rest) < 4:
+            rest += ws.recv(4096)
+        assert struct.unpack(">H", rest[2:4])[0] == 1009, rest
+        break
+    read_frame()
+ws.close()
+
+# With a token, every request must carry it (a header, or ?token= for browser WebSockets)
+secured = ControlServer(core, port=0, token="s3cret", allowed_origins=["https://home.example/"])
+core.loop.run(secured.start())
+other = f"http://127.0.0.1:{secured.port}"
+assert call("GET", "/devices", url=other)[0] == 401
+assert call("GET", "/devices", {"Authorization": "Bearer wrong"}, url=other)[0] == 401
+assert call("GET", "/devices", {"Authorization": "Bearer s3cret"}, url=other)[0] == 200
+assert call("GET", "/devices?token=s3cret", {"Origin": "https://home.example"}, url=other)[0] == 200
+core.loop.run(secured.stop())
+
+core.loop.run(server.stop())
+core.close()
+print("ok")
@@ -0,0 +1,56 @@
+import asyncio
+import json
+import os
+import tempfile
+
+from connection_pool import ConnectionPool
+from discovery import DeviceCache, stream_scan
+from fake_transport import FakeTransport, LinkProfile
+from retry_policy import RetryPolicy
+from telemetry import Telemetry, format_stats
+
+MAC = "AA:BB:CC:DD:EE:01"
+trace = os.path.join(tempfile.mkdtemp(), "trace.jsonl")
+telemetry = Telemetry(trace_path=trace)
+transport = FakeTransport([MAC], profile=LinkProfile(connect=(0.03, 0.0), write=(0.01, 0.0)))
+
+
+async def main():
+    pool = ConnectionPool(transport=transport, telemetry=telemetry, retry=RetryPolicy(retries=1, base_delay=0))
+    for action in ("on", "off", "on"):
+        assert (await pool.send(MAC, 1, action)).ok
+    # One failing write: a retry shows up in the device counters
+    transport.profile.write_failure_rate = 1.0
+    assert not (await pool.send(MAC, 2, "on")).ok
+    transport.profile.write_failure_rate = 0.0
+    await stream_scan(DeviceCache(), timeout=0.5, scanner_factory=transport.scanner, telemetry=telemetry)
+    await pool.close()
+
+asyncio.run(main())
+snap = telemetry.snapshot()
+phases = snap["phases"]
+# One scan + connect for the warm link, then only writes (plus the retry's reconnect)
+assert phases["scan"]["n"] == 1 and phases["connect"]["n"] == 2, phases
+assert phases["write"]["n"] == 5 and phases["command"]["n"] == 4
+assert phases["connect"]["p50"] >= 25
+assert phases["scan_first"]["n"] == 1 and phases["scan_stream"]["n"] == 1
+assert sum(phases["write"]["histogram"]) == 5
+assert snap["devices"][MAC] == {"ok": 3, "failed": 1, "retries": 1, "success_rate": 0.75}, snap["devices"]
+
+text = format_stats(snap, {MAC: "거실"})
+print(text)
+assert "거실" in text and "75%" in text
+
+telemetry.close()
+with open(trace, encoding="utf-8") as f:
+    lines = [json.loads(line) for line in f]
+spans = [line["span"] for line in lines]
+assert spans.count("command") == 4 and spans.count("write") == 5
+failed = [line for line in lines if line["span"] == "command" and not line["ok"]]
+assert len(failed) == 1 and failed[0]["mac"] == MAC and failed[0]["channel"] == 2
+
+# A disabled instance records nothing
+quiet = Telemetry(enabled=False)
+with quiet.span("connect", MAC):
+    pass
+assert quiet.snapshot() == {"phases": {}, "devices": {}}
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import threading
+
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp()
+os.environ.pop('APPDATA', None)
+
+from fake_transport import FakeTransport, LinkProfile
+from retry_policy import RetryPolicy
+from switcher_core import SwitcherCore
+from tray import Hotkey, HotkeyListener, load_hotkeys, run_hotkey
+
+A, B = "AA:BB:CC:DD:EE:01", "AA:BB:CC:DD:EE:02"
+
+assert Hotkey.parse("ctrl+alt+1", "거실:1 toggle") == Hotkey("ctrl+alt+1", target="거실:1", action="toggle")
+assert Hotkey.parse("f9", "scene 잘 자") == Hotkey("f9", scene="잘 자")
+assert str(Hotkey.parse("f8", "all off")) == "all off"
+hotkeys = load_hotkeys({"hotkeys": {"ctrl+alt+1": "거실:1 toggle", "ctrl+alt+0": "all off", "f1": "거실 dim",
+                                    "f9": "scene 밤"}})
+assert [h.keys for h in hotkeys] == ["ctrl+alt+1", "ctrl+alt+0", "f9"]
+
+
+class Backend:
+    """Stands in for the keyboard module: add_hotkey/remove_hotkey, and pressing from its own thread."""
+
+    def __init__(self):
+        self.hooks = {}
+
+    def add_hotkey(self, keys, callback, args=()):
+        if keys in self.hooks:
+            raise ValueError(f"{keys} already registered")
+        self.hooks[keys] = (callback, args)
+        return keys
+
+    def remove_hotkey(self, handle):
+        del self.hooks[handle]
+
+    def press(self, keys):
+        callback, args = self.hooks[keys]
+        thread = threading.Thread(target=callback, args=args)
+        thread.start()
+        thread.join()
+
+
+fired = []
+backend = Backend()
+listener = HotkeyListener(fired.append, backend)
+assert listener.set_hotkeys(hotkeys) and sorted(backend.hooks) == ["ctrl+alt+0", "ctrl+alt+1", "f9"]
+backend.press("ctrl+alt+1")
+assert fired == [hotkeys[0]]
+# Reapplying the same config does not re-register; a changed one does
+assert listener.set_hotkeys(load_hotkeys({"hotkeys": {"ctrl+alt+1": "거실:1 toggle", "ctrl+alt+0": "all off",
+                                                      "f9": "scene 밤"}}))
+assert listener.set_hotkeys(hotkeys[:1]) and list(backend.hooks) == ["ctrl+alt+1"]
+listener.stop()
+assert backend.hooks == {} and listener.active == []
+
+# Hotkeys go straight to the core, over the warm link
+config = {"devices": [{"name": "거실", "mac": A, "type": 2}, {"name": "안방", "mac": B, "type": 1}],
+          "scenes": [{"name": "밤", "steps": [{"target": "거실", "action": "off"}]}]}
+transport = FakeTransport([A, B], profile=LinkProfile(advertise=(0.01, 0.0), connect=(0.01, 0.0)))
+core = SwitcherCore(config, transport=transport).start()
+ok, text = core.loop.run(run_hotkey(core, hotkeys[0]))
+assert ok and text == "[ctrl+alt+1] 거실:1 toggle: 1/1 성공" and transport.switchers[A].state[1] == "on"
+ok, text = core.loop.run(run_hotkey(core, hotkeys[0]))
+assert ok and transport.switchers[A].state[1] == "off" and transport.connects == 1
+ok, text = core.loop.run(run_hotkey(core, Hotkey.parse("f2", "all on")))
+assert ok and text.endswith("3/3 성공"), text
+ok, text = core.loop.run(run_hotkey(core, hotkeys[2]))
+assert ok and text.startswith("장면 밤: 2/2 성공") and transport.switchers[A].state == {1: "off", 2: "off"}
+transport.switchers[B].in_range = False
+core.loop.run(core.pool.session(B).disconnect())
+core.pool.set_retry_policy(RetryPolicy(retries=0))
+ok, text = core.loop.run(run_hotkey(core, Hotkey.parse("f3", "안방 off")), timeout=30)
+assert not ok and text.endswith("(실패: 안방 1)"), text
+try:
+    core.loop.run(run_hotkey(core, Hotkey.parse("f4", "부엌 on")))
+    raise AssertionError("ran an unknown target")
+except KeyError:
+    pass
+core.close()
+print("tray ok")
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+from event_loop import LoopThread
+from ui_bridge import OperationBridge
+
+loop = LoopThread()
+loop.start()
+wakes = []
+woken = threading.Event()
+
+
+def wake():
+    wakes.append(threading.current_thread().name)
+    woken.set()
+
+
+bridge = OperationBridge(loop, wake)
+log = []
+
+
+async def command(name, post, delay):
+    post(f"{name} connected")
+    await asyncio.sleep(delay)
+    post(f"{name} written")
+    return name
+
+
+def wait_and_dispatch():
+    assert woken.wait(1.0)
+    woken.clear()
+    return bridge.dispatch()
+
+
+# Two overlapping operations: each one's events and result reach its own callbacks
+a = bridge.run(lambda post: command("a", post, 0.05), lambda f: log.append(("done a", f.result())),
+               on_event=lambda e: log.append(("a", e)), kind="command")
+b = bridge.run(lambda post: command("b", post, 0.15), lambda f: log.append(("done b", f.result())),
+               on_event=lambda e: log.append(("b", e)), kind="command")
+assert a != b and sorted(bridge.pending("command")) == [a, b]
+deadline = time.monotonic() + 2.0
+while bridge.pending() and time.monotonic() < deadline:
+    wait_and_dispatch()
+assert not bridge.pending()
+assert [e for e in log if e[0] == "a"] == [("a", "a connected"), ("a", "a written")], log
+assert [e for e in log if e[0] == "b"] == [("b", "b connected"), ("b", "b written")], log
+assert log.index(("done a", "a")) < log.index(("done b", "b"))
+# Woken from the BLE loop, and not once per message
+assert set(wakes) == {"ble-loop"} and len(wakes) < 8, wakes
+
+# Many messages before the UI gets round to it: a single wake
+wakes.clear()
+done = threading.Event()
+
+
+async def chatty(post):
+    for i in range(50):
+        post(i)
+    return "ok"
+
+
+seen = []
+bridge.run(chatty, lambda f: done.set(), on_event=seen.append)
+time.sleep(0.1)
+assert len(wakes) == 1 and bridge.wake_outstanding, wakes
+assert bridge.dispatch() == 51 and seen == list(range(50)) and done.is_set()
+# Nothing left for the GUI's frame fallback to pick up
+assert not bridge.wake_outstanding and bridge.dispatch() == 0
+
+# Failures and cancels still complete the operation once
+results = []
+
+
+async def boom(post):
+    raise RuntimeError("boom")
+
+
+bridge.run(boom, lambda f: results.append(type(f.exception()).__name__))
+op = bridge.run(lambda post: asyncio.sleep(10), lambda f: results.append("cancelled" if f.cancelled() else "?"))
+bridge.cancel(op)
+deadline = time.monotonic() + 2.0
+while len(results) < 2 and time.monotonic() < deadline:
+    time.sleep(0.02)
+    bridge.dispatch()
+assert sorted(results) == ["RuntimeError", "cancelled"], results
+assert not bridge.pending()
+
+loop.stop()
+print("ui bridge ok")
@@ -0,0 +1,215 @@
+"""Tray-resident mode and global hotkeys for the GUI (both optional).
+
+With "tray": true in config.json, closing the window hides it to the
+system tray instead of quitting: the BLE loop, warm links, scheduler and
+hotkeys keep running, and the tray menu brings the window back or quits.
+This needs pystray and Pillow; without them the window closes as before.
+
+"hotkeys" maps key combinations to commands that are sent straight into
+the command queue from any application, over the warm link if one is open:
+
+    "hotkeys": {"ctrl+alt+1": "거실:1 toggle", "ctrl+alt+0": "all off",
+                "ctrl+alt+s": "scene 취침"}
+
+This needs the keyboard package (on Linux it has to run as root);
+without it hotkeys are turned off with a warning.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+
+_LOGGER = logging.getLogger(__name__)
+
+ACTIONS = ("on", "off", "toggle")
+
+
+@dataclass(frozen=True)
+class Hotkey:
+    keys: str
+    # A target ("거실", "거실:1", a MAC or "all") and action, or a scene name
+    target: str = None
+    action: str = None
+    scene: str = None
+
+    @classmethod
+    def parse(cls, keys: str, command: str) -> "Hotkey":
+        """Parse "거실:1 toggle", "all off" or "scene 취침"."""
+        word, _, rest = command.strip().partition(" ")
+        if word == "scene" and rest.strip():
+            return cls(keys, scene=rest.strip())
+        target, _, action = command.strip().rpartition(" ")
+        if not target or action not in ACTIONS:
+            raise ValueError(f"{keys}: expected \"TARGET on|off|toggle\" or \"scene NAME\", not {command!r}")
+        return cls(keys, target=target.strip(), action=action)
+
+    def __str__(self):
+        return f"scene {self.scene}" if self.scene else f"{self.target} {self.action}"
+
+
+def load_hotkeys(config: dict) -> list:
+    """Hotkeys from config["hotkeys"]; invalid entries are logged and skipped."""
+    hotkeys = []
+    for keys, command in (config.get("hotkeys") or {}).items():
+        try:
+            hotkeys.append(Hotkey.parse(keys, str(command)))
+        except ValueError as e:
+            _LOGGER.warning("Ignoring hotkey: %s", e)
+    return hotkeys
+
+
+async def run_hotkey(core, hotkey: Hotkey):
+    """Run a hotkey's command on the core; returns (ok, status text). Raises KeyError for unknown targets."""
+    if hotkey.scene:
+        result = await core.run_scene(hotkey.scene)
+        return result.ok, result.summary()
+    if hotkey.target == "all":
+        targets = [(d, d.channels) for d in core.registry]
+    else:
+        targets = [core.resolve(hotkey.target)]
+    outcomes = await core.send_targets(targets, hotkey.action)
+    failed = [f"{d.name} {ch}" for d, ch, r in outcomes if isinstance(r, Exception) or not r.ok]
+    text = f"[{hotkey.keys}] {hotkey}: {len(outcomes) - len(failed)}/{len(outcomes)} 성공"
+    if failed:
+        text += f" (실패: {', '.join(failed)})"
+    return not failed, text
+
+
+class HotkeyListener:
+    """Registers hotkeys with a backend (the keyboard module by default); fire(hotkey) runs on its thread."""
+
+    def __init__(self, fire, backend=None):
+        self.fire = fire
+        self._backend = backend
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def _keyboard(self):
+        if self._backend is None:
+            try:
+                import keyboard
+            except ImportError:
+                _LOGGER.warning("Hotkeys need the keyboard package (pip install keyboard)")
+                self._backend = False
+            else:
+                self._backend = keyboard
+        return self._backend
+
+    @property
+    def active(self) -> list:
+        with self._lock:
+            return [hotkey for hotkey, _ in self._handles]
+
+    def set_hotkeys(self, hotkeys: list) -> bool:
+        """Replace the registered hotkeys; False if they cannot be registered at all."""
+        if hotkeys == self.active:
+            return True
+        self.stop()
+        if not hotkeys:
+            return True
+        keyboard = self._keyboard()
+        if not keyboard:
+            return False
+        with self._lock:
+            for hotkey in hotkeys:
+                try:
+                    handle = keyboard.add_hotkey(hotkey.keys, self._fire, args=(hotkey,))
+                except Exception as e:
+                    # Bad combination, or no permission to hook the keyboard
+                    _LOGGER.warning("Cannot register hotkey %s: %s", hotkey.keys, e)
+                    continue
+                self._handles.append((hotkey, handle))
+        return True
+
+    def _fire(self, hotkey: Hotkey):
+        try:
+            self.fire(hotkey)
+        except Exception:
+            _LOGGER.exception("Hotkey %s failed", hotkey.keys)
+
+    def stop(self):
+        with self._lock:
+            handles, self._handles = self._handles, []
+        for _, handle in handles:
+            try:
+                self._backend.remove_hotkey(handle)
+            except Exception as e:
+                _LOGGER.debug("Cannot remove hotkey: %s", e)
+
+
+def _no_args(fn):
+    return lambda: fn()
+
+
+def tray_supported() -> bool:
+    try:
+        import pystray  # noqa: F401
+        from PIL import Image  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TrayIcon:
+    """A pystray icon on its own thread. Menu callbacks run there too, so callers marshal them to Tk.
+
+    items() returns the current [(label, fn)] shown between "열기" and "종료".
+    """
+
+    def __init__(self, title: str, icon_path: str, on_show, on_quit, items=None):
+        self.title = title
+        self.icon_path = icon_path
+        self.on_show = on_show
+        self.on_quit = on_quit
+        self.items = items or (lambda: [])
+        self._icon = None
+
+    @property
+    def running(self) -> bool:
+        return self._icon is not None
+
+    def start(self) -> bool:
+        if self._icon is not None:
+            return True
+        try:
+            import pystray
+            from PIL import Image
+        except ImportError:
+            _LOGGER.warning("Tray mode needs pystray and Pillow (pip install pystray pillow)")
+            return False
+
+        def menu():
+            yield pystray.MenuItem("열기", lambda: self.on_show(), default=True)
+            yield pystray.Menu.SEPARATOR
+            for label, fn in self.items():
+                # pystray passes (icon, item) to actions taking arguments; these take none
+                yield pystray.MenuItem(label, _no_args(fn))
+            yield pystray.Menu.SEPARATOR
+            yield pystray.MenuItem("종료", lambda: self.on_quit())
+
+        try:
+            image = Image.open(self.icon_path)
+            self._icon = pystray.Icon("io-switcher-local", image, self.title, pystray.Menu(menu))
+            # Own thread on every platform; macOS would need the main thread (not supported)
+            threading.Thread(target=self._icon.run, name="tray", daemon=True).start()
+        except Exception as e:
+            _LOGGER.warning("Cannot show the tray icon: %s", e)
+            self._icon = None
+            return False
+        return True
+
+    def refresh(self):
+        """Rebuild the menu (after scenes changed)."""
+        if self._icon is not None:
+            self._icon.update_menu()
+
+    def notify(self, text: str):
+        if self._icon is not None and getattr(self._icon, "HAS_NOTIFICATION", False):
+            try:
+                self._icon.notify(text, self.title)
+            except Exception as e:
+                _LOGGER.debug("Tray notification failed: %s", e)
+
+    def stop(self):
+        icon, self._icon = self._icon, None
+        if icon is not None:
+            icon.stop()
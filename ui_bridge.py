@@ -0,0 +1,146 @@
+"""Delivering BLE operation results to the UI thread without polling.
+
+The UI submits coroutines to the shared loop (event_loop.LoopThread) through
+OperationBridge.run(). Each operation gets an ID and its own callbacks, so
+overlapping operations (commands to different switchers, a scan) never share
+a slot. When an operation reports progress or finishes, the loop thread
+drops a message in the bridge's inbox and calls wake() once; further
+messages ride along until the UI thread calls dispatch(), which runs the
+callbacks there.
+
+TkWaker is the wake() for Tk: a small helper thread generates a virtual
+event on the root window, so the BLE loop never blocks on Tk. If the event
+cannot be sent (Tcl built without threads, or no mainloop running, e.g.
+tests driving root.update()), the GUI's frame pump dispatches a wake that
+is still outstanding.
+"""
+import itertools
+import logging
+import queue
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+WAKE_EVENT = "<<OperationsReady>>"
+
+
+class Operation:
+    __slots__ = ("id", "kind", "on_done", "on_event", "future")
+
+    def __init__(self, op_id: int, kind: str, on_done, on_event):
+        self.id = op_id
+        self.kind = kind
+        self.on_done = on_done
+        self.on_event = on_event
+        self.future = None
+
+
+class OperationBridge:
+    """Runs coroutines on a LoopThread; callbacks run wherever dispatch() is called."""
+
+    def __init__(self, loop, wake):
+        self.loop = loop
+        self.wake = wake
+        self._ids = itertools.count(1)
+        self._ops = {}
+        self._inbox = queue.SimpleQueue()
+        self._wake_requested = False
+
+    def run(self, make_coro, on_done, on_event=None, kind: str = "") -> int:
+        """Start make_coro(post) on the loop and return the operation ID.
+
+        post(event) may be called from the loop thread to report progress;
+        each event reaches on_event(event). on_done(future) is called once
+        with the finished concurrent future. May be called from any thread
+        (e.g. a global hotkey); the callbacks still run in dispatch().
+        """
+        op = Operation(next(self._ids), kind, on_done, on_event)
+        self._ops[op.id] = op
+        op.future = self.loop.submit(make_coro(lambda event, op_id=op.id: self._post(op_id, False, event)))
+        op.future.add_done_callback(lambda fut, op_id=op.id: self._post(op_id, True, fut))
+        return op.id
+
+    def _post(self, op_id: int, done: bool, payload):
+        # Any thread; wakes the UI once per batch
+        self._inbox.put((op_id, done, payload))
+        if not self._wake_requested:
+            self._wake_requested = True
+            try:
+                self.wake()
+            except Exception:
+                _LOGGER.exception("UI wake failed")
+
+    def dispatch(self) -> int:
+        """Run the callbacks for everything reported so far (UI thread). Returns how many."""
+        self._wake_requested = False
+        handled = 0
+        while True:
+            try:
+                op_id, done, payload = self._inbox.get_nowait()
+            except queue.Empty:
+                return handled
+            handled += 1
+            op = self._ops.get(op_id)
+            if op is None:
+                continue
+            try:
+                if done:
+                    del self._ops[op_id]
+                    op.on_done(payload)
+                elif op.on_event is not None:
+                    op.on_event(payload)
+            except Exception:
+                _LOGGER.exception("Callback for operation %d (%s) failed", op_id, op.kind)
+
+    @property
+    def wake_outstanding(self) -> bool:
+        """True while results have been posted and wake() called, but dispatch() has not run since."""
+        return self._wake_requested
+
+    def pending(self, kind: str = None) -> list:
+        return [op_id for op_id, op in self._ops.items() if kind is None or op.kind == kind]
+
+    def cancel(self, op_id: int):
+        """Cancel the coroutine; on_done still runs (with a cancelled future)."""
+        op = self._ops.get(op_id)
+        if op is not None and op.future is not None:
+            op.future.cancel()
+
+
+class TkWaker:
+    """Thread-safe, non-blocking wake() that makes root handle sequence on the Tk thread."""
+
+    def __init__(self, root, handler, sequence: str = WAKE_EVENT):
+        self.root = root
+        self.sequence = sequence
+        root.bind(sequence, lambda _event: handler())
+        self._cond = threading.Condition()
+        self._requested = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="tk-waker", daemon=True)
+        self._thread.start()
+
+    def __call__(self):
+        with self._cond:
+            self._requested = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._requested and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                self._requested = False
+            try:
+                # Marshalled to the Tk thread by _tkinter; only this helper waits for it
+                self.root.event_generate(self.sequence, when="tail")
+            except Exception:
+                # No threaded Tcl / no mainloop: the frame pump dispatches instead
+                pass
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()